@@ -0,0 +1,226 @@
+import math
+from fractions import Fraction
+
+BASIC_STATS = ("count", "sum", "mean", "min", "max", "variance", "stdev")
+OVERALL = None
+
+
+def parse_quantile(stat: str) -> float | None:
+    if stat == "median":
+        return 0.5
+    if stat.startswith("p"):
+        try:
+            q = float(stat[1:]) / 100
+        except ValueError:
+            return None
+        if 0 <= q <= 1:
+            return q
+    return None
+
+
+def validate_stats(stats) -> tuple[str, ...]:
+    stats = tuple(stats)
+    for stat in stats:
+        if stat not in BASIC_STATS and parse_quantile(stat) is None:
+            raise ValueError(f"Unknown statistic: {stat}")
+    return stats
+
+
+def to_number(value) -> float | int | None:
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return None
+
+
+def quantile_of_sorted(values: list, q: float) -> float | int | None:
+    n = len(values)
+    if n == 0:
+        return None
+    if q == 0.5:
+        # same definition as statistics.median
+        mid = n // 2
+        return values[mid] if n % 2 else (values[mid - 1] + values[mid]) / 2
+    position = q * (n - 1)
+    lower = math.floor(position)
+    upper = min(lower + 1, n - 1)
+    fraction = position - lower
+    if fraction == 0:
+        return values[lower]
+    return values[lower] + (values[upper] - values[lower]) * fraction
+
+
+def exact_mean(values: list, count: int | None = None, ints: bool | None = None) -> float | int | None:
+    # the correctly rounded mean (like statistics.mean) of a list of values, or of count values whose exact sum the
+    # list holds (Accumulator's partials). Summed at C speed: each math.fsum is the correctly rounded rest of the exact
+    # sum, so the parts add up to it exactly after a few passes. An int mean stays int; ints=None checks the values
+    count = len(values) if count is None else count
+    if not count:
+        return None
+    if ints is None:
+        ints = all(isinstance(value, int) for value in values)
+    if ints:
+        mean = Fraction(sum(values), count)
+        return int(mean) if mean.denominator == 1 else float(mean)
+    parts: list[float] = []
+    while True:
+        try:
+            part = math.fsum(values + [-p for p in parts])
+        except ValueError:
+            # inf and -inf
+            return math.nan
+        if not math.isfinite(part):
+            return part / count
+        if part == 0:
+            break
+        parts.append(part)
+    return float(sum(map(Fraction, parts), Fraction(0)) / count)
+
+
+class Accumulator:
+    __slots__ = ("count", "partials", "special", "all_ints", "running_mean", "m2", "min", "max", "values")
+
+    def __init__(self, keep_values: bool = False):
+        self.count = 0
+        self.partials: list[float] = []
+        # inf / nan values are summed here instead: they would turn the partials into nan
+        self.special = 0.0
+        self.all_ints = True
+        self.running_mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+        self.values = [] if keep_values else None
+
+    def add(self, value: float | int) -> None:
+        self.count += 1
+        if self.all_ints and not isinstance(value, int):
+            self.all_ints = False
+        # Shewchuk partials keep the running sum exact, so sum and mean round exactly like math.fsum / statistics.mean
+        if value - value:
+            self.special += value
+        else:
+            x = value
+            i = 0
+            for y in self.partials:
+                if abs(x) < abs(y):
+                    x, y = y, x
+                hi = x + y
+                lo = y - (hi - x)
+                if lo:
+                    self.partials[i] = lo
+                    i += 1
+                x = hi
+            self.partials[i:] = [x]
+        # Welford update for the variance
+        delta = value - self.running_mean
+        self.running_mean += delta / self.count
+        self.m2 += delta * (value - self.running_mean)
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        if self.values is not None:
+            self.values.append(value)
+
+    def exact_mean(self) -> float | int | None:
+        return exact_mean(self.sum_parts(), self.count, self.all_ints)
+
+    def sum_parts(self) -> list[float]:
+        # values with the same exact sum as everything added
+        return self.partials + [self.special] if self.special else self.partials
+
+    def result(self, stats: tuple[str, ...]) -> tuple:
+        sorted_values = None
+        out = []
+        for stat in stats:
+            if stat == "count":
+                out.append(self.count)
+            elif stat == "sum":
+                out.append(math.fsum(self.sum_parts()))
+            elif stat == "mean":
+                out.append(self.exact_mean())
+            elif stat == "min":
+                out.append(self.min)
+            elif stat == "max":
+                out.append(self.max)
+            elif stat == "variance":
+                out.append(self.m2 / (self.count - 1) if self.count > 1 else None)
+            elif stat == "stdev":
+                out.append(math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else None)
+            else:
+                if sorted_values is None:
+                    sorted_values = sorted(self.values)
+                out.append(quantile_of_sorted(sorted_values, parse_quantile(stat)))
+        return tuple(out)
+
+
+class AggregateTable:
+    def __init__(self, keys: tuple[str, ...], stats: tuple[str, ...], rows: dict):
+        self.keys = keys
+        self.stats = stats
+        # rows[group][key] is a tuple of values aligned with self.stats
+        self.rows = rows
+        self._stat_index = {stat: i for i, stat in enumerate(stats)}
+
+    def get(self, group, key: str, stat: str):
+        values = self.rows.get(group, {}).get(key)
+        if values is None:
+            return None
+        return values[self._stat_index[stat]]
+
+    def column(self, key: str, stat: str) -> dict:
+        return {group: self.get(group, key, stat) for group in self.rows if group is not OVERALL}
+
+    def groups(self) -> list:
+        return [group for group in self.rows if group is not OVERALL]
+
+    def to_dict(self) -> dict:
+        return {
+            group: {key: dict(zip(self.stats, values)) for key, values in by_key.items()}
+            for group, by_key in self.rows.items()
+        }
+
+
+def aggregate_entries(entries, keys, stats, group_key: str | None = "sensor_id",
+                      include_overall: bool = False, groups=None) -> AggregateTable:
+    keys = tuple(keys)
+    stats = validate_stats(stats)
+    keep_values = any(parse_quantile(stat) is not None for stat in stats)
+
+    accumulators: dict = {}
+    for group in groups or ():
+        accumulators[group] = {key: Accumulator(keep_values) for key in keys}
+    overall = {key: Accumulator(keep_values) for key in keys} if include_overall else None
+
+    for entry in entries:
+        group_accumulators = None
+        if group_key is not None:
+            group = entry.get(group_key)
+            if group:
+                group_accumulators = accumulators.get(group)
+                if group_accumulators is None:
+                    group_accumulators = {key: Accumulator(keep_values) for key in keys}
+                    accumulators[group] = group_accumulators
+        for key in keys:
+            if key not in entry:
+                continue
+            value = to_number(entry[key])
+            if value is None:
+                continue
+            if group_accumulators is not None:
+                group_accumulators[key].add(value)
+            if overall is not None:
+                overall[key].add(value)
+
+    rows = {
+        group: {key: accumulator.result(stats) for key, accumulator in by_key.items()}
+        for group, by_key in accumulators.items()
+    }
+    if overall is not None:
+        rows[OVERALL] = {key: accumulator.result(stats) for key, accumulator in overall.items()}
+    return AggregateTable(keys, stats, rows)
@@ -0,0 +1,112 @@
+from columnar_store import ColumnarStore, jump_violation_rows, np, range_violation_rows, require_numpy
+
+RULE_OUT_OF_RANGE = 0
+RULE_SUDDEN_CHANGE = 1
+RULE_NAMES = ("OUT_OF_RANGE", "SUDDEN_CHANGE")
+
+
+class IssueTable:
+    # one row per issue, stored as parallel arrays; sensor and key are codes into sensor_ids / keys
+    def __init__(self, sensor_ids: list[str], keys: list[str], sensor, rule, key, row, value, previous_value, limit):
+        self.sensor_ids = sensor_ids
+        self.keys = keys
+        self.sensor = sensor
+        self.rule = rule
+        self.key = key
+        self.row = row
+        self.value = value
+        self.previous_value = previous_value
+        self.limit = limit
+
+    def __len__(self) -> int:
+        return len(self.row)
+
+    def select(self, mask) -> "IssueTable":
+        return IssueTable(self.sensor_ids, self.keys, self.sensor[mask], self.rule[mask], self.key[mask],
+                          self.row[mask], self.value[mask], self.previous_value[mask], self.limit[mask])
+
+    def for_sensor(self, sensor_id: str) -> "IssueTable":
+        if sensor_id not in self.sensor_ids:
+            return self.select(np.zeros(len(self), dtype=bool))
+        return self.select(self.sensor == self.sensor_ids.index(sensor_id))
+
+    def for_rule(self, rule: int) -> "IssueTable":
+        return self.select(self.rule == rule)
+
+    def counts(self) -> dict[str, dict[str, int]]:
+        counts = {sensor_id: {name: 0 for name in RULE_NAMES} for sensor_id in self.sensor_ids}
+        for sensor_code, rule in zip(self.sensor.tolist(), self.rule.tolist()):
+            counts[self.sensor_ids[sensor_code]][RULE_NAMES[rule]] += 1
+        return counts
+
+    def rows_by_sensor(self, rule: int) -> dict[str, "np.ndarray"]:
+        table = self.for_rule(rule)
+        return {sensor_id: np.unique(table.row[table.sensor == code]) for code, sensor_id in enumerate(self.sensor_ids)}
+
+    def to_issue_dicts(self, entries_by_sensor: dict[str, list[dict]], valid_ranges: dict, valid_jumps: dict) -> list[dict]:
+        # builds the same dicts, in the same order, as out_of_range_detection / sudden_change_detection
+        issues = []
+        jump_order = {key: i for i, key in enumerate(valid_jumps)}
+        for code, sensor_id in enumerate(self.sensor_ids):
+            entries = entries_by_sensor.get(sensor_id, [])
+            table = self.select(self.sensor == code)
+            hits = list(zip(table.rule.tolist(), table.row.tolist(), table.key.tolist(), table.value.tolist(),
+                            table.previous_value.tolist(), table.limit.tolist()))
+
+            range_hits = [hit for hit in hits if hit[0] == RULE_OUT_OF_RANGE]
+            range_hits.sort(key=lambda hit: (hit[1], list(entries[hit[1]]).index(self.keys[hit[2]])))
+            for _, row, key_code, value, _, _ in range_hits:
+                key = self.keys[key_code]
+                issues.append({"entry": entries[row], "key": key, "value": value, "valid_range": valid_ranges[key]})
+
+            jump_hits = [hit for hit in hits if hit[0] == RULE_SUDDEN_CHANGE]
+            jump_hits.sort(key=lambda hit: (hit[1], jump_order[self.keys[hit[2]]]))
+            for _, row, key_code, value, previous_value, _ in jump_hits:
+                key = self.keys[key_code]
+                issues.append({"entry": entries[row], "key": key, "value": value, "previous_value": previous_value,
+                               "max_jump": valid_jumps[key]})
+        return issues
+
+
+def detect_anomalies(store: ColumnarStore, valid_ranges: dict, valid_jumps: dict,
+                     sensor_ids: list[str] | None = None, rules=(RULE_OUT_OF_RANGE, RULE_SUDDEN_CHANGE)) -> IssueTable:
+    require_numpy()
+    sensor_ids = list(store.sensors) if sensor_ids is None else [s for s in sensor_ids if s in store.sensors]
+    keys = list(dict.fromkeys(list(valid_ranges) + list(valid_jumps)))
+    key_codes = {key: i for i, key in enumerate(keys)}
+
+    parts = []
+    for sensor_code, sensor_id in enumerate(sensor_ids):
+        sensor_columns = store.sensors[sensor_id]
+        if RULE_OUT_OF_RANGE in rules:
+            for key, (min_value, max_value) in valid_ranges.items():
+                rows = range_violation_rows(sensor_columns, key, min_value, max_value)
+                if len(rows):
+                    values = sensor_columns.values(key)[rows].astype(np.float64)
+                    parts.append((sensor_code, RULE_OUT_OF_RANGE, key_codes[key], rows, values,
+                                  np.full(len(rows), np.nan), np.full(len(rows), np.nan)))
+        if RULE_SUDDEN_CHANGE in rules:
+            for key, max_jump in valid_jumps.items():
+                rows = jump_violation_rows(sensor_columns, key, max_jump)
+                if len(rows):
+                    values = sensor_columns.values(key).astype(np.float64)
+                    parts.append((sensor_code, RULE_SUDDEN_CHANGE, key_codes[key], rows, values[rows],
+                                  values[rows - 1], np.full(len(rows), float(max_jump))))
+
+    if not parts:
+        empty_int = np.zeros(0, dtype=np.int64)
+        empty_float = np.zeros(0, dtype=np.float64)
+        return IssueTable(sensor_ids, keys, empty_int, empty_int.astype(np.int8), empty_int, empty_int,
+                          empty_float, empty_float, empty_float)
+
+    return IssueTable(
+        sensor_ids,
+        keys,
+        np.concatenate([np.full(len(p[3]), p[0], dtype=np.int64) for p in parts]),
+        np.concatenate([np.full(len(p[3]), p[1], dtype=np.int8) for p in parts]),
+        np.concatenate([np.full(len(p[3]), p[2], dtype=np.int64) for p in parts]),
+        np.concatenate([p[3] for p in parts]),
+        np.concatenate([p[4] for p in parts]),
+        np.concatenate([p[5] for p in parts]),
+        np.concatenate([p[6] for p in parts]),
+    )
@@ -0,0 +1,351 @@
+import argparse
+import io
+import json
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from fractions import Fraction
+
+import json_codec
+from aggregation import to_number
+from binary_records import BinaryRecordFile
+from rollups import Bucket
+from segment_store import codec_for_path, list_segments, open_segment_reader
+from sqlite_store import SqliteRecordStore
+from telemetry_analyzer import (DEFAULT_AGGREGATE_KEYS, EXPECTED_MESSAGE_INTERVAL_SECONDS, TOLERANCE_MESSAGE_INTERVAL,
+                                VALID_CHANGES_JUMPS, VALID_RANGES)
+
+DEFAULT_CHUNK_BYTES = 8 * 1024 * 1024
+# shards are assumed to overlap in time by less than this (late or reordered records at a file/chunk boundary)
+DEFAULT_BOUNDARY_WINDOW_SEC = 60.0
+REPORT_STATS = ("count", "mean", "min", "max", "stdev", "median", "first", "last")
+# exact, from the merged value counts: the rollup buckets only hold a quantile sketch and a plain float sum, which
+# would make the mean depend on the chunk size
+EXACT_STATS = ("mean", "median")
+
+
+def plan_shards(paths: list[str], chunk_bytes: int = DEFAULT_CHUNK_BYTES) -> list[tuple]:
+    # (kind, path, start, end): plain jsonl is cut into byte ranges, segment directories into their files;
+    # compressed segments (up to their committed size, end), binary files and SQLite databases are read whole
+    shards = []
+    for path in paths:
+        if os.path.isdir(path):
+            for segment_path, info in list_segments(path):
+                if codec_for_path(segment_path).extension:
+                    shards.append(("compressed", segment_path, 0, info.get("size") or 0))
+                else:
+                    shards.extend(plan_shards([segment_path], chunk_bytes))
+        elif path.endswith(".bin"):
+            shards.append(("binary", path, 0, 0))
+        elif path.endswith(".db"):
+            shards.append(("sqlite", path, 0, 0))
+        elif codec_for_path(path).extension:
+            shards.append(("compressed", path, 0, 0))
+        else:
+            size = os.path.getsize(path)
+            for start in range(0, max(size, 1), chunk_bytes):
+                shards.append(("jsonl", path, start, min(start + chunk_bytes, size)))
+    return shards
+
+
+def read_shard_lines(kind: str, path: str, start: int, end: int):
+    if kind == "compressed":
+        with open(path, "rb") as file, open_segment_reader(path, file, end or None) as reader:
+            yield from io.TextIOWrapper(reader)
+        return
+    with open(path, "rb") as file:
+        if start > 0:
+            # a line belongs to the shard it starts in: skip the tail of the previous shard's last line
+            file.seek(start - 1)
+            file.readline()
+        while file.tell() < end:
+            line = file.readline()
+            if not line:
+                break
+            yield line
+
+
+def load_shard(shard: tuple) -> tuple[list[dict], int]:
+    kind, path, start, end = shard
+    if kind == "binary":
+        with BinaryRecordFile(path) as records:
+            return records.read_entries(), 0
+    if kind == "sqlite":
+        with SqliteRecordStore(path) as store:
+            return store.read_entries(store.selection()), 0
+    entries = []
+    bad_lines = 0
+    for line in read_shard_lines(kind, path, start, end):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            entry = json_codec.loads(line)
+        except json_codec.DecodeError:
+            bad_lines += 1
+            continue
+        if isinstance(entry, dict):
+            entries.append(entry)
+    return entries, bad_lines
+
+
+def check_pair(sensor_id: str, previous: tuple, current: tuple, options: dict, issues: dict) -> None:
+    # previous/current: (received_at or None, sort key, jump values); same rules as sudden_change_detection and
+    # detect_missing_messages on neighbouring records
+    previous_ts, _, previous_values = previous
+    current_ts, _, current_values = current
+    for key, max_jump in options["jumps"].items():
+        if key in current_values and key in previous_values:
+            if abs(current_values[key] - previous_values[key]) > max_jump:
+                issues["sudden_change"].append({"sensor_id": sensor_id, "received_at": current_ts, "key": key,
+                                                "value": current_values[key], "previous_value": previous_values[key],
+                                                "max_jump": max_jump})
+    if previous_ts is not None and current_ts is not None:
+        delta = current_ts - previous_ts
+        if delta > options["expected_interval_sec"] * options["tolerance"]:
+            issues["gaps"].append({"sensor_id": sensor_id, "received_at": current_ts, "previous_received_at": previous_ts,
+                                   "delta": delta,
+                                   "missing_messages": round(delta / options["expected_interval_sec"]) - 1})
+
+
+def jump_values(entry: dict, jumps: dict) -> dict:
+    values = {}
+    for key in jumps:
+        if key in entry:
+            try:
+                values[key] = float(entry[key])
+            except (ValueError, TypeError):
+                continue
+    return values
+
+
+def analyze_shard(shard: tuple, options: dict) -> dict:
+    entries, bad_lines = load_shard(shard)
+    window = options["boundary_window_sec"]
+    by_sensor: dict[str, list[dict]] = {}
+    for entry in entries:
+        sensor_id = entry.get("sensor_id")
+        if sensor_id:
+            by_sensor.setdefault(sensor_id, []).append(entry)
+
+    issues = {"out_of_range": [], "sudden_change": [], "gaps": []}
+    sensors = {}
+    for sensor_id, sensor_entries in by_sensor.items():
+        sensor_entries.sort(key=lambda entry: entry.get("received_at", 0))
+        buckets = {key: Bucket() for key in options["keys"]}
+        # readings repeat (0.1 resolution), so per-value counts stay small and merge exactly across shards
+        value_counts = {key: Counter() for key in options["keys"]}
+        records = []
+        for entry in sensor_entries:
+            received_at = entry.get("received_at")
+            sort_key = received_at if received_at is not None else 0
+            if entry.get("repeated"):
+                # a republished reading (ingest_ordering): a delivered message for the gap checks, but its values
+                # were already checked and counted. It echoes the reading before it, so jumps through it are unchanged
+                records.append((received_at, sort_key, jump_values(entry, options["jumps"])))
+                continue
+            for key, value in entry.items():
+                if key in options["ranges"]:
+                    try:
+                        value = float(value)
+                    except (ValueError, TypeError):
+                        continue
+                    low, high = options["ranges"][key]
+                    if value < low or value > high:
+                        issues["out_of_range"].append({"sensor_id": sensor_id, "received_at": received_at, "key": key,
+                                                       "value": value, "valid_range": [low, high]})
+            for key, bucket in buckets.items():
+                value = to_number(entry.get(key))
+                if value is not None and value == value:
+                    bucket.add(sort_key, float(value))
+                    value_counts[key][float(value)] += 1
+            records.append((received_at, sort_key, jump_values(entry, options["jumps"])))
+
+        # pairs inside the interior are final; records near either end (and the interior's first and last record)
+        # go back to the parent, which checks them against neighbouring shards
+        low = records[0][1] + window
+        high = records[-1][1] - window
+        interior = [i for i, record in enumerate(records) if low <= record[1] <= high]
+        if interior:
+            first, last = interior[0], interior[-1]
+            for i in range(first, last):
+                check_pair(sensor_id, records[i], records[i + 1], options, issues)
+            boundary = records[:first] + [records[first]]
+            if last != first:
+                boundary.append(records[last])
+            boundary.extend(records[last + 1:])
+            anchors = (first, first + 1 if last != first else first)
+        else:
+            boundary = records
+            anchors = None
+        sensors[sensor_id] = {
+            "records": len(records),
+            "stats": {key: bucket.to_dict() for key, bucket in buckets.items()},
+            "value_counts": {key: dict(counts) for key, counts in value_counts.items()},
+            "boundary": boundary,
+            # positions in boundary of the interior's first and last record; the pair between them is covered
+            "anchors": anchors,
+            "interior_span": (records[interior[0]][1], records[interior[-1]][1]) if interior else None,
+        }
+    return {"shard": shard, "records": len(entries), "bad_lines": bad_lines, "sensors": sensors, "issues": issues}
+
+
+def merge_results(results: list[dict], options: dict) -> dict:
+    issues = {"out_of_range": [], "sudden_change": [], "gaps": []}
+    sensors: dict[str, dict] = {}
+    boundaries: dict[str, list] = {}
+    unsafe_boundaries = 0
+    for order, result in enumerate(results):
+        for name in issues:
+            issues[name].extend(result["issues"][name])
+        for sensor_id, partial in result["sensors"].items():
+            sensor = sensors.setdefault(sensor_id, {"records": 0, "stats": {key: Bucket() for key in options["keys"]},
+                                                    "value_counts": {key: Counter() for key in options["keys"]}})
+            sensor["records"] += partial["records"]
+            for key, bucket in partial["stats"].items():
+                sensor["stats"][key].merge(Bucket.from_dict(bucket))
+            for key, counts in partial["value_counts"].items():
+                sensor["value_counts"][key].update(counts)
+            anchors = partial["anchors"]
+            for position, record in enumerate(partial["boundary"]):
+                anchor = None
+                if anchors is not None and position in anchors:
+                    anchor = "first" if position == anchors[0] else "last"
+                boundaries.setdefault(sensor_id, []).append((record[1], order, position, anchor, record, partial))
+
+    # stitch shards together: walk the boundary records of every shard in time order and check each neighbouring
+    # pair, except a shard's own interior first -> last pair that the worker already checked
+    for sensor_id, records in boundaries.items():
+        records.sort(key=lambda item: item[:3])
+        for (_, order, _, anchor, previous, _), (_, next_order, _, next_anchor, current, _) in zip(records, records[1:]):
+            if order == next_order and anchor == "first" and next_anchor == "last":
+                continue
+            check_pair(sensor_id, previous, current, options, issues)
+        spans = [(item[1], item[5]["interior_span"]) for item in records if item[3] == "first"]
+        for order, span in spans:
+            if any(item[1] != order and span[0] < item[0] < span[1] for item in records):
+                unsafe_boundaries += 1
+
+    for name in issues:
+        issues[name].sort(key=lambda issue: (issue["sensor_id"], issue["received_at"] or 0, issue.get("key") or ""))
+    return {"sensors": sensors, "issues": issues, "unsafe_boundaries": unsafe_boundaries}
+
+
+def median_of_counts(counts: dict) -> float | None:
+    # same definition as statistics.median, walking the distinct values in order
+    n = sum(counts.values())
+    if not n:
+        return None
+    wanted = [(n - 1) // 2, n // 2]
+    found = []
+    seen = 0
+    for value in sorted(counts):
+        seen += counts[value]
+        while wanted and wanted[0] < seen:
+            found.append(value)
+            wanted.pop(0)
+        if not wanted:
+            break
+    return found[0] if n % 2 else (found[0] + found[1]) / 2
+
+
+def mean_of_counts(counts: dict) -> float | None:
+    # correctly rounded like statistics.mean (and TelemetryAnalyzer's exact mean): the distinct values are few
+    n = sum(counts.values())
+    if not n:
+        return None
+    return float(sum(Fraction(value) * count for value, count in counts.items()) / n)
+
+
+def report_stats(bucket: Bucket, value_counts: dict) -> dict:
+    stats = {stat: bucket.stat(stat) for stat in REPORT_STATS if stat not in EXACT_STATS}
+    stats["mean"] = mean_of_counts(value_counts)
+    stats["median"] = median_of_counts(value_counts)
+    return {stat: stats[stat] for stat in REPORT_STATS}
+
+
+def build_report(paths: list[str], shards: list[tuple], results: list[dict], merged: dict, elapsed_sec: float) -> dict:
+    issues = merged["issues"]
+    # one pass over each issue list
+    gaps = Counter(gap["sensor_id"] for gap in issues["gaps"])
+    missing_messages = Counter()
+    for gap in issues["gaps"]:
+        missing_messages[gap["sensor_id"]] += gap["missing_messages"]
+    out_of_range = Counter(issue["sensor_id"] for issue in issues["out_of_range"])
+    sudden_changes = Counter(issue["sensor_id"] for issue in issues["sudden_change"])
+    sensors = {}
+    for sensor_id in sorted(merged["sensors"]):
+        sensor = merged["sensors"][sensor_id]
+        missing = missing_messages[sensor_id]
+        sensors[sensor_id] = {
+            "records": sensor["records"],
+            "expected_records": sensor["records"] + missing,
+            "gaps": gaps[sensor_id],
+            "missing_messages": missing,
+            "out_of_range": out_of_range[sensor_id],
+            "sudden_changes": sudden_changes[sensor_id],
+            "stats": {key: report_stats(bucket, sensor["value_counts"][key]) for key, bucket in sensor["stats"].items()},
+        }
+    return {
+        "generated_at": time.time(),
+        "inputs": paths,
+        "shards": len(shards),
+        "records": sum(result["records"] for result in results),
+        "bad_lines": sum(result["bad_lines"] for result in results),
+        "unsafe_boundaries": merged["unsafe_boundaries"],
+        "elapsed_sec": elapsed_sec,
+        "sensors": sensors,
+        "issues": issues,
+    }
+
+
+def default_options(keys=DEFAULT_AGGREGATE_KEYS, boundary_window_sec: float = DEFAULT_BOUNDARY_WINDOW_SEC) -> dict:
+    return {
+        "keys": tuple(keys),
+        "ranges": dict(VALID_RANGES),
+        "jumps": dict(VALID_CHANGES_JUMPS),
+        "expected_interval_sec": EXPECTED_MESSAGE_INTERVAL_SECONDS,
+        "tolerance": TOLERANCE_MESSAGE_INTERVAL,
+        "boundary_window_sec": boundary_window_sec,
+    }
+
+
+def run_batch(paths: list[str], workers: int | None = None, chunk_bytes: int = DEFAULT_CHUNK_BYTES,
+              options: dict | None = None) -> dict:
+    options = options or default_options()
+    start = time.perf_counter()
+    shards = plan_shards(paths, chunk_bytes)
+    if workers == 1:
+        results = [analyze_shard(shard, options) for shard in shards]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(analyze_shard, shards, [options] * len(shards)))
+    merged = merge_results(results, options)
+    return build_report(paths, shards, results, merged, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze many telemetry files or segment directories in parallel")
+    parser.add_argument("paths", nargs="+", help="jsonl files, .bin files, .db files or segment directories")
+    parser.add_argument("--output", "-o", help="write the JSON report here instead of stdout")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument("--chunk-mb", type=float, default=DEFAULT_CHUNK_BYTES / 1024 / 1024)
+    parser.add_argument("--boundary-window", type=float, default=DEFAULT_BOUNDARY_WINDOW_SEC,
+                        help="seconds of overlap tolerated between neighbouring shards")
+    args = parser.parse_args()
+
+    report = run_batch(args.paths, args.workers, max(1, int(args.chunk_mb * 1024 * 1024)),
+                       default_options(boundary_window_sec=args.boundary_window))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=1)
+        print(f"{report['records']} records from {report['shards']} shards in {report['elapsed_sec']:.2f} s -> {args.output}")
+        if report["unsafe_boundaries"]:
+            print(f"Warning: {report['unsafe_boundaries']} shards overlap in time by more than the boundary window")
+    else:
+        print(json.dumps(report, indent=1))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+import argparse
+import os
+import tempfile
+
+from batch_analysis import run_batch
+from benchmarks.bench_detection import timed
+from benchmarks.datasets import write_scaled_copy
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch analysis throughput by number of worker processes")
+    parser.add_argument("filename", nargs="?", default="../data/old_data.jsonl")
+    parser.add_argument("--scale", type=int, default=50)
+    parser.add_argument("--chunk-mb", type=float, default=2.0)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "scaled.jsonl")
+        records = write_scaled_copy(args.filename, path, args.scale)
+        chunk_bytes = int(args.chunk_mb * 1024 * 1024)
+        print(f"Records: {records}, {os.path.getsize(path) / 1e6:.1f} MB, cores: {os.cpu_count()}")
+
+        baseline_sec, baseline = timed(lambda: run_batch([path], workers=1, chunk_bytes=chunk_bytes), args.repeat)
+        print(f"1 worker (in process):   {baseline_sec:7.2f} s  {records / baseline_sec:10.0f} records/s")
+        workers = 2
+        while workers <= max(args.max_workers, 2):
+            seconds, report = timed(lambda: run_batch([path], workers=workers, chunk_bytes=chunk_bytes), args.repeat)
+            if report["sensors"] != baseline["sensors"]:
+                raise SystemExit(f"Report with {workers} workers differs from the single process one")
+            print(f"{workers} workers:               {seconds:7.2f} s  {records / seconds:10.0f} records/s "
+                  f"({baseline_sec / seconds:.1f}x)")
+            workers *= 2
+
+
+if __name__ == "__main__":
+    main()
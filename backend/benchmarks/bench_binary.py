@@ -0,0 +1,49 @@
+import argparse
+import os
+import tempfile
+
+from telemetry_analyzer import TelemetryAnalyzer
+from binary_records import BinaryRecordFile, convert_jsonl
+from benchmarks.bench_detection import timed
+from benchmarks.datasets import write_scaled_copy
+
+
+def load_columns(path: str) -> float:
+    with BinaryRecordFile(path) as records:
+        return float(records.column("temperatureCelcius").sum())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSONL vs binary record size and load time")
+    parser.add_argument("filename", nargs="?", default="../data/old_data.jsonl")
+    parser.add_argument("--scale", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        jsonl_path = os.path.join(tmp, "scaled.jsonl")
+        binary_path = os.path.join(tmp, "scaled.bin")
+        records = write_scaled_copy(args.filename, jsonl_path, args.scale)
+        convert_sec, _ = timed(lambda: convert_jsonl(jsonl_path, binary_path), 1)
+        jsonl_size = os.path.getsize(jsonl_path)
+        binary_size = os.path.getsize(binary_path)
+
+        jsonl_sec, jsonl_analyzer = timed(lambda: TelemetryAnalyzer(jsonl_path, compute_stats=False, columnar=True),
+                                          args.repeat)
+        binary_sec, binary_analyzer = timed(
+            lambda: TelemetryAnalyzer.from_binary(binary_path, compute_stats=False, columnar=True), args.repeat)
+        columns_sec, _ = timed(lambda: load_columns(binary_path), args.repeat)
+
+    if binary_analyzer.entries_by_sensor != jsonl_analyzer.entries_by_sensor:
+        raise SystemExit("Binary records do not round-trip to the JSONL entries")
+
+    print(f"Records: {records}, sensors: {len(jsonl_analyzer.entries_by_sensor)}, conversion: {convert_sec:.2f} s")
+    print(f"JSONL size:                     {jsonl_size / 1e6:9.2f} MB")
+    print(f"Binary size:                    {binary_size / 1e6:9.2f} MB ({jsonl_size / binary_size:.1f}x smaller)")
+    print(f"JSONL analyzer load:            {jsonl_sec * 1000:9.1f} ms")
+    print(f"Binary analyzer load:           {binary_sec * 1000:9.1f} ms ({jsonl_sec / binary_sec:.1f}x)")
+    print(f"Binary mmap + column scan:      {columns_sec * 1000:9.1f} ms ({jsonl_sec / columns_sec:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
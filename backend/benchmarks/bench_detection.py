@@ -0,0 +1,55 @@
+import argparse
+import os
+import tempfile
+import time
+
+from telemetry_analyzer import TelemetryAnalyzer
+from benchmarks.datasets import write_scaled_copy
+
+
+def loop_detection(telemetry: TelemetryAnalyzer) -> list[dict]:
+    issues = []
+    for sensor_id in telemetry.entries_by_sensor:
+        issues.extend(TelemetryAnalyzer.out_of_range_detection(telemetry, sensor_id))
+        issues.extend(TelemetryAnalyzer.sudden_change_detection(telemetry, sensor_id))
+    return issues
+
+
+def timed(fn, repeat: int) -> tuple[float, object]:
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Loop vs vectorized anomaly detection")
+    parser.add_argument("filename", nargs="?", default="../data/old_data.jsonl")
+    parser.add_argument("--scale", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "scaled.jsonl")
+        records = write_scaled_copy(args.filename, path, args.scale)
+        dict_analyzer = TelemetryAnalyzer(path, compute_stats=False)
+        columnar_analyzer = TelemetryAnalyzer(path, compute_stats=False, columnar=True)
+
+    loop_sec, loop_issues = timed(lambda: loop_detection(dict_analyzer), args.repeat)
+    table_sec, table = timed(lambda: columnar_analyzer.detect_anomalies(), args.repeat)
+    dicts_sec, engine_issues = timed(lambda: columnar_analyzer.anomaly_issues(), args.repeat)
+
+    if engine_issues != loop_issues:
+        raise SystemExit("Vectorized detection does not match the loop implementation")
+
+    print(f"Records: {records}, sensors: {len(dict_analyzer.entries_by_sensor)}, issues: {len(table)}")
+    print(f"Loop detection:                 {loop_sec * 1000:9.1f} ms")
+    print(f"Vectorized, issue table only:   {table_sec * 1000:9.1f} ms ({loop_sec / table_sec:.1f}x)")
+    print(f"Vectorized, with issue dicts:   {dicts_sec * 1000:9.1f} ms ({loop_sec / dicts_sec:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import argparse
+import json
+import os
+import tempfile
+
+import json_codec
+from json_codec import FieldDecoder
+from telemetry_analyzer import DEFAULT_AGGREGATE_KEYS, TelemetryAnalyzer
+from benchmarks.bench_detection import timed
+from benchmarks.datasets import write_scaled_copy
+
+FIELDS = ("sensor_id", *DEFAULT_AGGREGATE_KEYS, "received_at")
+
+
+def decode_all(decode, lines: list[bytes]) -> list:
+    return [decode(line) for line in lines]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-record JSON decode cost by backend")
+    parser.add_argument("filename", nargs="?", default="../data/old_data.jsonl")
+    parser.add_argument("--scale", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "scaled.jsonl")
+        records = write_scaled_copy(args.filename, path, args.scale)
+        with open(path, "rb") as file:
+            lines = [line.strip() for line in file if line.strip()]
+
+        expected = [{key: value for key, value in json.loads(line).items() if key in FIELDS} for line in lines]
+        decoder = FieldDecoder(FIELDS)
+        candidates = [("json.loads(line.decode())", lambda line: json.loads(line.decode()))]
+        candidates.extend((f"{name}.loads(bytes)", decode) for name, decode in json_codec.DECODERS.items())
+        print(f"Records: {records}, installed backends: {', '.join(json_codec.DECODERS)}")
+        baseline = None
+        for name, decode in candidates:
+            seconds, _ = timed(lambda: decode_all(decode, lines), args.repeat)
+            baseline = baseline or seconds
+            print(f"{name:34} {seconds / records * 1e6:7.2f} us/record ({baseline / seconds:.1f}x)")
+
+        for backend in json_codec.DECODERS:
+            json_codec.set_backend(backend)
+            seconds, result = timed(lambda: decode_all(decoder.decode, lines), args.repeat)
+            if result != expected:
+                raise SystemExit(f"Field decoder ({backend}) does not match json.loads")
+            print(f"{'fields, ' + backend + ' backend':34} {seconds / records * 1e6:7.2f} us/record "
+                  f"({baseline / seconds:.1f}x)")
+
+        for backend in json_codec.DECODERS:
+            json_codec.set_backend(backend)
+            seconds, _ = timed(lambda: TelemetryAnalyzer(path, compute_stats=False), args.repeat)
+            print(f"{'TelemetryAnalyzer load, ' + backend:34} {seconds * 1000:7.1f} ms")
+        seconds, _ = timed(lambda: TelemetryAnalyzer(path, compute_stats=False, fields=DEFAULT_AGGREGATE_KEYS),
+                           args.repeat)
+        print(f"{'TelemetryAnalyzer load, ' + backend + '+fields':34} {seconds * 1000:7.1f} ms")
+        json_codec.set_backend(next(name for name in json_codec.PREFERRED_BACKENDS if name in json_codec.DECODERS))
+
+
+if __name__ == "__main__":
+    main()
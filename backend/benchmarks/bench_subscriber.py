@@ -0,0 +1,127 @@
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+
+import json_codec
+import subscriber_script
+from ingest_pipeline import IngestPipeline
+from subscriber_service import BrokerConfig, SubscriberService
+from benchmarks.local_broker import LocalBroker
+
+
+def sensor_topics(sensors: int) -> list[str]:
+    return [f"iot/home/sensor-{i:04d}/telemetry" for i in range(sensors)]
+
+
+def publish(host: str, port: int, topics: list[str], messages: int, rate: float) -> None:
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+    client.connect(host, port)
+    client.loop_start()
+    interval = 1 / rate if rate else 0
+    start = time.perf_counter()
+    for i in range(messages):
+        payload = json.dumps({"isReadingValid": True, "hasNewReading": True, "temperatureCelcius": 21.5 + i % 7 / 10,
+                              "humidityPercent": 40.0, "sentAt": time.time()})
+        client.publish(topics[i % len(topics)], payload)
+        if interval:
+            delay = start + (i + 1) * interval - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+    client.loop_stop()
+    client.disconnect()
+
+
+async def run(args, host: str, port: int) -> dict:
+    topics = sensor_topics(args.sensors)
+    latencies: list[float] = []
+    done = threading.Event()
+
+    def measure(topic: str, payload: bytes, recv_ts: float) -> None:
+        if args.handler == "subscriber":
+            subscriber_script.process_message(topic, payload, recv_ts)
+        latencies.append(time.time() - json_codec.loads(payload)["sentAt"])
+        if len(latencies) >= args.messages:
+            done.set()
+
+    # the topics are split between the connections: every connection has its own subscription set
+    brokers = []
+    for i in range(args.connections):
+        subset = ["iot/home/+/telemetry"] if args.wildcard else topics[i::args.connections]
+        brokers.append(BrokerConfig(host, port, tls=False, topics=subset if i == 0 or not args.wildcard else [],
+                                    name=f"conn-{i}"))
+    pipeline = IngestPipeline(measure, workers=args.workers, max_queue_size=args.queue_size)
+    service = SubscriberService(brokers, pipeline)
+    service_task = asyncio.create_task(service.run())
+    while not service.connections or not all(connection.connected for connection in service.connections):
+        await asyncio.sleep(0.05)
+    await asyncio.sleep(0.2)
+
+    start = time.perf_counter()
+    publisher = threading.Thread(target=publish, args=(host, port, topics, args.messages, args.rate))
+    publisher.start()
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, done.wait, args.timeout)
+    elapsed = time.perf_counter() - start
+    await loop.run_in_executor(None, publisher.join)
+    service.stop()
+    await service_task
+    stats = service.stats()
+    latencies.sort()
+    return {
+        "received": sum(connection["messages"] for connection in stats["connections"]),
+        "processed": len(latencies),
+        "dropped": stats["pipeline"]["dropped_oldest"] + stats["pipeline"]["dropped_newest"],
+        "max_queue_depth": stats["pipeline"]["max_queue_depth"],
+        "elapsed_sec": elapsed,
+        "latency_ms": {name: latencies[int(q * (len(latencies) - 1))] * 1000 if latencies else None
+                       for name, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99), ("max", 1.0))},
+        "latency_mean_ms": statistics.mean(latencies) * 1000 if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end throughput and latency of SubscriberService")
+    parser.add_argument("--host", help="use this broker (no TLS/auth) instead of the in-process stand-in")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--connections", type=int, default=2)
+    parser.add_argument("--sensors", type=int, default=2000, help="distinct topics, split between the connections")
+    parser.add_argument("--wildcard", action="store_true", help="one iot/home/+/telemetry subscription instead")
+    parser.add_argument("--messages", type=int, default=20_000)
+    parser.add_argument("--rate", type=float, default=0, help="messages per second, 0 for as fast as possible")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--queue-size", type=int, default=100_000)
+    parser.add_argument("--handler", choices=("decode", "subscriber"), default="decode",
+                        help="subscriber: run subscriber_script.process_message (writes to a temp dir)")
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.handler == "subscriber":
+            subscriber_script.DATA_FILENAME = os.path.join(tmp, "data.jsonl")
+            subscriber_script.WRITE_ROLLUPS = False
+        if args.host:
+            result = asyncio.run(run(args, args.host, args.port))
+        else:
+            with LocalBroker() as broker:
+                result = asyncio.run(run(args, broker.host, broker.port))
+        subscriber_script.close_writers()
+
+    print(f"{args.connections} connections, {args.sensors} topics, {args.messages} messages, {args.workers} workers")
+    print(f"received {result['received']}, processed {result['processed']}, dropped {result['dropped']}, "
+          f"max queue depth {result['max_queue_depth']}")
+    print(f"throughput: {result['processed'] / result['elapsed_sec']:.0f} msg/s ({result['elapsed_sec']:.2f} s)")
+    latency = result["latency_ms"]
+    if latency["p50"] is not None:
+        print(f"latency ms: mean {result['latency_mean_ms']:.1f}  p50 {latency['p50']:.1f}  p95 {latency['p95']:.1f}  "
+              f"p99 {latency['p99']:.1f}  max {latency['max']:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+import argparse
+import json
+import random
+
+
+def write_scaled_copy(source: str, destination: str, scale: int) -> int:
+    # repeats the source history `scale` times, shifting received_at so every copy follows the previous one
+    with open(source, "r") as file:
+        rows = [json.loads(line) for line in file if line.strip()]
+    if not rows:
+        return 0
+    received = [row["received_at"] for row in rows if "received_at" in row]
+    span = (max(received) - min(received) + 10.0) if received else 0.0
+
+    written = 0
+    with open(destination, "w") as out:
+        for copy in range(scale):
+            for row in rows:
+                row = dict(row)
+                if "received_at" in row:
+                    row["received_at"] += copy * span
+                out.write(json.dumps(row) + "\n")
+                written += 1
+    return written
+
+
+# firmware: DHT sampled every 2 s, published every 5 s (esp32Component.cpp / mqtt.cpp)
+SAMPLE_INTERVAL_MS = 2000
+PUBLISH_INTERVAL_SEC = 5.0
+
+
+def heat_index_fahrenheit(temperature_f: float, humidity: float) -> float:
+    # the DHT library's formula: Steadman's approximation, Rothfusz regression above 80 F
+    heat_index = 0.5 * (temperature_f + 61.0 + (temperature_f - 68.0) * 1.2 + humidity * 0.094)
+    if heat_index > 79:
+        heat_index = (-42.379 + 2.04901523 * temperature_f + 10.14333127 * humidity
+                      - 0.22475541 * temperature_f * humidity - 0.00683783 * temperature_f ** 2
+                      - 0.05481717 * humidity ** 2 + 0.00122874 * temperature_f ** 2 * humidity
+                      + 0.00085282 * temperature_f * humidity ** 2 - 0.00000199 * temperature_f ** 2 * humidity ** 2)
+    return heat_index
+
+
+def synthetic_records(sensors: int = 10, duration_sec: float = 3600, interval_sec: float = PUBLISH_INTERVAL_SEC,
+                      start: float = 1_768_000_000.0, jitter_sec: float = 0.2, gap_rate: float = 0.0,
+                      out_of_range_rate: float = 0.0, jump_rate: float = 0.0, read_failure_rate: float = 0.0,
+                      seed: int = 0):
+    # records as the subscriber stores them (sensor_id, firmware payload, received_at, topic), in received_at order.
+    # gap_rate: chance a sensor goes silent for 3-10 intervals; out_of_range_rate / jump_rate: chance a reading is
+    # outside VALID_RANGES / jumps past VALID_CHANGES_JUMPS; read_failure_rate: chance of a DHT_READ_FAILED payload
+    rng = random.Random(seed)
+    sensor_ids = [f"S{i:04d}" for i in range(sensors)]
+    state = {}
+    for sensor_id in sensor_ids:
+        state[sensor_id] = {
+            "temperature": rng.uniform(18, 26), "humidity": rng.uniform(30, 60),
+            "boot_ms": rng.randint(10_000, 5_000_000), "silent_until": 0, "last_sampled": 0,
+            "phase": rng.uniform(0, interval_sec),
+        }
+
+    steps = int(duration_sec / interval_sec)
+    for step in range(steps):
+        batch = []
+        for sensor_id in sensor_ids:
+            sensor = state[sensor_id]
+            if step < sensor["silent_until"]:
+                continue
+            if gap_rate and rng.random() < gap_rate:
+                sensor["silent_until"] = step + rng.randint(3, 10)
+                continue
+            published_ms = sensor["boot_ms"] + int((step * interval_sec + sensor["phase"]) * 1000)
+            sampled_ms = published_ms - published_ms % SAMPLE_INTERVAL_MS
+            sensor["temperature"] = min(45.0, max(5.0, sensor["temperature"] + rng.gauss(0, 0.05)))
+            sensor["humidity"] = min(95.0, max(5.0, sensor["humidity"] + rng.gauss(0, 0.2)))
+            temperature, humidity = sensor["temperature"], sensor["humidity"]
+            if out_of_range_rate and rng.random() < out_of_range_rate:
+                temperature = rng.choice((-5.0, 55.0))
+            elif jump_rate and rng.random() < jump_rate:
+                temperature += rng.choice((-1, 1)) * rng.uniform(2, 6)
+
+            record = {"sensor_id": sensor_id}
+            if read_failure_rate and rng.random() < read_failure_rate:
+                record.update({"isReadingValid": False, "hasNewReading": False, "sampledAt": 0,
+                               "publishedAt": published_ms, "ageReadings": 0, "error": "DHT_READ_FAILED"})
+            else:
+                temperature_f = temperature * 1.8 + 32
+                heat_index_f = heat_index_fahrenheit(temperature_f, humidity)
+                record.update({
+                    "isReadingValid": True, "hasNewReading": sampled_ms != sensor["last_sampled"],
+                    "sampledAt": sampled_ms, "publishedAt": published_ms, "ageReadings": published_ms - sampled_ms,
+                    "temperatureCelcius": round(temperature, 2), "temperatureFahrenheit": round(temperature_f, 2),
+                    "humidityPercent": round(humidity, 2), "heatIndexCelcius": round((heat_index_f - 32) / 1.8, 2),
+                    "heatIndexFahrenheit": round(heat_index_f, 2),
+                })
+                sensor["last_sampled"] = sampled_ms
+            record["received_at"] = start + step * interval_sec + sensor["phase"] + abs(rng.gauss(0.05, jitter_sec))
+            record["topic"] = f"iot/home/{sensor_id}/telemetry"
+            batch.append(record)
+        batch.sort(key=lambda record: record["received_at"])
+        yield from batch
+
+
+def synthetic_messages(**options):
+    # (topic, payload bytes, received_at) as the subscriber's on_message gets them
+    for record in synthetic_records(**options):
+        payload = {key: value for key, value in record.items() if key not in ("sensor_id", "received_at", "topic")}
+        yield record["topic"], json.dumps(payload, separators=(",", ":")).encode(), record["received_at"]
+
+
+def write_synthetic(destination: str, **options) -> int:
+    written = 0
+    with open(destination, "w") as out:
+        for record in synthetic_records(**options):
+            out.write(json.dumps(record) + "\n")
+            written += 1
+    return written
+
+
+def add_generator_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--sensors", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=3600, help="seconds of history")
+    parser.add_argument("--interval", type=float, default=PUBLISH_INTERVAL_SEC, help="seconds between messages")
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--gap-rate", type=float, default=0.001)
+    parser.add_argument("--out-of-range-rate", type=float, default=0.001)
+    parser.add_argument("--jump-rate", type=float, default=0.002)
+    parser.add_argument("--read-failure-rate", type=float, default=0.001)
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def generator_options(args) -> dict:
+    return {"sensors": args.sensors, "duration_sec": args.duration, "interval_sec": args.interval,
+            "jitter_sec": args.jitter, "gap_rate": args.gap_rate, "out_of_range_rate": args.out_of_range_rate,
+            "jump_rate": args.jump_rate, "read_failure_rate": args.read_failure_rate, "seed": args.seed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic telemetry log following the firmware payloads")
+    parser.add_argument("destination")
+    add_generator_arguments(parser)
+    args = parser.parse_args()
+    written = write_synthetic(args.destination, **generator_options(args))
+    print(f"{written} records written to {args.destination}")
+
+
+if __name__ == "__main__":
+    main()
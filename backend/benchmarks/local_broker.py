@@ -0,0 +1,140 @@
+import asyncio
+import struct
+import threading
+
+CONNECT, CONNACK, PUBLISH, SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK, PINGREQ, PINGRESP, DISCONNECT = (
+    1, 2, 3, 8, 9, 10, 11, 12, 13, 14)
+
+
+def encode_length(length: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = length % 128
+        length //= 128
+        out.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(out)
+
+
+def packet(kind: int, flags: int, body: bytes) -> bytes:
+    return bytes([kind << 4 | flags]) + encode_length(len(body)) + body
+
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    filter_parts = topic_filter.split("/")
+    topic_parts = topic.split("/")
+    for i, part in enumerate(filter_parts):
+        if part == "#":
+            return True
+        if i >= len(topic_parts) or (part != "+" and part != topic_parts[i]):
+            return False
+    return len(filter_parts) == len(topic_parts)
+
+
+class LocalBroker:
+    # just enough MQTT 3.1.1 (QoS 0, no auth, no retain, no TLS) to benchmark the subscriber without a real broker;
+    # runs its own event loop on a background thread
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self.messages_in = 0
+        self.messages_out = 0
+        self._subscriptions: dict[asyncio.StreamWriter, set[str]] = {}
+        self._routes: dict[str, list[asyncio.StreamWriter]] = {}
+        self._loop = asyncio.new_event_loop()
+        self._server = None
+        self._thread = threading.Thread(target=self._loop.run_forever, name="local-broker", daemon=True)
+
+    def start(self) -> "LocalBroker":
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self._loop).result()
+        return self
+
+    def stop(self) -> None:
+        asyncio.run_coroutine_threadsafe(self._stop(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    async def _start(self) -> None:
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def _stop(self) -> None:
+        self._server.close()
+        for writer in list(self._subscriptions):
+            writer.close()
+        await self._server.wait_closed()
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._subscriptions[writer] = set()
+        try:
+            while True:
+                header = await reader.readexactly(1)
+                length, shift = 0, 0
+                while True:
+                    byte = (await reader.readexactly(1))[0]
+                    length += (byte & 0x7F) << shift
+                    shift += 7
+                    if not byte & 0x80:
+                        break
+                body = await reader.readexactly(length)
+                kind, flags = header[0] >> 4, header[0] & 0x0F
+                if kind == CONNECT:
+                    writer.write(packet(CONNACK, 0, b"\x00\x00"))
+                elif kind == PUBLISH:
+                    self._route(flags, body)
+                elif kind in (SUBSCRIBE, UNSUBSCRIBE):
+                    self._subscribe(writer, kind, body)
+                elif kind == PINGREQ:
+                    writer.write(packet(PINGRESP, 0, b""))
+                elif kind == DISCONNECT:
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            del self._subscriptions[writer]
+            self._routes.clear()
+            writer.close()
+
+    def _subscribe(self, writer: asyncio.StreamWriter, kind: int, body: bytes) -> None:
+        packet_id, position, count = body[:2], 2, 0
+        while position < len(body):
+            (length,) = struct.unpack_from("!H", body, position)
+            topic_filter = body[position + 2:position + 2 + length].decode()
+            position += 2 + length
+            if kind == SUBSCRIBE:
+                position += 1
+                self._subscriptions[writer].add(topic_filter)
+            else:
+                self._subscriptions[writer].discard(topic_filter)
+            count += 1
+        self._routes.clear()
+        if kind == SUBSCRIBE:
+            writer.write(packet(SUBACK, 0, packet_id + b"\x00" * count))
+        else:
+            writer.write(packet(UNSUBACK, 0, packet_id))
+
+    def _route(self, flags: int, body: bytes) -> None:
+        (length,) = struct.unpack_from("!H", body)
+        topic = body[2:2 + length].decode()
+        qos = (flags >> 1) & 3
+        payload = body[2 + length + (2 if qos else 0):]
+        self.messages_in += 1
+        subscribers = self._routes.get(topic)
+        if subscribers is None:
+            subscribers = [writer for writer, filters in self._subscriptions.items()
+                           if topic in filters or any(("+" in topic_filter or "#" in topic_filter)
+                                                      and topic_matches(topic_filter, topic) for topic_filter in filters)]
+            self._routes[topic] = subscribers
+        if subscribers:
+            data = packet(PUBLISH, 0, body[:2 + length] + payload)
+            for writer in subscribers:
+                writer.write(data)
+                self.messages_out += 1
@@ -0,0 +1,194 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from types import SimpleNamespace
+
+from rich.console import Console
+
+import dashboard
+import subscriber_script
+from sqlite_store import import_jsonl
+from telemetry_analyzer import TelemetryAnalyzer
+from benchmarks.bench_detection import timed
+from benchmarks.datasets import add_generator_arguments, generator_options, synthetic_messages, write_synthetic
+
+# a benchmark is compared against the previous run and flagged when it got this much slower
+REGRESSION_THRESHOLD = 1.2
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def fresh_dashboard(path: str):
+    dashboard.analyzers.clear()
+    dashboard.snapshot_cache.clear()
+    dashboard.panel_cache.clear()
+    dashboard.timestamp_to_utc.cache_clear()
+    return dashboard.build_sensor_snapshots(path)
+
+
+def render_layout(path: str, page_size: int | None) -> str:
+    console = Console(file=io.StringIO(), width=200, height=60)
+    console.print(dashboard.build_layout(path, 0, page_size))
+    return console.file.getvalue()
+
+
+def drive_on_message(messages: list[tuple], data_dir: str) -> int:
+    # the subscriber's broker-facing path without a broker: on_message -> pipeline -> process_message -> writer
+    subscriber_script.DATA_FILENAME = os.path.join(data_dir, "subscriber.jsonl")
+    subscriber_script.ROLLUP_DIRECTORY = os.path.join(data_dir, "rollups")
+    subscriber_script.detector = type(subscriber_script.detector)()
+    with contextlib.redirect_stdout(io.StringIO()):
+        subscriber_script.start_pipeline()
+        for topic, payload, _ in messages:
+            subscriber_script.on_message(None, None, SimpleNamespace(topic=topic, payload=payload, qos=0))
+        subscriber_script.stop_pipeline()
+        subscriber_script.close_writers()
+    return len(messages)
+
+
+def process_messages(messages: list[tuple], data_dir: str) -> int:
+    # process_message alone, on this thread
+    subscriber_script.DATA_FILENAME = os.path.join(data_dir, "process.jsonl")
+    subscriber_script.rollups = None
+    subscriber_script.detector = type(subscriber_script.detector)()
+    subscriber_script.ordering = subscriber_script.open_ordering()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for topic, payload, recv_ts in messages:
+            subscriber_script.process_message(topic, payload, recv_ts)
+        subscriber_script.ordering.flush()
+        subscriber_script.close_writers()
+    return len(messages)
+
+
+def import_sqlite(path: str, database: str) -> int:
+    for suffix in ("", "-wal", "-shm"):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(database + suffix)
+    return import_jsonl([path], database)["records_written"]
+
+
+def run_suite(path: str, messages: list[tuple], tmp: str, repeat: int) -> dict:
+    telemetry = TelemetryAnalyzer(path, compute_stats=False)
+    columnar = TelemetryAnalyzer(path, compute_stats=False, columnar=True)
+    sensor_ids = list(telemetry.entries_by_sensor)
+    database = os.path.join(tmp, "telemetry.db")
+    import_sqlite(path, database)
+    from_sqlite = TelemetryAnalyzer.from_sqlite(database, compute_stats=False)
+    # the statistics from_sqlite runs in SQL
+    basic_stats = ("count", "mean", "min", "max")
+    first, last = telemetry.entries[0].get("received_at"), telemetry.entries[-1].get("received_at")
+    hour = (first + (last - first) / 2, first + (last - first) / 2 + 3600)
+    hour_records = sum(1 for entry in telemetry.entries if hour[0] <= entry.get("received_at", first) < hour[1])
+
+    def per_sensor(analyzer, method):
+        return lambda: [method(analyzer, sensor_id) for sensor_id in sensor_ids]
+
+    cases = {
+        "analyzer_load": (lambda: TelemetryAnalyzer(path, compute_stats=False), len(telemetry.entries)),
+        "analyzer_load_stats": (lambda: TelemetryAnalyzer(path), len(telemetry.entries)),
+        "analyzer_load_columnar": (lambda: TelemetryAnalyzer(path, compute_stats=False, columnar=True),
+                                   len(telemetry.entries)),
+        "aggregate": (lambda: telemetry.aggregate(), len(telemetry.entries)),
+        "aggregate_columnar": (lambda: columnar.aggregate(), len(telemetry.entries)),
+        "aggregate_basic": (lambda: telemetry.aggregate(stats=basic_stats), len(telemetry.entries)),
+        "aggregate_basic_sqlite": (lambda: from_sqlite.aggregate(stats=basic_stats), len(telemetry.entries)),
+        "sqlite_import": (lambda: import_sqlite(path, os.path.join(tmp, "import.db")), len(telemetry.entries)),
+        "sqlite_load": (lambda: TelemetryAnalyzer.from_sqlite(database, compute_stats=False), len(telemetry.entries)),
+        "sqlite_load_hour": (lambda: TelemetryAnalyzer.from_sqlite(database, start=hour[0], end=hour[1],
+                                                                   compute_stats=False), hour_records),
+        "out_of_range_detection": (per_sensor(telemetry, TelemetryAnalyzer.out_of_range_detection),
+                                   len(telemetry.entries)),
+        "sudden_change_detection": (per_sensor(telemetry, TelemetryAnalyzer.sudden_change_detection),
+                                    len(telemetry.entries)),
+        "detect_missing_messages": (per_sensor(telemetry, TelemetryAnalyzer.detect_missing_messages),
+                                    len(telemetry.entries)),
+        "delivery_report": (lambda: telemetry.delivery_report(bucket_sec=3600), len(telemetry.entries)),
+        "delivery_report_columnar": (lambda: columnar.delivery_report(bucket_sec=3600), len(telemetry.entries)),
+        "calculate_timestamp_delta": (per_sensor(telemetry, TelemetryAnalyzer.calculate_timestamp_delta),
+                                      len(telemetry.entries)),
+        "evaluate_sensor_status": (per_sensor(telemetry, TelemetryAnalyzer.evaluate_sensor_status), len(sensor_ids)),
+        "detect_anomalies_columnar": (lambda: columnar.detect_anomalies(), len(telemetry.entries)),
+        "dashboard_snapshots_cold": (lambda: fresh_dashboard(path), len(sensor_ids)),
+        "dashboard_snapshots_warm": (lambda: dashboard.build_sensor_snapshots(path), len(sensor_ids)),
+        "dashboard_layout_all": (lambda: render_layout(path, None), len(sensor_ids)),
+        "dashboard_layout_page": (lambda: render_layout(path, 12), 12),
+        "subscriber_process_message": (lambda: process_messages(messages, tmp), len(messages)),
+        "subscriber_on_message": (lambda: drive_on_message(messages, tmp), len(messages)),
+    }
+
+    results = {}
+    for name, (fn, items) in cases.items():
+        seconds, _ = timed(fn, repeat)
+        results[name] = {"seconds": seconds, "items": items, "us_per_item": seconds / max(items, 1) * 1e6}
+        print(f"{name:30} {seconds * 1000:10.1f} ms  {results[name]['us_per_item']:9.2f} us/item")
+    return results
+
+
+def compare(results: dict, baseline_path: str) -> list[str]:
+    with open(baseline_path) as file:
+        baseline = json.load(file)
+    print(f"\nCompared to {baseline_path} (commit {baseline.get('commit')}):")
+    regressions = []
+    for name, result in results.items():
+        previous = baseline["results"].get(name)
+        if previous is None:
+            continue
+        ratio = result["seconds"] / previous["seconds"] if previous["seconds"] else float("inf")
+        flag = "  REGRESSION" if ratio > REGRESSION_THRESHOLD else ""
+        print(f"{name:30} {ratio:6.2f}x{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the backend benchmark suite on synthetic data and record JSON")
+    add_generator_arguments(parser)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", "-o", help="JSON results file (default: benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", help="previous results JSON; exits with 1 on a regression")
+    args = parser.parse_args()
+
+    options = generator_options(args)
+    commit = git_commit()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "synthetic.jsonl")
+        records = write_synthetic(path, **options)
+        messages = list(synthetic_messages(**options))
+        print(f"Synthetic data: {records} records, {args.sensors} sensors, commit {commit}")
+        results = run_suite(path, messages, tmp, args.repeat)
+
+    report = {
+        "commit": commit,
+        "created_at": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "dataset": dict(options, records=records),
+        "repeat": args.repeat,
+        "results": results,
+    }
+    output = args.output or os.path.join(os.path.dirname(__file__), "results", f"{commit or 'unknown'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as file:
+        json.dump(report, file, indent=1)
+    print(f"Results written to {output}")
+
+    if args.compare and compare(results, args.compare):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
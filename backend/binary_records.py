@@ -0,0 +1,430 @@
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import json_codec
+from columnar_store import DEFAULT_COLUMNS, INT_COLUMNS, ColumnarStore, SensorColumns, require_numpy
+from ingest_ordering import DeviceOrder
+
+MAGIC = b"TLMBIN01"
+# magic, record size (lets a reader refuse files written with another layout)
+HEADER = struct.Struct("<8sI")
+# received_at, sampledAt, publishedAt, ageReadings, the five readings, sensor code, flags
+RECORD = struct.Struct("<dqqqdddddHB")
+RECORD_FIELDS = ("received_at", "sampledAt", "publishedAt", "ageReadings", "temperatureCelcius",
+                 "temperatureFahrenheit", "humidityPercent", "heatIndexCelcius", "heatIndexFahrenheit", "sensor", "flags")
+INT_FIELDS = ("sampledAt", "publishedAt", "ageReadings")
+FLOAT_FIELDS = ("temperatureCelcius", "temperatureFahrenheit", "humidityPercent", "heatIndexCelcius", "heatIndexFahrenheit")
+INT_MISSING = -(2 ** 63)
+MAX_SENSORS = 0xFFFF
+
+FLAG_READING_VALID = 1
+FLAG_HAS_READING_VALID = 2
+FLAG_NEW_READING = 4
+FLAG_HAS_NEW_READING = 8
+FLAG_READ_FAILED = 16
+FLAG_NO_TOPIC = 32
+# the pre-firmware-update layout put the readings before sampledAt; keeping the order keeps issue lists identical
+FLAG_LEGACY_ORDER = 64
+# "repeated": True, a republished reading (see ingest_ordering)
+FLAG_REPEATED = 128
+
+READ_FAILED_ERROR = "DHT_READ_FAILED"
+KNOWN_KEYS = frozenset(("sensor_id", "isReadingValid", "hasNewReading", "error", "topic") + INT_FIELDS + FLOAT_FIELDS
+                       + ("received_at", "repeated"))
+
+if np is not None:
+    RECORD_DTYPE = np.dtype([
+        ("received_at", "<f8"), ("sampledAt", "<i8"), ("publishedAt", "<i8"), ("ageReadings", "<i8"),
+        ("temperatureCelcius", "<f8"), ("temperatureFahrenheit", "<f8"), ("humidityPercent", "<f8"),
+        ("heatIndexCelcius", "<f8"), ("heatIndexFahrenheit", "<f8"), ("sensor", "<u2"), ("flags", "u1"),
+    ])
+    assert RECORD_DTYPE.itemsize == RECORD.size
+else:
+    RECORD_DTYPE = None
+
+
+def sensors_path_for(path: str) -> str:
+    return path + ".sensors"
+
+
+def topic_for(sensor_id: str) -> str:
+    return f"iot/home/{sensor_id}/telemetry"
+
+
+def _float_field(value) -> float:
+    if isinstance(value, bool):
+        return float("nan")
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return float("nan")
+
+
+def _int_field(value) -> int:
+    if isinstance(value, bool):
+        return INT_MISSING
+    if isinstance(value, int):
+        return value if INT_MISSING < value < 2 ** 63 else INT_MISSING
+    number = _float_field(value)
+    if not number.is_integer():
+        return INT_MISSING
+    return _int_field(int(number))
+
+
+def encode_flags(entry: dict) -> int:
+    flags = 0
+    if "isReadingValid" in entry:
+        flags |= FLAG_HAS_READING_VALID | (FLAG_READING_VALID if entry["isReadingValid"] else 0)
+    if "hasNewReading" in entry:
+        flags |= FLAG_HAS_NEW_READING | (FLAG_NEW_READING if entry["hasNewReading"] else 0)
+    if entry.get("error") == READ_FAILED_ERROR:
+        flags |= FLAG_READ_FAILED
+    if "topic" not in entry:
+        flags |= FLAG_NO_TOPIC
+    keys = list(entry)
+    if "sampledAt" in entry and "temperatureCelcius" in entry and keys.index("temperatureCelcius") < keys.index("sampledAt"):
+        flags |= FLAG_LEGACY_ORDER
+    if entry.get("repeated") is True:
+        flags |= FLAG_REPEATED
+    return flags
+
+
+def is_lossless(entry: dict) -> bool:
+    # fields the binary layout cannot carry: unknown keys, other error strings, non-standard topics
+    if not KNOWN_KEYS.issuperset(entry):
+        return False
+    if "error" in entry and entry["error"] != READ_FAILED_ERROR:
+        return False
+    if "topic" in entry and entry["topic"] != topic_for(entry.get("sensor_id")):
+        return False
+    if "repeated" in entry and entry["repeated"] is not True:
+        return False
+    return True
+
+
+def encode_record(entry: dict, sensor_code: int) -> bytes:
+    return RECORD.pack(
+        _float_field(entry.get("received_at")),
+        *(_int_field(entry.get(key)) for key in INT_FIELDS),
+        *(_float_field(entry.get(key)) for key in FLOAT_FIELDS),
+        sensor_code,
+        encode_flags(entry),
+    )
+
+
+def decode_record(values: tuple, sensor_ids: list[str]) -> dict:
+    received_at, sampled_at, published_at, age, *readings, sensor_code, flags = values
+    sensor_id = sensor_ids[sensor_code]
+    entry = {"sensor_id": sensor_id}
+    if flags & FLAG_HAS_READING_VALID:
+        entry["isReadingValid"] = bool(flags & FLAG_READING_VALID)
+    if flags & FLAG_HAS_NEW_READING:
+        entry["hasNewReading"] = bool(flags & FLAG_NEW_READING)
+    timing = [(key, value) for key, value in zip(INT_FIELDS, (sampled_at, published_at, age)) if value != INT_MISSING]
+    reading_items = [(key, value) for key, value in zip(FLOAT_FIELDS, readings) if value == value]
+    if flags & FLAG_LEGACY_ORDER:
+        entry.update(reading_items)
+        entry.update(timing)
+    else:
+        entry.update(timing)
+        entry.update(reading_items)
+    if flags & FLAG_READ_FAILED:
+        entry["error"] = READ_FAILED_ERROR
+    if received_at == received_at:
+        entry["received_at"] = received_at
+    if not flags & FLAG_NO_TOPIC:
+        entry["topic"] = topic_for(sensor_id)
+    if flags & FLAG_REPEATED:
+        entry["repeated"] = True
+    return entry
+
+
+def load_sensor_ids(path: str) -> list[str]:
+    try:
+        with open(sensors_path_for(path), "r") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return []
+
+
+def save_sensor_ids(path: str, sensor_ids: list[str]) -> None:
+    tmp_path = sensors_path_for(path) + ".tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(sensor_ids, file)
+    os.replace(tmp_path, sensors_path_for(path))
+
+
+class BinaryRecordWriter:
+    # same write/flush/close/stats interface as BufferedJsonlWriter; records are batched in memory and appended on
+    # size or age, and the sensor dictionary is saved before any record that uses a new code
+    def __init__(self, filename: str, max_batch_records: int = 500, max_latency_sec: float = 1.0, fsync: bool = False):
+        self.filename = filename
+        self.max_batch_records = max_batch_records
+        self.max_latency_sec = max_latency_sec
+        self.fsync = fsync
+
+        self.sensor_ids = load_sensor_ids(filename)
+        self._codes = {sensor_id: code for code, sensor_id in enumerate(self.sensor_ids)}
+        self._lock = threading.Lock()
+        self._buffer: list[bytes] = []
+        self._oldest = 0.0
+        self.records_written = 0
+        self.records_dropped = 0
+        self.records_lossy = 0
+        self.bytes_written = 0
+
+        directory = os.path.dirname(filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(filename, "ab")
+        if self._file.tell() == 0:
+            self._file.write(HEADER.pack(MAGIC, RECORD.size))
+            self._file.flush()
+        else:
+            check_header(filename)
+            # drop a torn record left by a crash so every later record stays aligned
+            size = self._file.tell()
+            aligned = HEADER.size + (size - HEADER.size) // RECORD.size * RECORD.size
+            if aligned != size:
+                self._file.truncate(aligned)
+                self._file.seek(aligned)
+
+    def write(self, data: dict) -> bool:
+        sensor_id = data.get("sensor_id")
+        with self._lock:
+            if self._file is None or not sensor_id:
+                self.records_dropped += 1
+                return False
+            code = self._codes.get(sensor_id)
+            if code is None:
+                if len(self.sensor_ids) > MAX_SENSORS:
+                    self.records_dropped += 1
+                    return False
+                code = self._codes[sensor_id] = len(self.sensor_ids)
+                self.sensor_ids.append(sensor_id)
+                save_sensor_ids(self.filename, self.sensor_ids)
+            if not is_lossless(data):
+                self.records_lossy += 1
+            if not self._buffer:
+                self._oldest = time.monotonic()
+            self._buffer.append(encode_record(data, code))
+            if len(self._buffer) >= self.max_batch_records or time.monotonic() - self._oldest >= self.max_latency_sec:
+                self._flush_locked()
+            return True
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is None:
+                return
+            self._flush_locked()
+            self._file.close()
+            self._file = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "filename": self.filename,
+                "records_written": self.records_written,
+                "bytes_written": self.bytes_written,
+                "records_buffered": len(self._buffer),
+                "records_dropped": self.records_dropped,
+                "records_delayed": 0,
+                "records_lossy": self.records_lossy,
+                "sensors": len(self.sensor_ids),
+            }
+
+    def __enter__(self) -> "BinaryRecordWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _flush_locked(self) -> None:
+        if not self._buffer or self._file is None:
+            return
+        chunk = b"".join(self._buffer)
+        self._file.write(chunk)
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self.records_written += len(self._buffer)
+        self.bytes_written += len(chunk)
+        self._buffer = []
+
+
+def check_header(path: str) -> None:
+    with open(path, "rb") as file:
+        header = file.read(HEADER.size)
+    if len(header) < HEADER.size:
+        raise ValueError(f"{path}: not a binary telemetry file (header too short)")
+    magic, record_size = HEADER.unpack(header)
+    if magic != MAGIC or record_size != RECORD.size:
+        raise ValueError(f"{path}: not a binary telemetry file or written with another record layout")
+
+
+class BinaryRecordFile:
+    # read-only mmap of a binary log; records() is a zero-copy structured view over the mapping
+    def __init__(self, path: str):
+        check_header(path)
+        self.path = path
+        self.sensor_ids = load_sensor_ids(path)
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self.count = (size - HEADER.size) // RECORD.size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __enter__(self) -> "BinaryRecordFile":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def records(self) -> "np.ndarray":
+        require_numpy()
+        if not self.count:
+            return np.zeros(0, dtype=RECORD_DTYPE)
+        return np.frombuffer(self._map, dtype=RECORD_DTYPE, count=self.count, offset=HEADER.size)
+
+    def column(self, name: str) -> "np.ndarray":
+        # a strided view, no copy
+        return self.records()[name]
+
+    def iter_entries(self, sensor_ids: list[str] | None = None, start: float | None = None, end: float | None = None):
+        # pure struct decoding, so converting back to dicts works without numpy
+        wanted = None if sensor_ids is None else {code for code, sid in enumerate(self.sensor_ids) if sid in sensor_ids}
+        if not self.count:
+            return
+        body = memoryview(self._map)[HEADER.size:HEADER.size + self.count * RECORD.size]
+        try:
+            for values in RECORD.iter_unpack(body):
+                if wanted is not None and values[-2] not in wanted:
+                    continue
+                if start is not None and not values[0] >= start:
+                    continue
+                if end is not None and not values[0] <= end:
+                    continue
+                yield decode_record(values, self.sensor_ids)
+        finally:
+            body.release()
+
+    def read_entries(self, sensor_ids: list[str] | None = None, start: float | None = None,
+                     end: float | None = None) -> list[dict]:
+        return list(self.iter_entries(sensor_ids, start, end))
+
+    def selection(self, sensor_ids: list[str] | None = None, start: float | None = None,
+                  end: float | None = None) -> "np.ndarray":
+        records = self.records()
+        mask = np.ones(len(records), dtype=bool)
+        if sensor_ids is not None:
+            codes = [code for code, sensor_id in enumerate(self.sensor_ids) if sensor_id in sensor_ids]
+            mask &= np.isin(records["sensor"], codes)
+        if start is not None:
+            mask &= records["received_at"] >= start
+        if end is not None:
+            mask &= records["received_at"] <= end
+        return np.flatnonzero(mask)
+
+    def to_columnar_store(self, sensor_ids: list[str] | None = None, start: float | None = None,
+                          end: float | None = None, columns=DEFAULT_COLUMNS) -> ColumnarStore:
+        # builds the per-sensor columns straight from the mapped records, rows ordered like entries_by_sensor
+        # (ingest_ordering.DeviceOrder, a missing received_at counting as 0), without the repeated readings
+        records = self.records()
+        rows = self.selection(sensor_ids, start, end)
+        store = ColumnarStore(tuple(columns))
+        sensor_codes = records["sensor"][rows]
+        for code in np.unique(sensor_codes):
+            sensor_rows = rows[sensor_codes == code]
+            received_at = records["received_at"][sensor_rows]
+            received_at = np.where(np.isnan(received_at), 0.0, received_at)
+            published, sampled = records["publishedAt"][sensor_rows], records["sampledAt"][sensor_rows]
+            device_ms = np.where(published != INT_MISSING, published, np.where(sampled != 0, sampled, INT_MISSING))
+            device_order = DeviceOrder()
+            keys = [device_order.key_of(None if ms == INT_MISSING else ms, at)
+                    for ms, at in zip(device_ms.tolist(), received_at.tolist())]
+            sensor_rows = sensor_rows[sorted(range(len(keys)), key=keys.__getitem__)]
+            # keyed together with the readings (the epoch follows every record), then left out like in TelemetryAnalyzer
+            sensor_rows = sensor_rows[(records["flags"][sensor_rows] & FLAG_REPEATED) == 0]
+            values = {}
+            valid = {}
+            for column in store.columns:
+                if column not in RECORD_FIELDS:
+                    values[column] = np.zeros(len(sensor_rows))
+                    valid[column] = np.zeros(len(sensor_rows), dtype=bool)
+                    continue
+                data = records[column][sensor_rows]
+                values[column] = data
+                valid[column] = data != INT_MISSING if column in INT_COLUMNS else ~np.isnan(data)
+            sensor_id = self.sensor_ids[code]
+            store.sensors[sensor_id] = SensorColumns.from_arrays(sensor_id, values, valid)
+        return store
+
+
+def convert_jsonl(source: str, dest: str) -> dict:
+    if os.path.exists(dest):
+        os.remove(dest)
+    if os.path.exists(sensors_path_for(dest)):
+        os.remove(sensors_path_for(dest))
+    bad_lines = 0
+    with BinaryRecordWriter(dest, max_batch_records=10_000, max_latency_sec=float("inf")) as writer, \
+            open(source, "rb") as file:
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json_codec.loads(line)
+            except json_codec.DecodeError:
+                bad_lines += 1
+                continue
+            writer.write(entry)
+    stats = writer.stats()
+    stats["bad_lines"] = bad_lines
+    return stats
+
+
+def main():
+    if len(sys.argv) < 3 or sys.argv[1] not in ("convert", "info") or (sys.argv[1] == "convert" and len(sys.argv) != 4):
+        print("Usage: python binary_records.py convert <file.jsonl> <file.bin>")
+        print("       python binary_records.py info <file.bin>")
+        return
+    if sys.argv[1] == "convert":
+        source, dest = sys.argv[2], sys.argv[3]
+        stats = convert_jsonl(source, dest)
+        source_size = os.path.getsize(source)
+        dest_size = os.path.getsize(dest)
+        print(f"{stats['records_written']} records, {stats['sensors']} sensors -> {dest}")
+        print(f"{source_size} bytes -> {dest_size} bytes ({source_size / max(dest_size, 1):.1f}x smaller)")
+        if stats["records_dropped"] or stats["bad_lines"]:
+            print(f"Skipped {stats['records_dropped']} records without sensor_id and {stats['bad_lines']} bad lines")
+        if stats["records_lossy"]:
+            print(f"Warning: {stats['records_lossy']} records had fields the binary format does not keep")
+        return
+    with BinaryRecordFile(sys.argv[2]) as records:
+        print(f"{len(records)} records, {len(records.sensor_ids)} sensors: {', '.join(records.sensor_ids)}")
+
+
+if __name__ == "__main__":
+    main()
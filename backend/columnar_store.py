@@ -0,0 +1,223 @@
+import math
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from aggregation import AggregateTable, OVERALL, exact_mean, parse_quantile, quantile_of_sorted, validate_stats
+
+FLOAT_COLUMNS = ("received_at", "temperatureCelcius", "temperatureFahrenheit", "humidityPercent",
+                 "heatIndexCelcius", "heatIndexFahrenheit")
+INT_COLUMNS = ("sampledAt", "publishedAt", "ageReadings")
+DEFAULT_COLUMNS = FLOAT_COLUMNS + INT_COLUMNS
+
+
+def require_numpy() -> None:
+    if np is None:
+        raise ImportError("The columnar store requires numpy (pip install numpy)")
+
+
+def _to_float(value) -> float | None:
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return None
+
+
+def _to_int(value) -> int | None:
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, int):
+        return value
+    number = _to_float(value)
+    if number is None or not number.is_integer():
+        return None
+    return int(number)
+
+
+class SensorColumns:
+    def __init__(self, sensor_id: str, columns: tuple[str, ...]):
+        require_numpy()
+        self.sensor_id = sensor_id
+        self.length = 0
+        self._capacity = 0
+        self._values: dict[str, "np.ndarray"] = {}
+        self._valid: dict[str, "np.ndarray"] = {}
+        for column in columns:
+            self._add_empty_column(column)
+
+    @classmethod
+    def from_arrays(cls, sensor_id: str, values: dict[str, "np.ndarray"], valid: dict[str, "np.ndarray"]) -> "SensorColumns":
+        sensor_columns = cls(sensor_id, ())
+        lengths = {len(array) for array in values.values()}
+        sensor_columns.length = sensor_columns._capacity = lengths.pop() if lengths else 0
+        for column, array in values.items():
+            dtype = np.int64 if column in INT_COLUMNS else np.float64
+            sensor_columns._values[column] = np.ascontiguousarray(array, dtype=dtype)
+            sensor_columns._valid[column] = np.ascontiguousarray(valid[column], dtype=bool)
+        return sensor_columns
+
+    @property
+    def columns(self) -> tuple[str, ...]:
+        return tuple(self._values)
+
+    def values(self, column: str) -> "np.ndarray":
+        return self._values[column][:self.length]
+
+    def valid(self, column: str) -> "np.ndarray":
+        return self._valid[column][:self.length]
+
+    def valid_values(self, column: str) -> "np.ndarray":
+        return self.values(column)[self.valid(column)]
+
+    def append_entries(self, entries: list[dict]) -> None:
+        if not entries:
+            return
+        start = self.length
+        self._reserve(start + len(entries))
+        for column in self._values:
+            self._fill(column, entries, start)
+        self.length = start + len(entries)
+
+    def add_column(self, column: str, entries: list[dict]) -> None:
+        # entries must be the same rows, in the same order, that built the existing columns
+        self._add_empty_column(column)
+        self._fill(column, entries, 0)
+
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in self._values.values()) + sum(a.nbytes for a in self._valid.values())
+
+    def _add_empty_column(self, column: str) -> None:
+        dtype = np.int64 if column in INT_COLUMNS else np.float64
+        self._values[column] = np.zeros(self._capacity, dtype=dtype)
+        self._valid[column] = np.zeros(self._capacity, dtype=bool)
+
+    def _reserve(self, size: int) -> None:
+        if size <= self._capacity:
+            return
+        capacity = max(size, self._capacity * 2, 16)
+        for column in self._values:
+            values = np.zeros(capacity, dtype=self._values[column].dtype)
+            values[:self.length] = self.values(column)
+            valid = np.zeros(capacity, dtype=bool)
+            valid[:self.length] = self.valid(column)
+            self._values[column] = values
+            self._valid[column] = valid
+        self._capacity = capacity
+
+    def _fill(self, column: str, entries: list[dict], start: int) -> None:
+        convert = _to_int if column in INT_COLUMNS else _to_float
+        converted = [convert(entry[column]) if column in entry else None for entry in entries]
+        valid = np.fromiter((v is not None for v in converted), dtype=bool, count=len(converted))
+        values = np.fromiter((0 if v is None else v for v in converted), dtype=self._values[column].dtype,
+                             count=len(converted))
+        end = start + len(entries)
+        self._values[column][start:end] = values
+        self._valid[column][start:end] = valid
+
+
+class ColumnarStore:
+    def __init__(self, columns: tuple[str, ...] = DEFAULT_COLUMNS):
+        require_numpy()
+        self.columns = tuple(columns)
+        self.sensors: dict[str, SensorColumns] = {}
+
+    @classmethod
+    def from_entries_by_sensor(cls, entries_by_sensor: dict[str, list[dict]], columns=DEFAULT_COLUMNS) -> "ColumnarStore":
+        store = cls(tuple(columns))
+        for sensor_id, entries in entries_by_sensor.items():
+            store.append(sensor_id, entries)
+        return store
+
+    def sensor(self, sensor_id: str) -> SensorColumns | None:
+        return self.sensors.get(sensor_id)
+
+    def append(self, sensor_id: str, entries: list[dict]) -> None:
+        sensor_columns = self.sensors.get(sensor_id)
+        if sensor_columns is None:
+            sensor_columns = SensorColumns(sensor_id, self.columns)
+            self.sensors[sensor_id] = sensor_columns
+        sensor_columns.append_entries(entries)
+
+    def rebuild(self, sensor_id: str, entries: list[dict]) -> None:
+        self.sensors.pop(sensor_id, None)
+        self.append(sensor_id, entries)
+
+    def ensure_columns(self, columns, entries_by_sensor: dict[str, list[dict]]) -> None:
+        missing = [column for column in columns if column not in self.columns]
+        if not missing:
+            return
+        self.columns = self.columns + tuple(missing)
+        for sensor_id, sensor_columns in self.sensors.items():
+            for column in missing:
+                sensor_columns.add_column(column, entries_by_sensor.get(sensor_id, []))
+
+    def nbytes(self) -> int:
+        return sum(sensor_columns.nbytes() for sensor_columns in self.sensors.values())
+
+
+def range_violation_rows(sensor_columns: SensorColumns, column: str, min_value, max_value) -> "np.ndarray":
+    values = sensor_columns.values(column)
+    return np.flatnonzero(sensor_columns.valid(column) & ((values < min_value) | (values > max_value)))
+
+
+def jump_violation_rows(sensor_columns: SensorColumns, column: str, max_jump) -> "np.ndarray":
+    # row i is flagged when it differs from row i-1 by more than max_jump, like the dict loop
+    values = sensor_columns.values(column).astype(np.float64, copy=False)
+    valid = sensor_columns.valid(column)
+    both_valid = valid[1:] & valid[:-1]
+    return np.flatnonzero(both_valid & (np.abs(values[1:] - values[:-1]) > max_jump)) + 1
+
+
+def timestamp_deltas(sensor_columns: SensorColumns, column: str = "received_at") -> "np.ndarray":
+    # between neighbouring rows, in the order the rows are kept (entries_by_sensor's device-clock order)
+    return np.diff(sensor_columns.valid_values(column))
+
+
+def _python_scalar(value):
+    return value.item() if hasattr(value, "item") else value
+
+
+def column_stats(values: "np.ndarray", stats: tuple[str, ...]) -> tuple:
+    count = len(values)
+    sorted_values = None
+    out = []
+    for stat in stats:
+        if stat == "count":
+            out.append(count)
+        elif not count:
+            out.append(0.0 if stat == "sum" else None)
+        elif stat == "sum":
+            out.append(sum(values.tolist()) if values.dtype.kind == "i" else math.fsum(values.tolist()))
+        elif stat == "mean":
+            out.append(exact_mean(values.tolist(), ints=values.dtype.kind == "i"))
+        elif stat == "min":
+            out.append(_python_scalar(values.min()))
+        elif stat == "max":
+            out.append(_python_scalar(values.max()))
+        elif stat == "variance":
+            out.append(float(np.var(values, ddof=1)) if count > 1 else None)
+        elif stat == "stdev":
+            out.append(float(np.std(values, ddof=1)) if count > 1 else None)
+        else:
+            if sorted_values is None:
+                sorted_values = np.sort(values)
+            out.append(_python_scalar(quantile_of_sorted(sorted_values, parse_quantile(stat))))
+    return tuple(out)
+
+
+def aggregate_columns(store: ColumnarStore, keys, stats, include_overall: bool = False) -> AggregateTable:
+    keys = tuple(keys)
+    stats = validate_stats(stats)
+    rows = {}
+    for sensor_id, sensor_columns in store.sensors.items():
+        rows[sensor_id] = {key: column_stats(sensor_columns.valid_values(key), stats) for key in keys}
+    if include_overall:
+        overall = {}
+        for key in keys:
+            parts = [sensor_columns.valid_values(key) for sensor_columns in store.sensors.values()]
+            values = np.concatenate(parts) if parts else np.zeros(0)
+            overall[key] = column_stats(values, stats)
+        rows[OVERALL] = overall
+    return AggregateTable(keys, stats, rows)
@@ -1,7 +1,18 @@
 from datetime import UTC, datetime
+from collections import deque
+from functools import lru_cache
+from typing import Callable
+import argparse
+import os
+import threading
 import time
 import statistics
 
+import json_codec
+from query_server import QueryClient
+from sensor_index import SensorIndex
+from ingest_ordering import IngestOrderer, device_order
+from subscriber_script import DROP_REPEATED_READINGS, ORDERING_WINDOW_SEC
 from telemetry_analyzer import TelemetryAnalyzer
 
 from rich.layout import Layout
@@ -9,11 +20,27 @@ from rich.panel import Panel
 from rich.console import Console
 from rich.live import Live
 from rich.columns import Columns
+from rich.text import Text
 
 
 OFFLINE_TIMEOUT_SEC = 15
 RECENT_N = 20
-
+# the sensor grid is paginated: only the panels that fit on screen are built, pages rotate every PAGE_INTERVAL_SEC
+PAGE_INTERVAL_SEC = 10
+PANEL_WIDTH = 64
+PANEL_HEIGHT = 18
+# snapshots are rebuilt in the background every REFRESH_INTERVAL_SEC, the screen is redrawn RENDER_FPS times a second
+REFRESH_INTERVAL_SEC = 2.0
+RENDER_FPS = 4.0
+TELEMETRY_TOPIC = "iot/home/+/telemetry"
+
+analyzers: dict[str, TelemetryAnalyzer] = {}
+# filename -> sensor_id -> (analyzer sensor version, snapshot parts that only change with new data)
+snapshot_cache: dict[str, dict[str, tuple[int, dict]]] = {}
+# sensor_id -> (snapshot version, panel); only the subtitle (age) is updated on a cache hit
+panel_cache: dict[str, tuple[tuple, Panel]] = {}
+
+@lru_cache(maxsize=4096)
 def timestamp_to_utc(ts: float | int | None) -> str:
     if ts is None:
         return "N/A"
@@ -43,162 +70,397 @@ def compute_stats_from_recent(recent_entries: list[dict], key: str) -> dict:
         "median": statistics.median(vals),
     }
 
-def build_sensor_snapshots(filename: str) -> dict[str, dict]:
-    telemetry = TelemetryAnalyzer(filename)
-    now = time.time()
+def get_analyzer(filename: str) -> TelemetryAnalyzer:
+    # one tail-following analyzer per file, each refresh only parses the lines appended since the last one
+    telemetry = analyzers.get(filename)
+    if telemetry is None:
+        telemetry = TelemetryAnalyzer(filename, follow=True, compute_stats=False)
+        analyzers[filename] = telemetry
+    else:
+        telemetry.refresh()
+    return telemetry
+
+def summarize_sensor(telemetry: TelemetryAnalyzer, sensor_id: str, entries: list[dict],
+                     issues: tuple[list[dict], list[dict]] | None = None) -> dict:
+    # the parts of a snapshot that depend on the data only, recomputed when the sensor gets new entries;
+    # issues: (out of range, sudden change) of the recent entries when the caller already has them
+    if not entries:
+        return {
+            "sensor_id": sensor_id,
+            "last_entry": None,
+            "last_received": None,
+            "last_update_str": "No data",
+            "anomaly_status": "OFFLINE",
+            "reasons": ["NO_DATA"],
+            "stats_last20": {"temperatureCelcius": {}, "humidityPercent": {}},
+            "alerts_last20": [],
+        }
 
-    snapshots: dict[str, dict] = {}
+    recent = entries[-RECENT_N:]
+    last_entry = entries[-1]
+    last_received = float(last_entry.get("received_at", 0.0))
 
-    for sensor_id, entries in telemetry.entries_by_sensor.items():
-        if not entries:
-            snapshots[sensor_id] = {
-                "sensor_id": sensor_id,
-                "last_entry": None,
-                "online": False,
-                "age_sec": None,
-                "last_update_str": "No data",
-                "anomaly_status": "OFFLINE",
-                "reasons": ["NO_DATA"],
-                "stats_last20": {"temperatureCelcius": {}, "humidityPercent": {}},
-                "alerts_last20": [],
-            }
-            continue
+    temp_stats = compute_stats_from_recent(recent, "temperatureCelcius")
+    hum_stats = compute_stats_from_recent(recent, "humidityPercent")
 
-        recent = entries[-RECENT_N:]
-        last_entry = entries[-1]
+    if issues is None:
+        out_range = telemetry.out_of_range_detection_recent(recent)
+        sudden_change = telemetry.sudden_change_detection_recent(recent)
+    else:
+        out_range, sudden_change = issues
+
+    reasons: list[str] = []
+    if out_range:
+        reasons.append("OUT_OF_RANGE_LAST20")
+    if sudden_change:
+        reasons.append("SUDDEN_CHANGE_LAST20")
+
+    alert_lines: list[str] = []
+
+    for issue in out_range[-3:]:
+        entry = issue.get("entry", {})
+        utc_string = timestamp_to_utc(entry.get("received_at"))
+        key = issue.get("key", "unknown")
+        value = issue.get("value", "N/A")
+        valid_range = issue.get("valid_range", ("?", "?"))
+        alert_lines.append(f"{utc_string}  Out of range {key}={value} (valid {valid_range[0]}..{valid_range[1]})")
+
+    for issue in sudden_change[-3:]:
+        entry = issue.get("entry", {})
+        utc_string = timestamp_to_utc(entry.get("received_at"))
+        key = issue.get("key", "unknown")
+        previous_value = issue.get("previous_value", "N/A")
+        current_value = issue.get("value", "N/A")
+        max_jump = issue.get("max_jump", "N/A")
+        alert_lines.append(f"{utc_string}  Sudden change {key}: {previous_value} -> {current_value} (max {max_jump})")
 
-        last_received = float(last_entry.get("received_at", 0.0))
-        age_sec = now - last_received
-        online = age_sec <= OFFLINE_TIMEOUT_SEC
+    return {
+        "sensor_id": sensor_id,
+        "last_entry": last_entry,
+        "last_received": last_received,
+        "last_update_str": timestamp_to_utc(last_received),
+        "anomaly_status": "ANOMALY" if reasons else "OK",
+        "reasons": reasons,
+        "stats_last20": {
+            "temperatureCelcius": temp_stats,
+            "humidityPercent": hum_stats,
+        },
+        "alerts_last20": alert_lines if alert_lines else ["(no alerts in last 20)"],
+    }
 
-        temp_stats = compute_stats_from_recent(recent, "temperatureCelcius")
-        hum_stats = compute_stats_from_recent(recent, "humidityPercent")
 
-        out_range = telemetry.out_of_range_detection_recent(recent)
-        sudden_change = telemetry.sudden_change_detection_recent(recent)
+def build_sensor_snapshots(filename: str) -> dict[str, dict]:
+    telemetry = get_analyzer(filename)
+    now = time.time()
+    cache = snapshot_cache.setdefault(filename, {})
+    for sensor_id in cache.keys() - telemetry.entries_by_sensor.keys():
+        del cache[sensor_id]
 
-        reasons: list[str] = []
-        if out_range:
-            reasons.append("OUT_OF_RANGE_LAST20")
-        if sudden_change:
-            reasons.append("SUDDEN_CHANGE_LAST20")
+    snapshots: dict[str, dict] = {}
 
-        anomaly_status = "ANOMALY" if reasons else "OK"
+    for sensor_id, entries in telemetry.entries_by_sensor.items():
+        data_version = telemetry.sensor_versions.get(sensor_id, 0)
+        cached = cache.get(sensor_id)
+        if cached is None or cached[0] != data_version:
+            cached = (data_version, summarize_sensor(telemetry, sensor_id, entries))
+            cache[sensor_id] = cached
+        snapshots[sensor_id] = finish_snapshot(cached[1], data_version, now)
 
-        if not online:
-            anomaly_status = "OFFLINE"
-            reasons = ["NO_RECENT_DATA"]
+    return snapshots
 
-        alert_lines: list[str] = []
 
-        for issue in out_range[-3:]:
-            entry = issue.get("entry", {})
-            utc_string = timestamp_to_utc(entry.get("received_at"))
-            key = issue.get("key", "unknown")
-            value = issue.get("value", "N/A")
-            valid_range = issue.get("valid_range", ("?", "?"))
-            alert_lines.append(f"{utc_string}  Out of range {key}={value} (valid {valid_range[0]}..{valid_range[1]})")
+def finish_snapshot(summary: dict, data_version: int, now: float) -> dict:
+    # adds the time dependent fields to a cached summary
+    last_received = summary["last_received"]
+    age_sec = now - last_received if last_received is not None else None
+    online = age_sec is not None and age_sec <= OFFLINE_TIMEOUT_SEC
+
+    snapshot = dict(summary, online=online, age_sec=age_sec, version=(data_version, online))
+    if last_received is not None and not online:
+        snapshot["anomaly_status"] = "OFFLINE"
+        snapshot["reasons"] = ["NO_RECENT_DATA"]
+    return snapshot
+
+
+class LiveSensorFeed:
+    # dashboard state fed one message at a time (MQTT or handle_message) instead of re-reading the log: the last
+    # RECENT_N entries of each sensor, each stored with the range / jump issues found when it arrived. Messages go
+    # through the same dedup / reorder stage as in the subscriber first, so the feed sees what the log will hold
+    def __init__(self, recent_n: int = RECENT_N):
+        self.recent_n = recent_n
+        # only used for its detection rules (VALID_RANGES / VALID_CHANGES_JUMPS)
+        self.rules = TelemetryAnalyzer("", entries=[], compute_stats=False)
+        # sensor_id -> deque of (entry, out of range issues, sudden change issues against the previous entry)
+        self._recent: dict[str, deque] = {}
+        self._versions: dict[str, int] = {}
+        self._version = 0
+        self._cache: dict[str, tuple[int, dict]] = {}
+        self._lock = threading.Lock()
+        self.ordering = IngestOrderer(self.add_entry, window_sec=ORDERING_WINDOW_SEC,
+                                      drop_repeated_readings=DROP_REPEATED_READINGS)
+        self.messages = 0
+        self.bad_messages = 0
+
+    def handle_message(self, topic: str, payload: bytes | str, recv_ts: float) -> dict | None:
+        # same record as subscriber_script.process_message builds; None for a bad message or a dropped duplicate
+        try:
+            data = json_codec.loads(payload)
+        except json_codec.DecodeError:
+            data = None
+        parts = topic.split("/")
+        if not isinstance(data, dict) or len(parts) < 3:
+            self.bad_messages += 1
+            return None
+        entry = {"sensor_id": parts[2]}
+        entry.update(data)
+        entry["received_at"] = recv_ts
+        entry["topic"] = topic
+        self.messages += 1
+        return entry if self.ordering.push(entry) else None
+
+    def on_message(self, client, userdata, msg) -> None:
+        self.handle_message(msg.topic, msg.payload, time.time())
+
+    def add_entry(self, entry: dict) -> None:
+        sensor_id = entry.get("sensor_id")
+        # a repeated reading adds nothing to show (and the analyzer behind build_sensor_snapshots skips it too)
+        if not sensor_id or entry.get("repeated"):
+            return
+        out_range = self.rules.out_of_range_detection_recent([entry])
+        with self._lock:
+            recent = self._recent.get(sensor_id)
+            if recent is None:
+                recent = self._recent[sensor_id] = deque(maxlen=self.recent_n)
+            sudden_change = self.rules.sudden_change_detection_recent([recent[-1][0], entry]) if recent else []
+            recent.append((entry, out_range, sudden_change))
+            self._version += 1
+            self._versions[sensor_id] = self._version
+
+    def backfill(self, filename: str) -> int:
+        # cold start: the last RECENT_N entries of every sensor, read through the sidecar index
+        if not os.path.exists(filename):
+            return 0
+        entries = SensorIndex.open(filename, writable=False).read_entries(last_n=self.recent_n)
+        # through the orderer too, so a redelivery of a backfilled message is dropped
+        for entry in device_order(entries):
+            self.ordering.push(entry)
+        self.ordering.flush()
+        return len(entries)
+
+    def snapshots(self) -> dict[str, dict]:
+        now = time.time()
+        # what the ordering window held long enough
+        self.ordering.release(now)
+        with self._lock:
+            changed = [(sensor_id, self._versions[sensor_id], list(recent)) for sensor_id, recent in self._recent.items()
+                       if sensor_id not in self._cache or self._cache[sensor_id][0] != self._versions[sensor_id]]
+            versions = dict(self._versions)
+        for sensor_id, data_version, recent in changed:
+            entries = [item[0] for item in recent]
+            out_range = [issue for item in recent for issue in item[1]]
+            # the first entry's jump was measured against an entry that already left the window
+            sudden_change = [issue for item in recent[1:] for issue in item[2]]
+            self._cache[sensor_id] = (data_version,
+                                      summarize_sensor(self.rules, sensor_id, entries, (out_range, sudden_change)))
+        return {sensor_id: finish_snapshot(self._cache[sensor_id][1], data_version, now)
+                for sensor_id, data_version in versions.items()}
+
+
+class QueryServerFeed:
+    # dashboard state from a running query_server.py, which already holds the log in memory: each call only fetches
+    # the last RECENT_N entries of the sensors that changed since the previous one
+    def __init__(self, client: QueryClient, recent_n: int = RECENT_N):
+        self.client = client
+        self.recent_n = recent_n
+        self.rules = TelemetryAnalyzer("", entries=[], compute_stats=False)
+        self._server_id = None
+        self._version = -1
+        self._cache: dict[str, tuple[int, dict]] = {}
+
+    def snapshots(self) -> dict[str, dict]:
+        recent = self.client.recent(self.recent_n, self._version)
+        if recent["server_id"] != self._server_id:
+            # a different (restarted) server: its versions start over, so everything cached may be stale
+            self._cache.clear()
+            if self._version != -1:
+                recent = self.client.recent(self.recent_n)
+            self._server_id = recent["server_id"]
+        now = time.time()
+        for sensor_id in self._cache.keys() - set(recent["sensor_ids"]):
+            del self._cache[sensor_id]
+        for sensor_id, sensor in recent["sensors"].items():
+            self._cache[sensor_id] = (sensor["version"], summarize_sensor(self.rules, sensor_id, sensor["entries"]))
+        self._version = recent["version"]
+        return {sensor_id: finish_snapshot(summary, data_version, now)
+                for sensor_id, (data_version, summary) in sorted(self._cache.items())}
+
+
+def render_sensor_panel(s: dict) -> Panel:
+    sensor_id = s["sensor_id"]
+    state = "ONLINE" if s["online"] else "OFFLINE"
+
+    last = s["last_entry"]
+    anomaly_status = s["anomaly_status"]
+    reasons = s["reasons"]
+    alerts = s["alerts_last20"]
+
+    if anomaly_status == "OFFLINE":
+        border = "bright_red"
+    elif anomaly_status == "ANOMALY":
+        border = "bright_yellow"
+    else:
+        border = "green"
+
+    if last:
+        temp = last.get("temperatureCelcius", "N/A")
+        hum = last.get("humidityPercent", "N/A")
+        received_str = s["last_update_str"]
+    else:
+        temp = hum = "N/A"
+        received_str = "No data"
+
+    reasons_str = ", ".join(reasons) if reasons else "(none)"
+
+    temp_stats = s["stats_last20"]["temperatureCelcius"]
+    humid_stats = s["stats_last20"]["humidityPercent"]
+
+    def format_numeric_stats_for_display(v):
+        return "N/A" if v is None else f"{v:.2f}"
+
+    stats_text = (
+        f"Temperature (last 20): mean = {format_numeric_stats_for_display(temp_stats.get('mean'))}   "
+        f"min ={format_numeric_stats_for_display(temp_stats.get('min'))}  "
+        f"max = {format_numeric_stats_for_display(temp_stats.get('max'))}  "
+        f"med = {format_numeric_stats_for_display(temp_stats.get('median'))}\n"
+        f"Humidity (last 20): mean = {format_numeric_stats_for_display(humid_stats.get('mean'))}  "
+        f"min = {format_numeric_stats_for_display(humid_stats.get('min'))}  "
+        f"max = {format_numeric_stats_for_display(humid_stats.get('max'))}  "
+        f"med = {format_numeric_stats_for_display(humid_stats.get('median'))}   "
+    )
 
-        for issue in sudden_change[-3:]:
-            entry = issue.get("entry", {})
-            utc_string = timestamp_to_utc(entry.get("received_at"))
-            key = issue.get("key", "unknown")
-            previous_value = issue.get("previous_value", "N/A")
-            current_value = issue.get("value", "N/A")
-            max_jump = issue.get("max_jump", "N/A")
-            alert_lines.append(f"{utc_string}  Sudden change {key}: {previous_value} -> {current_value} (max {max_jump})")
+    alerts_text = "\n".join(alerts[-6:])
+
+    # the age changes every frame, so it lives in the subtitle and the body is only rebuilt when the data changes
+    text = (
+        f"[bold]{sensor_id}[/bold]  {state}\n"
+        f"Last update: {received_str}\n"
+        f"Last values: Temp={temp} °C | Humidity={hum} %\n"
+        f"Status: {anomaly_status} | reasons: {reasons_str}\n"
+        "\n"
+        f"[bold]Stats (last {RECENT_N})[/bold]\n"
+        f"{stats_text}\n"
+        "\n"
+        f"[bold]Alerts (from last {RECENT_N})[/bold]\n"
+        f"{alerts_text}"
+    )
 
-        last_update_str = timestamp_to_utc(last_received)
+    return Panel(Text.from_markup(text), border_style=border, subtitle_align="right")
 
-        snapshots[sensor_id] = {
-            "sensor_id": sensor_id,
-            "last_entry": last_entry,
-            "online": online,
-            "age_sec": age_sec,
-            "last_update_str": last_update_str,
-            "anomaly_status": anomaly_status,
-            "reasons": reasons,
-            "stats_last20": {
-                "temperatureCelcius": temp_stats,
-                "humidityPercent": hum_stats,
-            },
-            "alerts_last20": alert_lines if alert_lines else ["(no alerts in last 20)"],
-        }
 
-    return snapshots
+def page_count(total: int, page_size: int | None) -> int:
+    return max(1, -(-total // page_size)) if page_size else 1
+
+
+def build_sensor_panels(snapshot_by_sensor: dict[str, dict], page: int = 0, page_size: int | None = None,
+                        now: float | None = None) -> Columns:
+    sensor_ids = sorted(snapshot_by_sensor.keys())
+    if page_size:
+        page %= page_count(len(sensor_ids), page_size)
+        sensor_ids = sensor_ids[page * page_size:(page + 1) * page_size]
 
+    for sensor_id in panel_cache.keys() - snapshot_by_sensor.keys():
+        del panel_cache[sensor_id]
 
-def build_sensor_panels(snapshot_by_sensor: dict[str, dict]) -> Columns:
     panels = []
-    for sensor_id in sorted(snapshot_by_sensor.keys()):
+    for sensor_id in sensor_ids:
         s = snapshot_by_sensor[sensor_id]
-
-        online = s["online"]
-        state = "ONLINE" if online else "OFFLINE"
-        age = s["age_sec"]
-
-        last = s["last_entry"]
-        anomaly_status = s["anomaly_status"]
-        reasons = s["reasons"]
-        alerts = s["alerts_last20"]
-
-        if anomaly_status == "OFFLINE":
-            border = "bright_red"
-        elif anomaly_status == "ANOMALY":
-            border = "bright_yellow"
-        else:
-            border = "green"
-
-        if last:
-            temp = last.get("temperatureCelcius", "N/A")
-            hum = last.get("humidityPercent", "N/A")
-            received_str = s["last_update_str"]
-        else:
-            temp = hum = "N/A"
-            received_str = "No data"
-
-        reasons_str = ", ".join(reasons) if reasons else "(none)"
-        age_str = f"{age:.1f}s" if age is not None else "N/A"
-
-        temp_stats = s["stats_last20"]["temperatureCelcius"]
-        humid_stats = s["stats_last20"]["humidityPercent"]
-
-        def format_numeric_stats_for_display(v):
-            return "N/A" if v is None else f"{v:.2f}"
-
-        stats_text = (
-            f"Temperature (last 20): mean = {format_numeric_stats_for_display(temp_stats.get('mean'))}   "
-            f"min ={format_numeric_stats_for_display(temp_stats.get('min'))}  "
-            f"max = {format_numeric_stats_for_display(temp_stats.get('max'))}  "
-            f"med = {format_numeric_stats_for_display(temp_stats.get('median'))}\n"
-            f"Humidity (last 20): mean = {format_numeric_stats_for_display(humid_stats.get('mean'))}  "
-            f"min = {format_numeric_stats_for_display(humid_stats.get('min'))}  "
-            f"max = {format_numeric_stats_for_display(humid_stats.get('max'))}  "
-            f"med = {format_numeric_stats_for_display(humid_stats.get('median'))}   "
-        )
-
-        alerts_text = "\n".join(alerts[-6:])
-
-        text = (
-            f"[bold]{sensor_id}[/bold]  {state}\n"
-            f"Last update: {received_str} | age: {age_str}\n"
-            f"Last values: Temp={temp} °C | Humidity={hum} %\n"
-            f"Status: {anomaly_status} | reasons: {reasons_str}\n"
-            "\n"
-            f"[bold]Stats (last {RECENT_N})[/bold]\n"
-            f"{stats_text}\n"
-            "\n"
-            f"[bold]Alerts (from last {RECENT_N})[/bold]\n"
-            f"{alerts_text}"
-        )
-
-        panels.append(Panel(text, border_style=border))
+        cached = panel_cache.get(sensor_id)
+        if cached is None or cached[0] != s["version"]:
+            cached = (s["version"], render_sensor_panel(s))
+            panel_cache[sensor_id] = cached
+        panel = cached[1]
+        # ages are recomputed at draw time when the snapshot is older than the frame
+        age = s["age_sec"] if now is None or s["last_received"] is None else now - s["last_received"]
+        panel.subtitle = f"age: {age:.1f}s" if age is not None else "age: N/A"
+        panels.append(panel)
 
     return Columns(panels, expand=True)
 
 
-def build_layout(filename: str) -> Layout:
-    snapshot_by_sensor = build_sensor_snapshots(filename)
+def panels_per_page(console: Console) -> int:
+    columns = max(1, console.width // PANEL_WIDTH)
+    rows = max(1, (console.height - 6) // PANEL_HEIGHT)
+    return columns * rows
+
+
+def take_snapshot(filename: str, source: Callable[[], dict[str, dict]] | None = None) -> dict:
+    start = time.perf_counter()
+    sensors = source() if source is not None else build_sensor_snapshots(filename)
+    return {"sensors": sensors, "built_at": time.time(), "build_sec": time.perf_counter() - start, "error": None}
+
+
+class SnapshotProducer:
+    # rebuilds the sensor snapshots on its own thread and publishes each one by swapping self.latest, so a slow
+    # parse never blocks drawing and the refresh interval does not drift by the build time
+    def __init__(self, filename: str, interval_sec: float = REFRESH_INTERVAL_SEC,
+                 source: Callable[[], dict[str, dict]] | None = None):
+        self.filename = filename
+        self.interval_sec = interval_sec
+        # builds the sensor snapshots, e.g. LiveSensorFeed.snapshots; the file at filename by default
+        self.source = source
+        # {"sensors", "built_at", "build_sec", "error"}; replaced as a whole, never mutated after publishing
+        self.latest: dict | None = None
+        self.builds = 0
+        self.errors = 0
+        self._stop = threading.Event()
+        self._published = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"snapshot-producer:{filename}", daemon=True)
+
+    def start(self) -> "SnapshotProducer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def wait_for_snapshot(self, timeout: float | None = None) -> dict | None:
+        self._published.wait(timeout)
+        return self.latest
+
+    def build_once(self) -> dict:
+        start = time.perf_counter()
+        try:
+            self.latest = take_snapshot(self.filename, self.source)
+        except Exception as e:
+            # keep showing the last good sensors, flagged with the error
+            self.errors += 1
+            sensors = self.latest["sensors"] if self.latest else {}
+            self.latest = {"sensors": sensors, "built_at": time.time(), "build_sec": time.perf_counter() - start,
+                           "error": f"{type(e).__name__}: {e}"}
+        self.builds += 1
+        self._published.set()
+        return self.latest
+
+    def _run(self) -> None:
+        next_due = time.monotonic()
+        while not self._stop.is_set():
+            self.build_once()
+            next_due += self.interval_sec
+            now = time.monotonic()
+            if next_due < now:
+                # a build took longer than the interval: start the next one right away instead of catching up
+                next_due = now
+            self._stop.wait(next_due - now)
+
+
+def build_layout(filename: str, page: int = 0, page_size: int | None = None, snapshot: dict | None = None,
+                 refresh_interval_sec: float | None = None) -> Layout:
+    if snapshot is None:
+        snapshot = take_snapshot(filename)
+    snapshot_by_sensor = snapshot["sensors"]
+    now = time.time()
 
     total = len(snapshot_by_sensor)
     online_count = sum(1 for s in snapshot_by_sensor.values() if s["online"])
@@ -209,27 +471,88 @@ def build_layout(filename: str) -> Layout:
         f"[bold]IoT Dashboard[/bold] | File: {filename} | Window: last {RECENT_N}\n"
         f"Sensors: {total} | Online: {online_count} | Offline: {offline_count} | Anomaly: {anomaly_count}"
     )
+    pages = page_count(total, page_size)
+    if pages > 1:
+        page %= pages
+        first = page * page_size + 1
+        header_text += f" | Page {page + 1}/{pages} (sensors {first}-{min(first + page_size - 1, total)})"
+    header_text += (f"\nSnapshot age: {now - snapshot['built_at']:.1f}s | build: {snapshot['build_sec'] * 1000:.0f} ms"
+                    + (f" | refresh every {refresh_interval_sec:g}s" if refresh_interval_sec else ""))
+    if snapshot["error"]:
+        header_text += f" | [bright_red]refresh failed: {snapshot['error']}[/bright_red]"
 
     layout = Layout()
     layout.split_column(
-        Layout(name="header", size=4),
+        Layout(name="header", size=5),
         Layout(name="body"),
     )
 
     layout["header"].update(Panel(header_text, border_style="cyan"))
-    layout["body"].update(Panel(build_sensor_panels(snapshot_by_sensor), title="Sensors", border_style="magenta"))
+    layout["body"].update(Panel(build_sensor_panels(snapshot_by_sensor, page, page_size, now), title="Sensors",
+                                border_style="magenta"))
 
     return layout
 
 
+def connect_live_feed(feed: LiveSensorFeed):
+    # subscribes the feed to the broker the subscriber uses (config.py)
+    import config
+    import paho.mqtt.client as mqtt
+
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+    client.tls_set()
+    client.username_pw_set(config.MQTT_USERNAME, config.MQTT_PASSWORD)
+    client.on_connect = lambda client, userdata, flags, reason_code, properties: client.subscribe(TELEMETRY_TOPIC)
+    client.on_message = feed.on_message
+    client.connect(config.MQTT_BROKER, config.MQTT_PORT)
+    client.loop_start()
+    return client
+
+
 def main():
+    parser = argparse.ArgumentParser(description="Live terminal dashboard of the sensors in a telemetry file")
+    parser.add_argument("filename", nargs="?", default="data/data.jsonl")
+    parser.add_argument("--refresh", type=float, default=REFRESH_INTERVAL_SEC, help="seconds between snapshot rebuilds")
+    parser.add_argument("--fps", type=float, default=RENDER_FPS, help="screen redraws per second")
+    parser.add_argument("--page-interval", type=float, default=PAGE_INTERVAL_SEC, help="seconds before the next page")
+    parser.add_argument("--mqtt", action="store_true",
+                        help=f"subscribe to {TELEMETRY_TOPIC} directly; the file is only read once for backfill")
+    parser.add_argument("--server", metavar="URL",
+                        help="read from a running query_server.py (e.g. http://127.0.0.1:9110) instead of the file")
+    args = parser.parse_args()
+
     console = Console()
-    filename = "data/data.jsonl"
+    client = None
+    source = None
+    label = args.filename
+    if args.mqtt:
+        feed = LiveSensorFeed()
+        backfilled = feed.backfill(args.filename)
+        client = connect_live_feed(feed)
+        source = feed.snapshots
+        label = f"MQTT {TELEMETRY_TOPIC} (backfilled {backfilled} entries from {args.filename})"
+    elif args.server:
+        source = QueryServerFeed(QueryClient(args.server)).snapshots
+        label = f"query server {args.server}"
+    producer = SnapshotProducer(args.filename, args.refresh, source).start()
+    producer.wait_for_snapshot()
+
+    def current_layout() -> Layout:
+        return build_layout(label, int(time.time() // args.page_interval), panels_per_page(console),
+                            producer.latest, args.refresh)
 
-    with Live(build_layout(filename), console=console, refresh_per_second=2, screen=True) as live:
-        while True:
-            live.update(build_layout(filename))
-            time.sleep(2)
+    try:
+        with Live(current_layout(), console=console, auto_refresh=False, screen=True) as live:
+            while True:
+                live.update(current_layout(), refresh=True)
+                time.sleep(1 / args.fps)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        producer.stop()
+        if client is not None:
+            client.loop_stop()
+            client.disconnect()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,209 @@
+import argparse
+import json
+import math
+
+from aggregation import to_number
+from columnar_store import ColumnarStore, np, require_numpy
+
+PERCENTILES = (50, 95, 99)
+
+
+def arrival_times(entries_by_sensor: dict[str, list[dict]],
+                  columns: ColumnarStore | None = None) -> dict[str, "np.ndarray"]:
+    # received_at per sensor, in entries_by_sensor's (device-clock) order: a reconnect burst arrives within
+    # milliseconds, so only a record delivered much later than its neighbours shows up out of time order
+    require_numpy()
+    times = {}
+    for sensor_id, entries in entries_by_sensor.items():
+        sensor_columns = columns.sensor(sensor_id) if columns is not None and "received_at" in columns.columns else None
+        if sensor_columns is not None:
+            times[sensor_id] = sensor_columns.valid_values("received_at")
+            continue
+        try:
+            values = np.array([entry.get("received_at") for entry in entries], dtype=float)
+        except (ValueError, TypeError):
+            values = np.array([to_number(entry.get("received_at")) for entry in entries], dtype=float)
+        times[sensor_id] = values[~np.isnan(values)]
+    return times
+
+
+def group_percentiles(values: "np.ndarray", starts: "np.ndarray", counts: "np.ndarray", q: float) -> "np.ndarray":
+    # linear-interpolated percentile of every group at once; values sorted within each group; NaN for empty groups
+    result = np.full(len(counts), np.nan)
+    present = counts > 0
+    position = starts[present] + (counts[present] - 1) * (q / 100)
+    low = np.floor(position).astype(np.int64)
+    high = np.minimum(low + 1, starts[present] + counts[present] - 1)
+    fraction = position - low
+    result[present] = values[low] + (values[high] - values[low]) * fraction
+    return result
+
+
+def delivery_report(times_by_sensor: dict[str, "np.ndarray"], expected_interval_sec: float, tolerance: float,
+                    bucket_sec: float | None = None) -> dict:
+    # every sensor in one pass over the concatenated arrival times: inter-arrival deltas, gaps (deltas above
+    # expected * tolerance, the detect_missing_messages rule), estimated missed messages, jitter and the longest
+    # outage; with bucket_sec also the messages received per time bucket (uptime charts)
+    require_numpy()
+    sensor_ids = sorted(times_by_sensor)
+    counts = np.array([len(times_by_sensor[sensor_id]) for sensor_id in sensor_ids], dtype=np.int64)
+    all_times = np.concatenate([times_by_sensor[sensor_id] for sensor_id in sensor_ids]) if sensor_ids else np.empty(0)
+    codes = np.repeat(np.arange(len(sensor_ids)), counts)
+    record_starts = np.concatenate(([0], np.cumsum(counts)[:-1])) if len(counts) else np.empty(0, dtype=np.int64)
+
+    # deltas between neighbours of the same sensor
+    deltas = np.diff(all_times)
+    delta_codes = codes[1:]
+    same_sensor = codes[1:] == codes[:-1]
+    deltas, delta_codes = deltas[same_sensor], delta_codes[same_sensor]
+    previous_times = all_times[:-1][same_sensor]
+    n_sensors = len(sensor_ids)
+    delta_counts = np.bincount(delta_codes, minlength=n_sensors)
+
+    gap_mask = deltas > expected_interval_sec * tolerance
+    missing = np.where(gap_mask, np.round(deltas / expected_interval_sec) - 1, 0)
+    gap_counts = np.bincount(delta_codes[gap_mask], minlength=n_sensors)
+    missing_counts = np.bincount(delta_codes, weights=missing, minlength=n_sensors)
+    outage_sec = np.bincount(delta_codes[gap_mask], weights=deltas[gap_mask] - expected_interval_sec,
+                             minlength=n_sensors)
+    delta_sum = np.bincount(delta_codes, weights=deltas, minlength=n_sensors)
+    delta_sumsq = np.bincount(delta_codes, weights=deltas * deltas, minlength=n_sensors)
+
+    # the deltas are grouped by sensor already, so sorting each group in place is enough for the percentiles (and
+    # much cheaper than a lexsort over the whole fleet); the longest gap is the group maximum. Outages count the time
+    # past the expected interval, for the longest one as for outage_sec
+    delta_starts = np.concatenate(([0], np.cumsum(delta_counts)[:-1])) if n_sensors else np.empty(0, dtype=np.int64)
+    sorted_deltas = deltas.copy()
+    jitter = np.abs(deltas - expected_interval_sec)
+    longest_by_code = {}
+    for code in np.flatnonzero(delta_counts > 0).tolist():
+        group = slice(delta_starts[code], delta_starts[code] + delta_counts[code])
+        longest_at = int(np.argmax(deltas[group]))
+        longest_by_code[code] = (float(deltas[group][longest_at]) - expected_interval_sec,
+                                 float(previous_times[group][longest_at]))
+        sorted_deltas[group].sort()
+        jitter[group].sort()
+    interval_percentiles = {q: group_percentiles(sorted_deltas, delta_starts, delta_counts, q) for q in PERCENTILES}
+    jitter_percentiles = {q: group_percentiles(jitter, delta_starts, delta_counts, q) for q in PERCENTILES}
+
+    sensors = {}
+    for code, sensor_id in enumerate(sensor_ids):
+        records = int(counts[code])
+        n_deltas = int(delta_counts[code])
+        first = float(all_times[record_starts[code]]) if records else None
+        last = float(all_times[record_starts[code] + records - 1]) if records else None
+        span = last - first if records else 0.0
+        missing_messages = int(missing_counts[code])
+        mean = delta_sum[code] / n_deltas if n_deltas else None
+        stdev = math.sqrt(max(delta_sumsq[code] / n_deltas - mean * mean, 0.0) * n_deltas / (n_deltas - 1)) \
+            if n_deltas > 1 else None
+        is_gap = bool(gap_counts[code])
+        sensors[sensor_id] = {
+            "records": records,
+            "first_received_at": first,
+            "last_received_at": last,
+            "span_sec": span,
+            "gaps": int(gap_counts[code]),
+            "missing_messages": missing_messages,
+            "expected_records": records + missing_messages,
+            "delivery_ratio": records / (records + missing_messages) if records else None,
+            "outage_sec": float(outage_sec[code]),
+            "uptime_ratio": 1 - float(outage_sec[code]) / span if span > 0 else None,
+            "longest_outage_sec": longest_by_code[code][0] if is_gap else 0.0,
+            "longest_outage_start": longest_by_code[code][1] if is_gap else None,
+            "interval_mean": mean,
+            "interval_stdev": stdev,
+            "interval_percentiles": {f"p{q}": _optional(interval_percentiles[q][code]) for q in PERCENTILES},
+            "jitter_percentiles": {f"p{q}": _optional(jitter_percentiles[q][code]) for q in PERCENTILES},
+        }
+
+    total_records = int(counts.sum())
+    total_missing = sum(sensor["missing_messages"] for sensor in sensors.values())
+    report = {
+        "expected_interval_sec": expected_interval_sec,
+        "tolerance": tolerance,
+        "sensors": sensors,
+        "fleet": {
+            "sensors": n_sensors,
+            "records": total_records,
+            "gaps": int(gap_counts.sum()),
+            "missing_messages": total_missing,
+            "delivery_ratio": total_records / (total_records + total_missing) if total_records else None,
+            "longest_outage_sec": max((sensor["longest_outage_sec"] for sensor in sensors.values()), default=0.0),
+        },
+    }
+    if bucket_sec:
+        report["buckets"] = bucket_counts(all_times, codes, sensor_ids, bucket_sec, expected_interval_sec)
+    return report
+
+
+def bucket_counts(all_times: "np.ndarray", codes: "np.ndarray", sensor_ids: list[str], bucket_sec: float,
+                  expected_interval_sec: float) -> dict:
+    # messages received per sensor per bucket, aligned on multiples of bucket_sec; uptime = received / expected
+    if not len(all_times):
+        return {"bucket_sec": bucket_sec, "start": None, "expected_per_bucket": bucket_sec / expected_interval_sec,
+                "sensors": {}}
+    start = math.floor(all_times.min() / bucket_sec) * bucket_sec
+    bucket = ((all_times - start) // bucket_sec).astype(np.int64)
+    n_buckets = int(bucket.max()) + 1
+    flat = np.bincount(codes * n_buckets + bucket, minlength=len(sensor_ids) * n_buckets)
+    table = flat.reshape(len(sensor_ids), n_buckets)
+    expected = bucket_sec / expected_interval_sec
+    return {
+        "bucket_sec": bucket_sec,
+        "start": start,
+        "expected_per_bucket": expected,
+        "sensors": {sensor_id: {"received": table[code].tolist(),
+                                "uptime": np.minimum(table[code] / expected, 1.0).round(4).tolist()}
+                    for code, sensor_id in enumerate(sensor_ids)},
+    }
+
+
+def format_report(report: dict) -> str:
+    lines = [f"{'sensor':12} {'records':>8} {'gaps':>6} {'missing':>8} {'delivery':>9} {'uptime':>7} "
+             f"{'longest gap':>12} {'p50':>7} {'p99':>7} {'jitter p99':>10}"]
+    for sensor_id, sensor in report["sensors"].items():
+        lines.append(
+            f"{sensor_id:12} {sensor['records']:8d} {sensor['gaps']:6d} {sensor['missing_messages']:8d} "
+            f"{_percent(sensor['delivery_ratio']):>9} {_percent(sensor['uptime_ratio']):>7} "
+            f"{sensor['longest_outage_sec']:11.1f}s {_seconds(sensor['interval_percentiles']['p50']):>7} "
+            f"{_seconds(sensor['interval_percentiles']['p99']):>7} {_seconds(sensor['jitter_percentiles']['p99']):>10}")
+    fleet = report["fleet"]
+    lines.append(f"Fleet: {fleet['sensors']} sensors, {fleet['records']} records, {fleet['gaps']} gaps, "
+                 f"{fleet['missing_messages']} missing, delivery {_percent(fleet['delivery_ratio'])}, "
+                 f"longest outage {fleet['longest_outage_sec']:.1f}s")
+    return "\n".join(lines)
+
+
+def _optional(value) -> float | None:
+    return None if value != value else float(value)
+
+
+def _percent(value: float | None) -> str:
+    return "N/A" if value is None else f"{value * 100:.1f}%"
+
+
+def _seconds(value: float | None) -> str:
+    return "N/A" if value is None else f"{value:.2f}s"
+
+
+def main():
+    # imported here: telemetry_analyzer imports this module for TelemetryAnalyzer.delivery_report
+    from telemetry_analyzer import EXPECTED_MESSAGE_INTERVAL_SECONDS, TOLERANCE_MESSAGE_INTERVAL, TelemetryAnalyzer
+
+    parser = argparse.ArgumentParser(description="Delivery quality (gaps, missed messages, jitter) of every sensor")
+    parser.add_argument("filename", nargs="?", default="data/data.jsonl")
+    parser.add_argument("--interval", type=float, default=EXPECTED_MESSAGE_INTERVAL_SECONDS,
+                        help="expected seconds between messages")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE_MESSAGE_INTERVAL)
+    parser.add_argument("--bucket", type=float, help="also count messages per bucket of this many seconds")
+    parser.add_argument("--json", action="store_true", help="print the full report as JSON")
+    args = parser.parse_args()
+
+    telemetry = TelemetryAnalyzer(args.filename, compute_stats=False, fields=("received_at",))
+    report = telemetry.delivery_report(args.interval, args.tolerance, args.bucket)
+    print(json.dumps(report, indent=1) if args.json else format_report(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+import heapq
+import itertools
+import threading
+from typing import Callable
+
+import metrics
+from aggregation import to_number
+
+DEFAULT_WINDOW_SEC = 2.0
+DEFAULT_DEDUP_SIZE = 256
+# sampledAt / publishedAt are millis since boot: going back by more than this (far beyond any broker delay) is a
+# reboot (or the 49.7 day millis() wrap-around), not a late message
+DEFAULT_REBOOT_BACKWARDS_MS = 30_000
+DUPLICATE = "duplicate"
+REPEATED = "repeated"
+
+
+class SensorOrdering:
+    __slots__ = ("lock", "epoch", "heap", "seen_published", "seen_sampled", "max_published", "max_sampled",
+                 "max_received", "last_emitted", "accepted", "duplicates", "repeated_readings", "late", "reboots")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # bumped on every detected reboot; part of the ordering key so a new boot sorts after the old one
+        self.epoch = 0
+        self.heap: list[tuple] = []
+        # bounded recent-key sets (dicts keep insertion order, so the oldest key is evicted first)
+        self.seen_published: dict[float, None] = {}
+        self.seen_sampled: dict[float, None] = {}
+        self.max_published: float | None = None
+        self.max_sampled: float | None = None
+        self.max_received = float("-inf")
+        self.last_emitted: tuple | None = None
+        # counted under lock, summed by IngestOrderer.stats()
+        self.accepted = 0
+        self.duplicates = 0
+        self.repeated_readings = 0
+        self.late = 0
+        self.reboots = 0
+
+
+class IngestOrderer:
+    # sits between decoding and persisting: drops QoS redeliveries (same publishedAt), flags republished readings
+    # (same sampledAt) with "repeated": True, or drops them with drop_repeated_readings, holds records for window_sec
+    # and emits each sensor's records in device-clock order, and starts a new epoch when the device clock goes
+    # backwards (reboot). Records are released once the newest received_at seen (fleet-wide, or the clock passed to
+    # release()) is window_sec past theirs; a record younger than one still held with an earlier device time can
+    # wait up to twice the window. Work per record is O(1) for the dedup and reboot checks plus O(log k) for the
+    # heap, k being the handful of records a sensor publishes within the window
+    def __init__(self, emit: Callable[[dict], None], window_sec: float = DEFAULT_WINDOW_SEC,
+                 dedup_size: int = DEFAULT_DEDUP_SIZE, drop_repeated_readings: bool = False,
+                 reboot_backwards_ms: float = DEFAULT_REBOOT_BACKWARDS_MS,
+                 on_reboot: Callable[[str, dict], None] | None = None):
+        self.emit = emit
+        self.window_sec = window_sec
+        self.dedup_size = dedup_size
+        self.drop_repeated_readings = drop_repeated_readings
+        self.reboot_backwards_ms = reboot_backwards_ms
+        self.on_reboot = on_reboot
+
+        self._sensors: dict[str, SensorOrdering] = {}
+        self._sensors_lock = threading.Lock()
+        # only moves forward: the workers and the periodic release() advance it under the lock, so a stale value
+        # never overwrites a newer one (reading it without the lock is fine)
+        self._watermark_at = float("-inf")
+        self._watermark_lock = threading.Lock()
+        # tie-breaker for records with the same key (a retransmission with dedup disabled by dedup_size=0)
+        self._seq = itertools.count()
+
+    def push(self, record: dict) -> bool:
+        # False when the record was dropped as a duplicate
+        sensor_id = record.get("sensor_id")
+        received_at = record.get("received_at")
+        if not sensor_id or received_at is None:
+            self.emit(record)
+            return True
+        self._advance_watermark(received_at)
+        state = self._state(sensor_id)
+        with state.lock:
+            published = _device_ms(record.get("publishedAt"))
+            sampled = _device_ms(record.get("sampledAt"))
+            # only a record received after everything else from the sensor can start a new boot; an older one that
+            # a busy worker handed over late is just out of order
+            if received_at >= state.max_received:
+                state.max_received = received_at
+                if self._is_reboot(state, published, sampled):
+                    self._reboot(sensor_id, state, record)
+            seen = self._dedup(sensor_id, state, published, sampled)
+            if seen is not None:
+                if seen is DUPLICATE or self.drop_repeated_readings:
+                    return False
+                # a delivered message, but not a new reading: readers count it for delivery and skip it for values
+                record["repeated"] = True
+            state.accepted += 1
+            device_ms = published if published is not None else sampled
+            if device_ms is None:
+                # nothing to order by
+                self._release(state, float("inf"))
+                self.emit(record)
+                return True
+            key = (state.epoch, device_ms)
+            if state.last_emitted is not None and key < state.last_emitted:
+                # arrived after a later record was already released: too late to reorder
+                state.late += 1
+                metrics.inc("late_records_total", sensor_id=sensor_id)
+                self.emit(record)
+                return True
+            heapq.heappush(state.heap, (key, next(self._seq), received_at, record))
+            self._release(state, self._watermark_at - self.window_sec)
+        return True
+
+    def release(self, now: float | None = None) -> int:
+        # emits what is due for every sensor with held records; call periodically so a sensor that went quiet does
+        # not keep its last records. now=None uses the newest received_at seen
+        watermark_at = self._advance_watermark(now) if now is not None else self._watermark_at
+        return self._release_pending(watermark_at - self.window_sec)
+
+    def flush(self) -> int:
+        # emits everything still held (shutdown)
+        return self._release_pending(float("inf"))
+
+    def stats(self) -> dict:
+        with self._sensors_lock:
+            states = list(self._sensors.values())
+        stats = {"sensors": len(states), "pending": sum(len(state.heap) for state in states)}
+        for name in ("accepted", "duplicates", "repeated_readings", "late", "reboots"):
+            stats[name] = sum(getattr(state, name) for state in states)
+        return stats
+
+    def reboots_by_sensor(self) -> dict[str, int]:
+        with self._sensors_lock:
+            return {sensor_id: state.reboots for sensor_id, state in self._sensors.items() if state.reboots}
+
+    def _state(self, sensor_id: str) -> SensorOrdering:
+        state = self._sensors.get(sensor_id)
+        if state is None:
+            with self._sensors_lock:
+                state = self._sensors.get(sensor_id)
+                if state is None:
+                    state = self._sensors[sensor_id] = SensorOrdering()
+        return state
+
+    def _advance_watermark(self, received_at: float) -> float:
+        with self._watermark_lock:
+            if received_at > self._watermark_at:
+                self._watermark_at = received_at
+            return self._watermark_at
+
+    def _is_reboot(self, state: SensorOrdering, published: float | None, sampled: float | None) -> bool:
+        if published is not None and state.max_published is not None \
+                and published < state.max_published - self.reboot_backwards_ms:
+            return True
+        # sampledAt stays 0 until the first reading after boot
+        return bool(sampled) and state.max_sampled is not None and sampled < state.max_sampled - self.reboot_backwards_ms
+
+    def _reboot(self, sensor_id: str, state: SensorOrdering, record: dict) -> None:
+        # what is held from the previous boot sorts first (lower epoch) and goes out before the new boot's records
+        self._release(state, float("inf"))
+        state.epoch += 1
+        state.seen_published.clear()
+        state.seen_sampled.clear()
+        state.max_published = state.max_sampled = None
+        state.last_emitted = None
+        state.reboots += 1
+        metrics.inc("device_reboots_total", sensor_id=sensor_id)
+        if self.on_reboot is not None:
+            self.on_reboot(sensor_id, record)
+
+    def _dedup(self, sensor_id: str, state: SensorOrdering, published: float | None,
+               sampled: float | None) -> str | None:
+        # DUPLICATE, REPEATED or None for a new reading
+        if published is not None:
+            if published in state.seen_published:
+                state.duplicates += 1
+                metrics.inc("duplicates_total", sensor_id=sensor_id)
+                return DUPLICATE
+            _remember(state.seen_published, published, self.dedup_size)
+            if state.max_published is None or published > state.max_published:
+                state.max_published = published
+        if sampled:
+            if sampled in state.seen_sampled:
+                state.repeated_readings += 1
+                metrics.inc("repeated_readings_total", sensor_id=sensor_id)
+                return REPEATED
+            _remember(state.seen_sampled, sampled, self.dedup_size)
+            if state.max_sampled is None or sampled > state.max_sampled:
+                state.max_sampled = sampled
+        return None
+
+    def _release(self, state: SensorOrdering, watermark: float) -> int:
+        # caller holds state.lock
+        released = 0
+        heap = state.heap
+        while heap and heap[0][2] <= watermark:
+            key, _, _, record = heapq.heappop(heap)
+            state.last_emitted = key
+            self.emit(record)
+            released += 1
+        return released
+
+    def _release_pending(self, watermark: float) -> int:
+        with self._sensors_lock:
+            states = list(self._sensors.values())
+        released = 0
+        for state in states:
+            # an empty heap is the common case: skip it without the lock
+            if state.heap:
+                with state.lock:
+                    released += self._release(state, watermark)
+        return released
+
+
+class DeviceOrder:
+    # the order IngestOrderer stores a sensor's records in, for readers: (boot epoch, device millis, received_at),
+    # fed the records in log order. The epoch is re-derived from the device clock going backwards, so the key does
+    # not depend on which subscriber run wrote a record. A record without a device clock keeps its place after the
+    # previous one; a sensor that never had one (older firmware) ends up in received_at order
+    __slots__ = ("reboot_backwards_ms", "epoch", "max_ms", "last_ms")
+
+    def __init__(self, reboot_backwards_ms: float = DEFAULT_REBOOT_BACKWARDS_MS):
+        self.reboot_backwards_ms = reboot_backwards_ms
+        self.epoch = 0
+        self.max_ms: float | None = None
+        self.last_ms = float("-inf")
+
+    def key(self, entry: dict) -> tuple:
+        device_ms = entry.get("publishedAt")
+        if type(device_ms) is not int:
+            device_ms = _device_ms(device_ms)
+            if device_ms is None:
+                # sampledAt stays 0 until the first reading after boot
+                device_ms = _device_ms(entry.get("sampledAt")) or None
+        return self.key_of(device_ms, entry.get("received_at", 0))
+
+    def key_of(self, device_ms: float | None, received_at: float) -> tuple:
+        if device_ms is not None:
+            max_ms = self.max_ms
+            if max_ms is None or device_ms > max_ms:
+                self.max_ms = device_ms
+            elif device_ms < max_ms - self.reboot_backwards_ms:
+                self.epoch += 1
+                self.max_ms = device_ms
+            self.last_ms = device_ms
+        return self.epoch, self.last_ms, received_at
+
+
+def device_order(entries: list[dict], reboot_backwards_ms: float = DEFAULT_REBOOT_BACKWARDS_MS) -> list[dict]:
+    # entries (in log order) sorted so each sensor's records follow its DeviceOrder; only the order within a sensor
+    # means anything
+    orders: dict[str, DeviceOrder] = {}
+    keyed = []
+    for entry in entries:
+        order = orders.get(entry.get("sensor_id"))
+        if order is None:
+            order = orders[entry.get("sensor_id")] = DeviceOrder(reboot_backwards_ms)
+        keyed.append((order.key(entry), entry))
+    keyed.sort(key=lambda item: item[0])
+    return [entry for _, entry in keyed]
+
+
+def _device_ms(value) -> float | None:
+    if type(value) is int:
+        return value
+    value = to_number(value)
+    return None if value is None or value != value else value
+
+
+def _remember(seen: dict, key: float, size: int) -> None:
+    seen[key] = None
+    if len(seen) > size:
+        del seen[next(iter(seen))]
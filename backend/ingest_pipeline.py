@@ -0,0 +1,142 @@
+import queue
+import threading
+import time
+from typing import Callable
+
+import metrics
+
+BACKPRESSURE_BLOCK = "block"
+BACKPRESSURE_DROP_OLDEST = "drop_oldest"
+BACKPRESSURE_DROP_NEWEST = "drop_newest"
+
+_STOP = object()
+
+
+class IngestPipeline:
+    def __init__(self, handler: Callable[[str, bytes, float], None], workers: int = 2, max_queue_size: int = 10_000,
+                 backpressure: str = BACKPRESSURE_DROP_OLDEST, block_timeout_sec: float | None = None):
+        if backpressure not in (BACKPRESSURE_BLOCK, BACKPRESSURE_DROP_OLDEST, BACKPRESSURE_DROP_NEWEST):
+            raise ValueError(f"Unknown backpressure policy: {backpressure}")
+        if workers < 1:
+            raise ValueError("At least one worker is required")
+        self.handler = handler
+        self.backpressure = backpressure
+        self.block_timeout_sec = block_timeout_sec
+        self.max_queue_size = max_queue_size
+
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue_size)
+        self._workers = [
+            threading.Thread(target=self._work, name=f"ingest-worker-{i}", daemon=True) for i in range(workers)
+        ]
+        self._counters_lock = threading.Lock()
+        self._started = False
+        self._closed = False
+
+        self.enqueued = 0
+        self.processed = 0
+        self.errors = 0
+        self.dropped_oldest = 0
+        self.dropped_newest = 0
+        self.max_queue_depth = 0
+
+    def start(self) -> None:
+        if self._started:
+            return
+        self._started = True
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, topic: str, payload: bytes, recv_ts: float) -> bool:
+        if self._closed:
+            self._count("dropped_newest")
+            return False
+        item = (topic, payload, recv_ts)
+
+        if self.backpressure == BACKPRESSURE_BLOCK:
+            try:
+                self._queue.put(item, timeout=self.block_timeout_sec)
+            except queue.Full:
+                self._count("dropped_newest")
+                return False
+        elif self.backpressure == BACKPRESSURE_DROP_NEWEST:
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                self._count("dropped_newest")
+                return False
+        else:
+            while True:
+                try:
+                    self._queue.put_nowait(item)
+                    break
+                except queue.Full:
+                    pass
+                try:
+                    self._queue.get_nowait()
+                    self._queue.task_done()
+                    self._count("dropped_oldest")
+                except queue.Empty:
+                    pass
+
+        depth = self._queue.qsize()
+        with self._counters_lock:
+            self.enqueued += 1
+            if depth > self.max_queue_depth:
+                self.max_queue_depth = depth
+        return True
+
+    def close(self, drain: bool = True) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        if not self._started:
+            return
+        if not drain:
+            while True:
+                try:
+                    self._queue.get_nowait()
+                    self._queue.task_done()
+                    self._count("dropped_oldest")
+                except queue.Empty:
+                    break
+        for _ in self._workers:
+            self._queue.put(_STOP)
+        for worker in self._workers:
+            worker.join()
+
+    def stats(self) -> dict:
+        with self._counters_lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self.max_queue_depth,
+                "queue_capacity": self.max_queue_size,
+                "enqueued": self.enqueued,
+                "processed": self.processed,
+                "errors": self.errors,
+                "dropped_oldest": self.dropped_oldest,
+                "dropped_newest": self.dropped_newest,
+            }
+
+    def _count(self, name: str) -> None:
+        with self._counters_lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _work(self) -> None:
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                topic, payload, recv_ts = item
+                metrics.observe("queue_wait_seconds", time.time() - recv_ts)
+                started = time.perf_counter()
+                try:
+                    self.handler(topic, payload, recv_ts)
+                except Exception as e:
+                    print(f"Error processing message on {topic}: {e}")
+                    self._count("errors")
+                else:
+                    self._count("processed")
+                metrics.observe("process_seconds", time.perf_counter() - started)
+            finally:
+                self._queue.task_done()
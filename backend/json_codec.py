@@ -0,0 +1,50 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+# every backend accepts bytes or str and raises a ValueError subclass on bad input
+DecodeError = ValueError
+
+DECODERS = {"json": json.loads}
+if ujson is not None:
+    DECODERS["ujson"] = ujson.loads
+if orjson is not None:
+    DECODERS["orjson"] = orjson.loads
+PREFERRED_BACKENDS = ("orjson", "ujson", "json")
+
+# call through the module (json_codec.loads) so set_backend() is seen everywhere
+backend = next(name for name in PREFERRED_BACKENDS if name in DECODERS)
+loads = DECODERS[backend]
+
+
+def set_backend(name: str) -> None:
+    global backend, loads
+    if name not in DECODERS:
+        raise ValueError(f"JSON backend {name} is not available (installed: {', '.join(DECODERS)})")
+    backend = name
+    loads = DECODERS[name]
+
+
+class FieldDecoder:
+    # schema-aware decoding: keeps only the wanted keys, in the line's key order, so analyzers that look at a few
+    # numeric fields do not hold every string of every line. Scanning the bytes for those keys in pure Python
+    # (per line or a regex pass over the whole buffer) measured slower than the C decoders, so decoding is always
+    # done by the active backend.
+    def __init__(self, fields):
+        self.fields = tuple(dict.fromkeys(fields))
+        self._wanted = frozenset(self.fields)
+
+    def decode(self, line: bytes | str) -> dict:
+        entry = loads(line)
+        if not isinstance(entry, dict):
+            raise DecodeError("Not a JSON object")
+        wanted = self._wanted
+        return {key: value for key, value in entry.items() if key in wanted}
@@ -0,0 +1,180 @@
+import json
+import os
+import threading
+import time
+
+import metrics
+from sensor_index import SensorIndex
+
+FSYNC_NEVER = "never"
+FSYNC_ALWAYS = "always"
+FSYNC_INTERVAL = "interval"
+
+
+class BufferedJsonlWriter:
+    def __init__(self, filename: str, max_batch_records: int = 500, max_batch_bytes: int = 256 * 1024,
+                 max_latency_sec: float = 1.0, fsync_policy: str = FSYNC_INTERVAL, fsync_interval_sec: float = 5.0,
+                 max_buffer_records: int = 100_000, delayed_threshold_sec: float | None = None,
+                 index: SensorIndex | None = None):
+        if fsync_policy not in (FSYNC_NEVER, FSYNC_ALWAYS, FSYNC_INTERVAL):
+            raise ValueError(f"Unknown fsync policy: {fsync_policy}")
+        self.filename = filename
+        self.max_batch_records = max_batch_records
+        self.max_batch_bytes = max_batch_bytes
+        self.max_latency_sec = max_latency_sec
+        self.fsync_policy = fsync_policy
+        self.fsync_interval_sec = fsync_interval_sec
+        self.max_buffer_records = max_buffer_records
+        # a record is reported as delayed when it sat in the buffer well past the latency budget
+        self.delayed_threshold_sec = delayed_threshold_sec if delayed_threshold_sec is not None else 2 * max_latency_sec
+
+        self.index = index
+        self._file = open(filename, "a")
+        self._offset = self._file.seek(0, os.SEEK_END)
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._buffer: list[tuple[float, str, str | None, float]] = []
+        self._buffer_bytes = 0
+        self._last_fsync = time.monotonic()
+        self._closed = False
+
+        self.records_written = 0
+        self.bytes_written = 0
+        self.batches_written = 0
+        self.records_dropped = 0
+        self.records_delayed = 0
+        self.fsyncs = 0
+        self.write_errors = 0
+
+        self._flusher = threading.Thread(target=self._flush_loop, name=f"jsonl-writer:{filename}", daemon=True)
+        self._flusher.start()
+
+    def write(self, data: dict) -> bool:
+        line = json.dumps(data) + "\n"
+        with self._lock:
+            if self._closed or len(self._buffer) >= self.max_buffer_records:
+                self.records_dropped += 1
+                return False
+            self._buffer.append((time.monotonic(), line, data.get("sensor_id"), data.get("received_at", 0.0)))
+            self._buffer_bytes += len(line)
+            # the first record starts the latency deadline the flusher (asleep without a timeout) has to wait for
+            if len(self._buffer) == 1 or len(self._buffer) >= self.max_batch_records \
+                    or self._buffer_bytes >= self.max_batch_bytes:
+                self._wakeup.notify()
+        return True
+
+    def flush(self) -> None:
+        with self._io_lock:
+            with self._lock:
+                batch = self._buffer
+                self._buffer = []
+                self._buffer_bytes = 0
+            self._write_batch(batch)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._wakeup.notify()
+        self._flusher.join()
+        self.flush()
+        with self._io_lock:
+            if self.fsync_policy != FSYNC_NEVER:
+                self._fsync()
+            self._file.close()
+            if self.index is not None:
+                self.index.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            buffered = len(self._buffer)
+        return {
+            "filename": self.filename,
+            "records_written": self.records_written,
+            "bytes_written": self.bytes_written,
+            "batches_written": self.batches_written,
+            "records_buffered": buffered,
+            "records_dropped": self.records_dropped,
+            "records_delayed": self.records_delayed,
+            "fsyncs": self.fsyncs,
+            "write_errors": self.write_errors,
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _flush_loop(self) -> None:
+        while True:
+            with self._lock:
+                while not self._closed and not self._batch_ready():
+                    self._wakeup.wait(timeout=self._time_until_due())
+                if self._closed:
+                    return
+            self.flush()
+
+    def _batch_ready(self) -> bool:
+        if not self._buffer:
+            return False
+        if len(self._buffer) >= self.max_batch_records or self._buffer_bytes >= self.max_batch_bytes:
+            return True
+        return time.monotonic() - self._buffer[0][0] >= self.max_latency_sec
+
+    def _time_until_due(self) -> float | None:
+        if not self._buffer:
+            return None
+        return max(0.0, self.max_latency_sec - (time.monotonic() - self._buffer[0][0]))
+
+    def _write_batch(self, batch: list[tuple[float, str, str | None, float]]) -> None:
+        if not batch:
+            return
+        started = time.perf_counter()
+        data = "".join(line for _, line, _, _ in batch)
+        try:
+            self._file.write(data)
+            self._file.flush()
+        except OSError as e:
+            print("Write error:", e)
+            with self._lock:
+                self.write_errors += 1
+                self.records_dropped += len(batch)
+            self._offset = os.path.getsize(self.filename)
+            return
+
+        if self.index is not None:
+            # json.dumps escapes non-ASCII, so character counts are byte counts
+            records = []
+            offset = self._offset
+            for _, line, sensor_id, received_at in batch:
+                if sensor_id:
+                    records.append((sensor_id, float(received_at), offset, len(line)))
+                offset += len(line)
+            self.index.append(records, offset)
+        self._offset += len(data)
+
+        now = time.monotonic()
+        self.records_written += len(batch)
+        self.bytes_written += len(data)
+        self.batches_written += 1
+        self.records_delayed += sum(1 for queued_at, _, _, _ in batch if now - queued_at > self.delayed_threshold_sec)
+        metrics.inc("records_written_total", len(batch))
+        metrics.observe("write_batch_seconds", time.perf_counter() - started)
+
+        if self.fsync_policy == FSYNC_ALWAYS:
+            self._fsync()
+        elif self.fsync_policy == FSYNC_INTERVAL and now - self._last_fsync >= self.fsync_interval_sec:
+            self._fsync()
+
+    def _fsync(self) -> None:
+        try:
+            os.fsync(self._file.fileno())
+        except OSError as e:
+            print("fsync error:", e)
+            self.write_errors += 1
+            return
+        self._last_fsync = time.monotonic()
+        self.fsyncs += 1
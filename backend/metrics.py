@@ -0,0 +1,267 @@
+import bisect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+
+PREFIX = "telemetry_"
+# seconds, 10 us .. ~84 s in powers of two
+DEFAULT_BUCKETS = tuple(1e-5 * 2 ** i for i in range(24))
+# how fast (s per s) a sensor's estimated clock offset may grow, so the estimate follows a drifting device clock
+CLOCK_DRIFT_ALLOWANCE = 1e-4
+STATS_LINE_HISTOGRAMS = ("decode_seconds", "persist_seconds", "queue_wait_seconds", "lag_seconds", "reading_age_seconds")
+
+HELP = {
+    "messages_total": "Messages processed, per sensor",
+    "messages_received_total": "Messages handed to the ingest pipeline by the MQTT connections",
+    "decode_errors_total": "Payloads that were not valid JSON",
+    "queue_wait_seconds": "Time between receiving a message and a worker picking it up",
+    "process_seconds": "Time a worker spent on one message",
+    "decode_seconds": "JSON decode time per message",
+    "persist_seconds": "Time to hand one record to the storage writer",
+    "rollup_seconds": "Time to add one record to the rollups",
+    "detect_seconds": "Online anomaly detection time per message",
+    "write_batch_seconds": "Time to write (and index) one buffered batch to data.jsonl",
+    "records_written_total": "Records written to data.jsonl by the buffered writer",
+    "lag_seconds": "received_at - publishedAt, less the smallest difference seen for the sensor (the device clock "
+                   "is millis since boot, so only the delay above the best delivery is measurable)",
+    "reading_age_seconds": "ageReadings: how old the reading was when the device published it",
+    "duplicates_total": "Messages dropped as QoS redeliveries (publishedAt already seen)",
+    "repeated_readings_total": "Republished readings (sampledAt already seen): stored flagged \"repeated\", or dropped",
+    "late_records_total": "Records that arrived after the ordering window and were stored out of device-clock order",
+    "device_reboots_total": "Reboots detected from the device clock going backwards",
+    "analyzer_parse_seconds": "TelemetryAnalyzer time to decode one batch of lines",
+    "analyzer_lines_total": "Lines decoded by TelemetryAnalyzer",
+}
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, size: int):
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+
+class MetricsRegistry:
+    # counters and histograms keyed by (name, sensor_id). Every thread writes to its own shard, so recording takes no
+    # lock; collect() merges the shards (a reader may see a shard mid-update, which only skews one scrape slightly)
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.enabled = True
+        self.started_at = time.time()
+        self._local = threading.local()
+        self._shards: list[tuple[dict, dict]] = []
+        self._shards_lock = threading.Lock()
+        self._gauges: dict[str, Callable[[], float]] = {}
+        # sensor_id -> (clock offset, received_at, publishedAt) for observe_lag
+        self._clock_offsets: dict[str, tuple[float, float, float]] = {}
+        self._last_line: tuple[float, dict] | None = None
+
+    def inc(self, name: str, value: float = 1, sensor_id: str | None = None) -> None:
+        if not self.enabled:
+            return
+        counters = self._shard()[0]
+        key = (name, sensor_id)
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, sensor_id: str | None = None) -> None:
+        if not self.enabled:
+            return
+        histograms = self._shard()[1]
+        key = (name, sensor_id)
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = Histogram(len(self.buckets) + 1)
+        histogram.counts[bisect.bisect_left(self.buckets, value)] += 1
+        histogram.sum += value
+        histogram.count += 1
+
+    def gauge(self, name: str, fn: Callable[[], float]) -> None:
+        # read when collected, e.g. the ingest queue depth
+        self._gauges[name] = fn
+
+    def observe_lag(self, sensor_id: str, received_at: float, published_ms) -> None:
+        # publishedAt is the device's millis(): received_at - publishedAt is lag plus an unknown per-sensor offset.
+        # The offset is estimated as the smallest difference seen (allowed to creep up by CLOCK_DRIFT_ALLOWANCE) and
+        # restarts when millis goes backwards (reboot); races between workers only make the estimate slightly stale
+        if not self.enabled or published_ms is None:
+            return
+        try:
+            published_ms = float(published_ms)
+        except (TypeError, ValueError):
+            return
+        raw = received_at - published_ms / 1000
+        state = self._clock_offsets.get(sensor_id)
+        if state is None or published_ms < state[2]:
+            offset = raw
+        else:
+            offset = min(raw, state[0] + (received_at - state[1]) * CLOCK_DRIFT_ALLOWANCE)
+        self._clock_offsets[sensor_id] = (offset, received_at, published_ms)
+        self.observe("lag_seconds", raw - offset, sensor_id)
+
+    def collect(self) -> tuple[dict, dict]:
+        counters: dict[tuple, float] = {}
+        histograms: dict[tuple, Histogram] = {}
+        with self._shards_lock:
+            shards = list(self._shards)
+        for shard_counters, shard_histograms in shards:
+            for key, value in dict(shard_counters).items():
+                counters[key] = counters.get(key, 0) + value
+            for key, histogram in dict(shard_histograms).items():
+                merged = histograms.get(key)
+                if merged is None:
+                    merged = histograms[key] = Histogram(len(self.buckets) + 1)
+                for i, count in enumerate(list(histogram.counts)):
+                    merged.counts[i] += count
+                merged.sum += histogram.sum
+                merged.count += histogram.count
+        return counters, histograms
+
+    def totals(self) -> tuple[dict, dict]:
+        # same as collect(), summed over sensors
+        counters, histograms = self.collect()
+        total_counters: dict[str, float] = {}
+        total_histograms: dict[str, Histogram] = {}
+        for (name, _), value in counters.items():
+            total_counters[name] = total_counters.get(name, 0) + value
+        for (name, _), histogram in histograms.items():
+            merged = total_histograms.get(name)
+            if merged is None:
+                merged = total_histograms[name] = Histogram(len(self.buckets) + 1)
+            merged.counts = [a + b for a, b in zip(merged.counts, histogram.counts)]
+            merged.sum += histogram.sum
+            merged.count += histogram.count
+        return total_counters, total_histograms
+
+    def quantile(self, histogram: Histogram, q: float) -> float | None:
+        # upper bound of the bucket holding the q-th observation
+        if not histogram.count:
+            return None
+        rank = q * histogram.count
+        seen = 0
+        for i, count in enumerate(histogram.counts):
+            seen += count
+            if seen >= rank and count:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+    def render_prometheus(self) -> str:
+        counters, histograms = self.collect()
+        lines = []
+        for name in sorted({key[0] for key in counters}):
+            self._describe(lines, name, "counter")
+            for (metric, sensor_id), value in sorted(counters.items(), key=_sort_key):
+                if metric == name:
+                    lines.append(f"{PREFIX}{name}{_labels(sensor_id)} {value:g}")
+        for name in sorted({key[0] for key in histograms}):
+            self._describe(lines, name, "histogram")
+            for (metric, sensor_id), histogram in sorted(histograms.items(), key=_sort_key):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(self.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f"{PREFIX}{name}_bucket{_labels(sensor_id, le=f'{bound:g}')} {cumulative}")
+                lines.append(f"{PREFIX}{name}_bucket{_labels(sensor_id, le='+Inf')} {histogram.count}")
+                lines.append(f"{PREFIX}{name}_sum{_labels(sensor_id)} {histogram.sum:g}")
+                lines.append(f"{PREFIX}{name}_count{_labels(sensor_id)} {histogram.count}")
+        for name, fn in sorted(self._gauges.items()):
+            try:
+                value = fn()
+            except Exception:
+                continue
+            self._describe(lines, name, "gauge")
+            lines.append(f"{PREFIX}{name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def stats_line(self) -> str:
+        # one line for the console: rates since the previous call, p50/p99 of the main stages since start
+        now = time.time()
+        counters, histograms = self.totals()
+        previous_at, previous = self._last_line or (self.started_at, {})
+        self._last_line = (now, counters)
+        elapsed = max(now - previous_at, 1e-9)
+        messages = counters.get("messages_total", 0)
+        parts = [f"msgs {messages:.0f} ({(messages - previous.get('messages_total', 0)) / elapsed:.1f}/s)"]
+        for name in STATS_LINE_HISTOGRAMS:
+            histogram = histograms.get(name)
+            if histogram is not None and histogram.count:
+                p50, p99 = self.quantile(histogram, 0.5), self.quantile(histogram, 0.99)
+                parts.append(f"{name.removesuffix('_seconds')} p50<={_duration(p50)} p99<={_duration(p99)}")
+        for name, fn in sorted(self._gauges.items()):
+            try:
+                parts.append(f"{name} {fn():g}")
+            except Exception:
+                continue
+        return " | ".join(parts)
+
+    def reset(self) -> None:
+        with self._shards_lock:
+            for counters, histograms in self._shards:
+                counters.clear()
+                histograms.clear()
+        self._clock_offsets.clear()
+        self._last_line = None
+        self.started_at = time.time()
+
+    def _shard(self) -> tuple[dict, dict]:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = ({}, {})
+            with self._shards_lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+        return shard
+
+    def _describe(self, lines: list[str], name: str, kind: str) -> None:
+        if name in HELP:
+            lines.append(f"# HELP {PREFIX}{name} {HELP[name]}")
+        lines.append(f"# TYPE {PREFIX}{name} {kind}")
+
+
+def _sort_key(item) -> tuple:
+    return item[0][0], item[0][1] or ""
+
+
+def _labels(sensor_id: str | None, **extra) -> str:
+    labels = ([f'sensor_id="{sensor_id}"'] if sensor_id is not None else []) + [f'{k}="{v}"' for k, v in extra.items()]
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+def _duration(seconds: float) -> str:
+    if seconds == float("inf"):
+        return "inf"
+    return f"{seconds * 1000:.2f}ms" if seconds < 1 else f"{seconds:.1f}s"
+
+
+# the process-wide registry; call through the module (metrics.inc / metrics.observe)
+REGISTRY = MetricsRegistry()
+inc = REGISTRY.inc
+observe = REGISTRY.observe
+observe_lag = REGISTRY.observe_lag
+gauge = REGISTRY.gauge
+
+
+def serve_metrics(port: int, host: str = "127.0.0.1", registry: MetricsRegistry = REGISTRY) -> ThreadingHTTPServer:
+    # Prometheus text format on http://host:port/metrics, served from a daemon thread
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name=f"metrics:{port}", daemon=True).start()
+    return server
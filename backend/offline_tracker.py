@@ -0,0 +1,121 @@
+import heapq
+import threading
+import time
+from typing import Callable
+
+ONLINE = "ONLINE"
+OFFLINE = "OFFLINE"
+
+
+class OfflineTracker:
+    # keeps at most one heap entry per sensor: a message only moves the sensor's deadline (O(1)), and when a stale
+    # heap entry comes due it is pushed back with the current deadline (O(log n)), so OFFLINE fires exactly on time
+    def __init__(self, timeout_sec: float, on_offline: Callable[[str], None] | None = None,
+                 on_online: Callable[[str], None] | None = None, clock: Callable[[], float] = time.time):
+        self.timeout_sec = timeout_sec
+        self.on_offline = on_offline
+        self.on_online = on_online
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._heap: list[tuple[float, str]] = []
+        self._queued: set[str] = set()
+        self._deadline: dict[str, float] = {}
+        self._last_seen: dict[str, float] = {}
+        self._status: dict[str, str] = {}
+        self._thread: threading.Thread | None = None
+        self._stopped = False
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="offline-tracker", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        with self._lock:
+            self._stopped = True
+            self._wakeup.notify()
+        if self._thread is not None:
+            self._thread.join()
+
+    def seen(self, sensor_id: str, timestamp: float | None = None) -> None:
+        if timestamp is None:
+            timestamp = self.clock()
+        came_back = False
+        with self._lock:
+            if timestamp <= self._last_seen.get(sensor_id, float("-inf")):
+                return
+            self._last_seen[sensor_id] = timestamp
+            deadline = timestamp + self.timeout_sec
+            self._deadline[sensor_id] = deadline
+            came_back = self._status.get(sensor_id) == OFFLINE
+            self._status[sensor_id] = ONLINE
+            if sensor_id not in self._queued:
+                self._queued.add(sensor_id)
+                heapq.heappush(self._heap, (deadline, sensor_id))
+                if self._heap[0][1] == sensor_id:
+                    self._wakeup.notify()
+        if came_back and self.on_online is not None:
+            self.on_online(sensor_id)
+
+    def expire(self, now: float | None = None) -> list[str]:
+        if now is None:
+            now = self.clock()
+        with self._lock:
+            went_offline = self._expire_locked(now)
+        if self.on_offline is not None:
+            for sensor_id in went_offline:
+                self.on_offline(sensor_id)
+        return went_offline
+
+    def status(self, sensor_id: str) -> str | None:
+        with self._lock:
+            return self._status.get(sensor_id)
+
+    def last_seen(self, sensor_id: str) -> float | None:
+        with self._lock:
+            return self._last_seen.get(sensor_id)
+
+    def snapshot(self) -> dict[str, dict]:
+        with self._lock:
+            return {
+                sensor_id: {"status": self._status[sensor_id], "last_seen": self._last_seen[sensor_id]}
+                for sensor_id in self._status
+            }
+
+    def next_deadline(self) -> float | None:
+        with self._lock:
+            return self._heap[0][0] if self._heap else None
+
+    def _expire_locked(self, now: float) -> list[str]:
+        went_offline = []
+        while self._heap and self._heap[0][0] <= now:
+            deadline, sensor_id = heapq.heappop(self._heap)
+            current_deadline = self._deadline[sensor_id]
+            if current_deadline > deadline:
+                # the sensor reported since this entry was pushed: requeue it at its real deadline
+                heapq.heappush(self._heap, (current_deadline, sensor_id))
+                continue
+            self._queued.discard(sensor_id)
+            if self._status.get(sensor_id) != OFFLINE:
+                self._status[sensor_id] = OFFLINE
+                went_offline.append(sensor_id)
+        return went_offline
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                while not self._stopped:
+                    now = self.clock()
+                    if self._heap and self._heap[0][0] <= now:
+                        break
+                    timeout = self._heap[0][0] - now if self._heap else None
+                    self._wakeup.wait(timeout=timeout)
+                if self._stopped:
+                    return
+                went_offline = self._expire_locked(self.clock())
+            if self.on_offline is not None:
+                for sensor_id in went_offline:
+                    self.on_offline(sensor_id)
@@ -0,0 +1,170 @@
+import threading
+from collections import deque
+
+from telemetry_analyzer import EXPECTED_MESSAGE_INTERVAL_SECONDS, TOLERANCE_MESSAGE_INTERVAL, VALID_CHANGES_JUMPS, VALID_RANGES
+
+DEFAULT_WINDOW_SIZE = 20
+
+
+class RunningStats:
+    __slots__ = ("count", "mean", "m2", "min", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def variance(self) -> float | None:
+        return self.m2 / (self.count - 1) if self.count > 1 else None
+
+
+class RingWindow:
+    __slots__ = ("values", "total")
+
+    def __init__(self, size: int):
+        self.values: deque[float] = deque(maxlen=size)
+        self.total = 0.0
+
+    def add(self, value: float) -> None:
+        if len(self.values) == self.values.maxlen:
+            self.total -= self.values[0]
+        self.values.append(value)
+        self.total += value
+
+    def mean(self) -> float | None:
+        return self.total / len(self.values) if self.values else None
+
+
+class SensorState:
+    __slots__ = ("last_values", "last_received_at", "running", "windows", "messages")
+
+    def __init__(self):
+        self.last_values: dict[str, float] = {}
+        self.last_received_at: float | None = None
+        self.running: dict[str, RunningStats] = {}
+        self.windows: dict[str, RingWindow] = {}
+        self.messages = 0
+
+
+class OnlineAnomalyDetector:
+    # checks the analyzer's range, jump and gap rules as each record arrives, with O(1) work and memory per sensor
+    def __init__(self, valid_ranges: dict = VALID_RANGES, valid_jumps: dict = VALID_CHANGES_JUMPS,
+                 expected_msg_interval_sec: float = EXPECTED_MESSAGE_INTERVAL_SECONDS,
+                 tolerance_sec: float = TOLERANCE_MESSAGE_INTERVAL, window_size: int = DEFAULT_WINDOW_SIZE):
+        self.valid_ranges = dict(valid_ranges)
+        self.valid_jumps = dict(valid_jumps)
+        self.expected_msg_interval_sec = expected_msg_interval_sec
+        self.tolerance_sec = tolerance_sec
+        self.window_size = window_size
+        self.keys = tuple(dict.fromkeys(list(self.valid_ranges) + list(self.valid_jumps)))
+        self._sensors: dict[str, SensorState] = {}
+        self._lock = threading.Lock()
+
+    def process(self, record: dict) -> list[dict]:
+        sensor_id = record.get("sensor_id")
+        if not sensor_id:
+            return []
+        with self._lock:
+            state = self._sensors.get(sensor_id)
+            if state is None:
+                state = SensorState()
+                self._sensors[sensor_id] = state
+            return self._process(sensor_id, state, record)
+
+    def _process(self, sensor_id: str, state: SensorState, record: dict) -> list[dict]:
+        alerts = []
+        state.messages += 1
+
+        received_at = record.get("received_at")
+        if received_at is not None:
+            if state.last_received_at is not None:
+                delta = received_at - state.last_received_at
+                if delta > self.expected_msg_interval_sec * self.tolerance_sec:
+                    missing = round(delta / self.expected_msg_interval_sec) - 1
+                    alerts.append({"type": "MISSING_MESSAGES", "sensor_id": sensor_id, "entry": record,
+                                   "delta": delta, "missing_messages": missing})
+            if state.last_received_at is None or received_at > state.last_received_at:
+                state.last_received_at = received_at
+        if record.get("repeated"):
+            # a republished reading: a delivered message, but its values were already checked
+            return alerts
+
+        current_values = {}
+        for key in self.keys:
+            if key not in record:
+                continue
+            try:
+                value = float(record[key])
+            except (ValueError, TypeError):
+                continue
+            current_values[key] = value
+
+            valid_range = self.valid_ranges.get(key)
+            if valid_range is not None and (value < valid_range[0] or value > valid_range[1]):
+                alerts.append({"type": "OUT_OF_RANGE", "sensor_id": sensor_id, "entry": record, "key": key,
+                               "value": value, "valid_range": valid_range})
+
+            max_jump = self.valid_jumps.get(key)
+            previous_value = state.last_values.get(key)
+            if max_jump is not None and previous_value is not None and abs(value - previous_value) > max_jump:
+                alerts.append({"type": "SUDDEN_CHANGE", "sensor_id": sensor_id, "entry": record, "key": key,
+                               "value": value, "previous_value": previous_value, "max_jump": max_jump})
+
+            running = state.running.get(key)
+            if running is None:
+                running = state.running[key] = RunningStats()
+                state.windows[key] = RingWindow(self.window_size)
+            running.add(value)
+            state.windows[key].add(value)
+
+        # like sudden_change_detection, a jump is only checked between consecutive records that both carry the key
+        state.last_values = current_values
+        return alerts
+
+    def sensor_stats(self, sensor_id: str) -> dict[str, dict]:
+        with self._lock:
+            state = self._sensors.get(sensor_id)
+            if state is None:
+                return {}
+            stats = {}
+            for key, running in state.running.items():
+                window = state.windows[key]
+                stats[key] = {
+                    "count": running.count,
+                    "mean": running.mean,
+                    "variance": running.variance(),
+                    "min": running.min,
+                    "max": running.max,
+                    "window_count": len(window.values),
+                    "window_mean": window.mean(),
+                    "window_min": min(window.values) if window.values else None,
+                    "window_max": max(window.values) if window.values else None,
+                }
+            return stats
+
+    def sensors(self) -> list[str]:
+        with self._lock:
+            return list(self._sensors)
+
+
+def format_alert(alert: dict) -> str:
+    sensor_id = alert.get("sensor_id")
+    if alert["type"] == "OUT_OF_RANGE":
+        low, high = alert["valid_range"]
+        return f"Sensor {sensor_id} OUT OF RANGE: {alert['key']}={alert['value']} (valid {low}..{high})"
+    if alert["type"] == "SUDDEN_CHANGE":
+        return (f"Sensor {sensor_id} SUDDEN CHANGE: {alert['key']} {alert['previous_value']} -> {alert['value']} "
+                f"(max {alert['max_jump']})")
+    return f"Sensor {sensor_id} MISSING MESSAGES: gap of {alert['delta']:.1f}s, about {alert['missing_messages']} missed"
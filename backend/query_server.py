@@ -0,0 +1,428 @@
+import argparse
+import bisect
+import json
+import math
+import threading
+import time
+import urllib.parse
+import urllib.request
+import uuid
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from aggregation import Accumulator, parse_quantile, to_number, validate_stats
+from telemetry_analyzer import TelemetryAnalyzer, get_detected_time
+
+DEFAULT_PORT = 9110
+# the log is tailed this often; queries in between see the data of the last refresh
+REFRESH_INTERVAL_SEC = 1.0
+CACHE_SIZE = 256
+DEFAULT_PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 50_000
+# records per write while streaming a page
+STREAM_CHUNK = 500
+DEFAULT_SERIES_STATS = ("count", "mean", "min", "max")
+
+
+class QueryCache:
+    # LRU of encoded responses. Keys carry the data versions they were computed from, so new data never serves a
+    # stale entry; old versions just age out
+    def __init__(self, max_entries: int = CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class TelemetryQueryEngine:
+    # one tail-following analyzer shared by every client; refreshed on a background thread, read under a lock only
+    # while slicing (the slices are formatted outside it)
+    def __init__(self, filename: str, refresh_interval_sec: float = REFRESH_INTERVAL_SEC,
+                 cache_size: int = CACHE_SIZE, columnar: bool = False):
+        self.filename = filename
+        self.refresh_interval_sec = refresh_interval_sec
+        self.telemetry = TelemetryAnalyzer(filename, follow=True, compute_stats=False, columnar=columnar)
+        self.cache = QueryCache(cache_size)
+        self.lock = threading.Lock()
+        self.refreshes = 0
+        self.last_refresh_at = time.time()
+        self.last_refresh_sec = 0.0
+        self._stop = threading.Event()
+        # versions start over with every process: clients holding a copy compare this to notice a restart
+        self.server_id = uuid.uuid4().hex
+        self._thread = threading.Thread(target=self._run, name=f"query-refresh:{filename}", daemon=True)
+
+    def start(self) -> "TelemetryQueryEngine":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def refresh(self) -> int:
+        started = time.perf_counter()
+        with self.lock:
+            new_entries = self.telemetry.refresh()
+        self.refreshes += 1
+        self.last_refresh_at = time.time()
+        self.last_refresh_sec = time.perf_counter() - started
+        return len(new_entries)
+
+    def sensors(self) -> dict:
+        with self.lock:
+            telemetry = self.telemetry
+            sensors = {
+                sensor_id: {
+                    "records": len(entries),
+                    "first_received_at": get_detected_time(entries[0]) if entries else None,
+                    "last_received_at": get_detected_time(entries[-1]) if entries else None,
+                    "version": telemetry.sensor_versions.get(sensor_id, 0),
+                }
+                for sensor_id, entries in sorted(telemetry.entries_by_sensor.items())
+            }
+            return {"version": telemetry.version, "sensors": sensors}
+
+    def records(self, sensor_ids: list[str] | None = None, start: float | None = None, end: float | None = None,
+                keys: list[str] | None = None, cursor: str | None = None,
+                limit: int = DEFAULT_PAGE_SIZE) -> tuple[list[dict], str | None]:
+        # one page of records in sensor_id and then device-clock order. The cursor names the last record returned
+        # (sensor, its order key and how many records with that key were already sent), so the next page continues
+        # there even if data was appended or a late record inserted in between
+        limit = max(0, min(limit, MAX_PAGE_SIZE))
+        if not limit:
+            return [], cursor
+        after_sensor, after_key, after_count = parse_cursor(cursor)
+        page: list[dict] = []
+        next_cursor = None
+        with self.lock:
+            ordered_ids = self._sensor_ids(sensor_ids)
+            for sensor_id in ordered_ids:
+                if after_sensor is not None and sensor_id < after_sensor:
+                    continue
+                entries = self.telemetry.entries_by_sensor.get(sensor_id, [])
+                order_keys = self.telemetry.order_keys.get(sensor_id, [])
+                lo, hi = time_slice(entries, start, end)
+                if sensor_id == after_sensor:
+                    lo = max(lo, bisect.bisect_left(order_keys, after_key, lo, hi) + after_count)
+                take = max(0, min(hi - lo, limit - len(page)))
+                page.extend(entries[lo:lo + take])
+                if len(page) >= limit:
+                    if lo + take < hi or sensor_id != ordered_ids[-1]:
+                        last_key = order_keys[lo + take - 1]
+                        same = 0
+                        while lo + take - same - 1 >= 0 and order_keys[lo + take - same - 1] == last_key:
+                            same += 1
+                        epoch, device_ms, received_at = last_key
+                        next_cursor = f"{sensor_id}|{epoch}|{device_ms!r}|{received_at!r}|{same}"
+                    break
+        if keys:
+            fields = ("sensor_id", "received_at", *keys)
+            page = [{field: entry[field] for field in fields if field in entry} for entry in page]
+        return page, next_cursor
+
+    def series(self, sensor_ids: list[str] | None = None, keys: list[str] | None = None, start: float | None = None,
+               end: float | None = None, bucket_sec: float | None = None,
+               stats=DEFAULT_SERIES_STATS) -> dict:
+        # stats per sensor and key, over the whole range or per bucket_sec bucket (aligned on multiples of it);
+        # columns per key, aligned with "start", so a chart can take them as they are
+        stats = validate_stats(stats)
+        keys = tuple(keys or ("temperatureCelcius", "humidityPercent"))
+        keep_values = any(parse_quantile(stat) is not None for stat in stats)
+        result = {"bucket_sec": bucket_sec, "stats": list(stats), "sensors": {}}
+        with self.lock:
+            ordered_ids = self._sensor_ids(sensor_ids)
+        for sensor_id in ordered_ids:
+            with self.lock:
+                entries = self.telemetry.entries_by_sensor.get(sensor_id, [])
+                lo, hi = time_slice(entries, start, end)
+                entries = entries[lo:hi]
+            buckets: dict[float, dict[str, Accumulator]] = {}
+            for entry in entries:
+                bucket = math.floor(get_detected_time(entry) / bucket_sec) * bucket_sec if bucket_sec else start
+                accumulators = buckets.get(bucket)
+                if accumulators is None:
+                    accumulators = buckets[bucket] = {key: Accumulator(keep_values) for key in keys}
+                for key in keys:
+                    value = to_number(entry.get(key))
+                    if value is not None and value == value:
+                        accumulators[key].add(value)
+            starts = sorted(buckets)
+            columns = {key: {stat: [] for stat in stats} for key in keys}
+            for bucket in starts:
+                for key, accumulator in buckets[bucket].items():
+                    for stat, value in zip(stats, accumulator.result(stats)):
+                        columns[key][stat].append(value)
+            result["sensors"][sensor_id] = {"start": starts, **columns}
+        return result
+
+    def recent(self, n: int, since: int = -1) -> dict:
+        # the last n records of the sensors changed after version `since` (all of them by default), for clients that
+        # keep their own copy, like the dashboard
+        with self.lock:
+            telemetry = self.telemetry
+            return {
+                "server_id": self.server_id,
+                "version": telemetry.version,
+                "sensor_ids": sorted(telemetry.entries_by_sensor),
+                "sensors": {
+                    sensor_id: {"version": telemetry.sensor_versions.get(sensor_id, 0),
+                                "entries": entries[-n:] if n > 0 else []}
+                    for sensor_id, entries in telemetry.entries_by_sensor.items()
+                    if telemetry.sensor_versions.get(sensor_id, 0) > since
+                },
+            }
+
+    def delivery(self, bucket_sec: float | None = None) -> dict:
+        with self.lock:
+            return self.telemetry.delivery_report(bucket_sec=bucket_sec)
+
+    def cached(self, name: str, params: tuple, sensor_ids: list[str] | None, compute) -> bytes:
+        # cached by the versions of the sensors involved: a query over sensor A stays cached while B gets data
+        with self.lock:
+            if sensor_ids:
+                versions = tuple(self.telemetry.sensor_versions.get(sensor_id, 0) for sensor_id in sensor_ids)
+            else:
+                versions = (self.telemetry.version,)
+        key = (name, params, versions)
+        body = self.cache.get(key)
+        if body is None:
+            body = json.dumps(compute()).encode()
+            self.cache.put(key, body)
+        return body
+
+    def stats(self) -> dict:
+        return {
+            "filename": self.filename,
+            "server_id": self.server_id,
+            "records": len(self.telemetry.entries),
+            "sensors": len(self.telemetry.entries_by_sensor),
+            "version": self.telemetry.version,
+            "refreshes": self.refreshes,
+            "last_refresh_at": self.last_refresh_at,
+            "last_refresh_sec": self.last_refresh_sec,
+            "cache_entries": len(self.cache),
+            "cache_hits": self.cache.hits,
+            "cache_misses": self.cache.misses,
+        }
+
+    def _sensor_ids(self, sensor_ids: list[str] | None) -> list[str]:
+        return sorted(sensor_ids) if sensor_ids else sorted(self.telemetry.entries_by_sensor)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.refresh_interval_sec):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Refresh of {self.filename} failed: {e}")
+
+
+def time_slice(entries: list[dict], start: float | None, end: float | None) -> tuple[int, int]:
+    # [start, end) by received_at, cut in the entries' device-clock order (where received_at is nearly sorted): a
+    # record reordered across a cut stays with its neighbours
+    lo = bisect.bisect_left(entries, start, key=get_detected_time) if start is not None else 0
+    hi = bisect.bisect_left(entries, end, key=get_detected_time) if end is not None else len(entries)
+    return lo, max(lo, hi)
+
+
+def parse_cursor(cursor: str | None) -> tuple[str | None, tuple | None, int]:
+    # "sensor_id|epoch|device ms|received_at|records already sent with that order key"
+    if not cursor:
+        return None, None, 0
+    sensor_id, _, rest = cursor.partition("|")
+    try:
+        epoch, device_ms, received_at, count = rest.split("|")
+        return sensor_id, (int(epoch), float(device_ms), float(received_at)), int(count or 0)
+    except ValueError:
+        raise ValueError(f"Bad cursor: {cursor}") from None
+
+
+def make_handler(engine: TelemetryQueryEngine):
+    class QueryHandler(BaseHTTPRequestHandler):
+        # GET /sensors, /records (NDJSON, paginated), /series, /recent, /delivery, /stats; see README
+        def do_GET(self):
+            url = urllib.parse.urlsplit(self.path)
+            query = urllib.parse.parse_qs(url.query)
+            try:
+                if url.path == "/records":
+                    self._records(query)
+                elif url.path == "/series":
+                    sensor_ids = _list(query, "sensor")
+                    params = (tuple(sorted(sensor_ids or ())), tuple(_list(query, "key") or ()),
+                              _float(query, "start"), _float(query, "end"), _float(query, "bucket"),
+                              tuple(_list(query, "stat") or DEFAULT_SERIES_STATS))
+                    self._json(engine.cached("series", params, sensor_ids,
+                                             lambda: engine.series(sensor_ids, *params[1:])))
+                elif url.path == "/sensors":
+                    self._json(json.dumps(engine.sensors()).encode())
+                elif url.path == "/recent":
+                    recent = engine.recent(_int(query, "n", 20), _int(query, "since", -1))
+                    self._json(json.dumps(recent).encode())
+                elif url.path == "/delivery":
+                    bucket_sec = _float(query, "bucket")
+                    self._json(engine.cached("delivery", (bucket_sec,), None, lambda: engine.delivery(bucket_sec)))
+                elif url.path == "/stats":
+                    self._json(json.dumps(engine.stats()).encode())
+                else:
+                    self.send_error(404)
+            except ValueError as e:
+                self._json(json.dumps({"error": str(e)}).encode(), status=400)
+
+        def _records(self, query: dict) -> None:
+            page, next_cursor = engine.records(_list(query, "sensor"), _float(query, "start"), _float(query, "end"),
+                                               _list(query, "key"), _first(query, "cursor"),
+                                               _int(query, "limit", DEFAULT_PAGE_SIZE))
+            # no Content-Length: the page is written in chunks as it is encoded and the connection closes at the end
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("X-Record-Count", str(len(page)))
+            if next_cursor is not None:
+                self.send_header("X-Next-Cursor", urllib.parse.quote(next_cursor))
+            self.end_headers()
+            for i in range(0, len(page), STREAM_CHUNK):
+                self.wfile.write("".join(json.dumps(entry) + "\n" for entry in page[i:i + STREAM_CHUNK]).encode())
+
+        def _json(self, body: bytes, status: int = 200) -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return QueryHandler
+
+
+def serve(engine: TelemetryQueryEngine, port: int = DEFAULT_PORT, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), make_handler(engine))
+    server.daemon_threads = True
+    return server
+
+
+def _first(query: dict, name: str) -> str | None:
+    values = query.get(name)
+    return values[0] if values else None
+
+
+def _list(query: dict, name: str) -> list[str] | None:
+    # ?sensor=A01&sensor=B01 or ?sensor=A01,B01
+    values = [value for item in query.get(name, []) for value in item.split(",") if value]
+    return values or None
+
+
+def _float(query: dict, name: str) -> float | None:
+    value = _first(query, name)
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f"{name} must be a number") from None
+
+
+def _int(query: dict, name: str, default: int) -> int:
+    # only a missing parameter takes the default: ?n=0 means zero
+    value = _float(query, name)
+    return default if value is None else int(value)
+
+
+class QueryClient:
+    # for ad-hoc scripts and the dashboard: the same queries over HTTP
+    def __init__(self, base_url: str = f"http://127.0.0.1:{DEFAULT_PORT}", timeout: float = 30):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def sensors(self) -> dict:
+        return self._get_json("/sensors")
+
+    def records(self, sensor_ids: list[str] | None = None, start: float | None = None, end: float | None = None,
+                keys: list[str] | None = None, page_size: int = DEFAULT_PAGE_SIZE):
+        # every record of the range, fetched page by page
+        cursor = None
+        while True:
+            params = {"sensor": sensor_ids, "start": start, "end": end, "key": keys, "limit": page_size,
+                      "cursor": cursor}
+            with urllib.request.urlopen(self._url("/records", params), timeout=self.timeout) as response:
+                next_cursor = response.headers.get("X-Next-Cursor")
+                for line in response:
+                    if line.strip():
+                        yield json.loads(line)
+            if next_cursor is None:
+                return
+            cursor = urllib.parse.unquote(next_cursor)
+
+    def series(self, sensor_ids: list[str] | None = None, keys: list[str] | None = None, start: float | None = None,
+               end: float | None = None, bucket_sec: float | None = None, stats=DEFAULT_SERIES_STATS) -> dict:
+        return self._get_json("/series", {"sensor": sensor_ids, "key": keys, "start": start, "end": end,
+                                          "bucket": bucket_sec, "stat": list(stats)})
+
+    def recent(self, n: int = 20, since: int = -1) -> dict:
+        return self._get_json("/recent", {"n": n, "since": since})
+
+    def delivery(self, bucket_sec: float | None = None) -> dict:
+        return self._get_json("/delivery", {"bucket": bucket_sec})
+
+    def stats(self) -> dict:
+        return self._get_json("/stats")
+
+    def _url(self, path: str, params: dict | None = None) -> str:
+        query = {name: ",".join(value) if isinstance(value, (list, tuple)) else value
+                 for name, value in (params or {}).items() if value is not None}
+        return self.base_url + path + ("?" + urllib.parse.urlencode(query) if query else "")
+
+    def _get_json(self, path: str, params: dict | None = None) -> dict:
+        with urllib.request.urlopen(self._url(path, params), timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve queries over a telemetry log kept loaded in memory")
+    parser.add_argument("filename", nargs="?", default="data/data.jsonl")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--refresh", type=float, default=REFRESH_INTERVAL_SEC, help="seconds between log tails")
+    parser.add_argument("--cache-size", type=int, default=CACHE_SIZE)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    engine = TelemetryQueryEngine(args.filename, args.refresh, args.cache_size).start()
+    stats = engine.stats()
+    print(f"Loaded {stats['records']} records of {stats['sensors']} sensors from {args.filename} "
+          f"in {time.perf_counter() - started:.2f}s")
+    server = serve(engine, args.port, args.host)
+    print(f"Serving on http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        engine.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,454 @@
+import json
+import math
+import os
+import shutil
+import sys
+import threading
+import time
+from datetime import UTC, datetime
+from typing import Callable
+
+import json_codec
+from aggregation import parse_quantile, to_number, validate_stats
+
+RESOLUTIONS = {"1m": 60, "1h": 3600, "1d": 86400}
+# each rollup file holds one period of buckets, small enough to rewrite on every flush
+FILE_PERIODS = {"1m": "hour", "1h": "day", "1d": "month"}
+FILE_FORMATS = {"hour": "%Y-%m-%dT%H", "day": "%Y-%m-%d", "month": "%Y-%m"}
+DEFAULT_KEYS = ("temperatureCelcius", "temperatureFahrenheit", "humidityPercent", "heatIndexCelcius", "heatIndexFahrenheit")
+SKETCH_ACCURACY = 0.01
+META_NAME = "meta.json"
+# a record this far behind the newest one at a flush (held by the ingest ordering window, a busy worker) may still
+# be on its way: flushed_until stays this far back, and a record later than that pulls it back until the next flush
+FLUSH_LATENESS_SEC = 60.0
+
+
+class QuantileSketch:
+    # DDSketch-style log buckets: any quantile is answered within SKETCH_ACCURACY relative error, and two sketches
+    # merge by adding their bucket counts
+    __slots__ = ("positive", "negative", "zeros")
+
+    gamma = (1 + SKETCH_ACCURACY) / (1 - SKETCH_ACCURACY)
+    log_gamma = math.log(gamma)
+
+    def __init__(self):
+        self.positive: dict[int, int] = {}
+        self.negative: dict[int, int] = {}
+        self.zeros = 0
+
+    def add(self, value: float) -> None:
+        if value == 0:
+            self.zeros += 1
+            return
+        store = self.positive if value > 0 else self.negative
+        index = math.ceil(math.log(abs(value)) / self.log_gamma)
+        store[index] = store.get(index, 0) + 1
+
+    def merge(self, other: "QuantileSketch") -> None:
+        for index, count in other.positive.items():
+            self.positive[index] = self.positive.get(index, 0) + count
+        for index, count in other.negative.items():
+            self.negative[index] = self.negative.get(index, 0) + count
+        self.zeros += other.zeros
+
+    def quantile(self, q: float) -> float | None:
+        count = sum(self.positive.values()) + sum(self.negative.values()) + self.zeros
+        if not count:
+            return None
+        # interpolated between neighbouring ranks like quantile_of_sorted, so an even-sized median stays within accuracy
+        position = q * (count - 1)
+        lower = math.floor(position)
+        fraction = position - lower
+        low_value = self._value_at_rank(lower)
+        if fraction == 0:
+            return low_value
+        return low_value + (self._value_at_rank(min(lower + 1, count - 1)) - low_value) * fraction
+
+    def _value_at_rank(self, rank: int) -> float:
+        seen = 0
+        for index in sorted(self.negative, reverse=True):
+            seen += self.negative[index]
+            if seen > rank:
+                return -self._value(index)
+        seen += self.zeros
+        if seen > rank:
+            return 0.0
+        for index in sorted(self.positive):
+            seen += self.positive[index]
+            if seen > rank:
+                return self._value(index)
+        return self._value(max(self.positive)) if self.positive else 0.0
+
+    def to_dict(self) -> dict:
+        return {"p": self.positive, "n": self.negative, "z": self.zeros}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "QuantileSketch":
+        sketch = cls()
+        sketch.positive = {int(index): count for index, count in data["p"].items()}
+        sketch.negative = {int(index): count for index, count in data["n"].items()}
+        sketch.zeros = data["z"]
+        return sketch
+
+    def _value(self, index: int) -> float:
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+
+class Bucket:
+    __slots__ = ("count", "sum", "sumsq", "min", "max", "first_ts", "first", "last_ts", "last", "sketch")
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.sumsq = 0.0
+        self.min = None
+        self.max = None
+        self.first_ts = None
+        self.first = None
+        self.last_ts = None
+        self.last = None
+        self.sketch = QuantileSketch()
+
+    def add(self, timestamp: float, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        self.sumsq += value * value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        if self.first_ts is None or timestamp < self.first_ts:
+            self.first_ts, self.first = timestamp, value
+        if self.last_ts is None or timestamp >= self.last_ts:
+            self.last_ts, self.last = timestamp, value
+        self.sketch.add(value)
+
+    def merge(self, other: "Bucket") -> None:
+        if not other.count:
+            return
+        self.count += other.count
+        self.sum += other.sum
+        self.sumsq += other.sumsq
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        if self.first_ts is None or other.first_ts < self.first_ts:
+            self.first_ts, self.first = other.first_ts, other.first
+        if self.last_ts is None or other.last_ts >= self.last_ts:
+            self.last_ts, self.last = other.last_ts, other.last
+        self.sketch.merge(other.sketch)
+
+    def stat(self, stat: str):
+        if stat == "count":
+            return self.count
+        if not self.count:
+            return 0.0 if stat == "sum" else None
+        if stat == "sum":
+            return self.sum
+        if stat == "mean":
+            return self.sum / self.count
+        if stat in ("min", "max", "first", "last"):
+            return getattr(self, stat)
+        if stat in ("variance", "stdev"):
+            if self.count < 2:
+                return None
+            variance = max(0.0, (self.sumsq - self.sum * self.sum / self.count) / (self.count - 1))
+            return variance if stat == "variance" else math.sqrt(variance)
+        # sketch estimates can land just outside the observed range
+        return min(max(self.sketch.quantile(parse_quantile(stat)), self.min), self.max)
+
+    def to_dict(self) -> dict:
+        return {"count": self.count, "sum": self.sum, "sumsq": self.sumsq, "min": self.min, "max": self.max,
+                "first": [self.first_ts, self.first], "last": [self.last_ts, self.last], "sketch": self.sketch.to_dict()}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Bucket":
+        bucket = cls()
+        bucket.count = data["count"]
+        bucket.sum = data["sum"]
+        bucket.sumsq = data["sumsq"]
+        bucket.min = data["min"]
+        bucket.max = data["max"]
+        bucket.first_ts, bucket.first = data["first"]
+        bucket.last_ts, bucket.last = data["last"]
+        bucket.sketch = QuantileSketch.from_dict(data["sketch"])
+        return bucket
+
+
+def bucket_start(timestamp: float, resolution: str) -> int:
+    seconds = RESOLUTIONS[resolution]
+    return int(timestamp // seconds) * seconds
+
+
+def file_period(timestamp: float, resolution: str) -> tuple[int, int]:
+    moment = datetime.fromtimestamp(timestamp, tz=UTC)
+    period = FILE_PERIODS[resolution]
+    if period == "hour":
+        start = moment.replace(minute=0, second=0, microsecond=0)
+        return int(start.timestamp()), int(start.timestamp()) + 3600
+    if period == "day":
+        start = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+        return int(start.timestamp()), int(start.timestamp()) + 86400
+    start = moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    following = start.replace(year=start.year + 1, month=1) if start.month == 12 else start.replace(month=start.month + 1)
+    return int(start.timestamp()), int(following.timestamp())
+
+
+def rollup_file_path(directory: str, resolution: str, period_start: int) -> str:
+    name = datetime.fromtimestamp(period_start, tz=UTC).strftime(FILE_FORMATS[FILE_PERIODS[resolution]])
+    return os.path.join(directory, resolution, name + ".json")
+
+
+class RollupFile:
+    # sensor_id -> key -> bucket start -> Bucket, for one period of one resolution
+    def __init__(self, path: str, start: int, end: int):
+        self.path = path
+        self.start = start
+        self.end = end
+        self.dirty = False
+        self.buckets: dict[str, dict[str, dict[int, Bucket]]] = {}
+        if os.path.exists(path):
+            with open(path, "r") as file:
+                data = json.load(file)
+            for sensor_id, keys in data.items():
+                self.buckets[sensor_id] = {
+                    key: {int(start): Bucket.from_dict(bucket) for start, bucket in buckets.items()}
+                    for key, buckets in keys.items()
+                }
+
+    def bucket(self, sensor_id: str, key: str, start: int) -> Bucket:
+        buckets = self.buckets.setdefault(sensor_id, {}).setdefault(key, {})
+        bucket = buckets.get(start)
+        if bucket is None:
+            bucket = buckets[start] = Bucket()
+        return bucket
+
+    def save(self) -> None:
+        data = {
+            sensor_id: {key: {str(start): bucket.to_dict() for start, bucket in buckets.items()} for key, buckets in keys.items()}
+            for sensor_id, keys in self.buckets.items()
+        }
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(data, file, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+
+class RollupStore:
+    # updated record by record at ingest; dirty period files are rewritten at most every flush_interval_sec, and
+    # files whose period ended more than keep_sec ago are dropped from memory (reloaded if a late record shows up)
+    def __init__(self, directory: str, resolutions=tuple(RESOLUTIONS), keys=DEFAULT_KEYS,
+                 flush_interval_sec: float = 10.0, keep_sec: float = 2 * 86400):
+        for resolution in resolutions:
+            if resolution not in RESOLUTIONS:
+                raise ValueError(f"Unknown resolution: {resolution}")
+        self.directory = directory
+        self.resolutions = tuple(resolutions)
+        self.keys = tuple(keys)
+        self.flush_interval_sec = flush_interval_sec
+        self.keep_sec = keep_sec
+        self._lock = threading.Lock()
+        self._files: dict[tuple[str, int], RollupFile] = {}
+        self._last_flush = time.monotonic()
+        self._latest_ts = 0.0
+        self.records_added = 0
+        self.meta = self._load_meta()
+
+    def add(self, record: dict) -> None:
+        sensor_id = record.get("sensor_id")
+        timestamp = record.get("received_at")
+        # a repeated reading (see ingest_ordering) was rolled up when it was new
+        if not sensor_id or timestamp is None or record.get("repeated"):
+            return
+        values = []
+        for key in self.keys:
+            value = to_number(record.get(key))
+            if value is not None and not math.isnan(value):
+                values.append((key, float(value)))
+        with self._lock:
+            self.records_added += 1
+            self._latest_ts = max(self._latest_ts, timestamp)
+            meta_changed = False
+            if self.meta.get("since") is None or timestamp < self.meta["since"]:
+                self.meta["since"] = timestamp
+                meta_changed = True
+            flushed_until = self.meta.get("flushed_until")
+            if flushed_until is not None and timestamp < flushed_until:
+                self.meta["flushed_until"] = timestamp
+                meta_changed = True
+            if meta_changed:
+                self._save_meta()
+            for resolution in self.resolutions:
+                rollup_file = self._file(resolution, timestamp)
+                start = bucket_start(timestamp, resolution)
+                for key, value in values:
+                    rollup_file.bucket(sensor_id, key, start).add(timestamp, value)
+                rollup_file.dirty = True
+            if time.monotonic() - self._last_flush >= self.flush_interval_sec:
+                self._flush_locked()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+    def close(self) -> None:
+        self.flush()
+
+    def buckets(self, resolution: str, sensor_id: str, key: str, start: float, end: float) -> list[Bucket]:
+        # complete buckets of this resolution inside [start, end)
+        seconds = RESOLUTIONS[resolution]
+        found = []
+        with self._lock:
+            for rollup_file in self._files_between(resolution, start, end):
+                for bucket_ts, bucket in rollup_file.buckets.get(sensor_id, {}).get(key, {}).items():
+                    if bucket_ts >= start and bucket_ts + seconds <= end:
+                        found.append(bucket)
+        return found
+
+    def sensor_ids(self, start: float, end: float) -> list[str]:
+        # the coarsest resolution has a (possibly partial) bucket for every sensor that reported in the window
+        coarsest = max(self.resolutions, key=RESOLUTIONS.get)
+        found = {}
+        with self._lock:
+            for rollup_file in self._files_between(coarsest, start, end):
+                found.update(dict.fromkeys(rollup_file.buckets))
+        return list(found)
+
+    def plan(self, start: float, end: float) -> tuple[list[tuple[str, int, int]], list[tuple[float, float]]]:
+        # covers [start, end) with the coarsest complete buckets; returns them and the raw [lo, hi) edges left over.
+        # Time before the first record the rollups saw, and from flushed_until on (buckets still filling up, or not
+        # saved yet), is always raw
+        since = self.meta.get("since")
+        flushed_until = self.meta.get("flushed_until")
+        raw = []
+        if since is None or flushed_until is None:
+            return [], [(start, end)]
+        if start < since:
+            raw.append((start, min(since, end)))
+            start = since
+        if end > max(start, flushed_until):
+            raw.append((max(start, flushed_until), end))
+            end = flushed_until
+        covered = []
+        self._cover(start, end, 0, covered, raw)
+        raw.sort()
+        return covered, raw
+
+    def query(self, sensor_id: str, key: str, start: float, end: float,
+              raw_values: Callable[[str, str, float, float], list[tuple[float, float]]]) -> Bucket:
+        covered, raw = self.plan(start, end)
+        result = Bucket()
+        by_resolution: dict[str, list[tuple[int, int]]] = {}
+        for resolution, lo, hi in covered:
+            by_resolution.setdefault(resolution, []).append((lo, hi))
+        for resolution, spans in by_resolution.items():
+            for lo, hi in spans:
+                for bucket in self.buckets(resolution, sensor_id, key, lo, hi):
+                    result.merge(bucket)
+        for lo, hi in raw:
+            for timestamp, value in raw_values(sensor_id, key, lo, hi):
+                result.add(timestamp, value)
+        return result
+
+    def _cover(self, start: float, end: float, level: int, covered: list, raw: list) -> None:
+        if start >= end:
+            return
+        ordered = sorted(self.resolutions, key=RESOLUTIONS.get, reverse=True)
+        if level >= len(ordered):
+            raw.append((start, end))
+            return
+        resolution = ordered[level]
+        seconds = RESOLUTIONS[resolution]
+        lo = math.ceil(start / seconds) * seconds
+        hi = math.floor(end / seconds) * seconds
+        if lo >= hi:
+            self._cover(start, end, level + 1, covered, raw)
+            return
+        covered.append((resolution, lo, hi))
+        self._cover(start, lo, level + 1, covered, raw)
+        self._cover(hi, end, level + 1, covered, raw)
+
+    def _file(self, resolution: str, timestamp: float) -> RollupFile:
+        start, end = file_period(timestamp, resolution)
+        rollup_file = self._files.get((resolution, start))
+        if rollup_file is None:
+            rollup_file = RollupFile(rollup_file_path(self.directory, resolution, start), start, end)
+            self._files[(resolution, start)] = rollup_file
+        return rollup_file
+
+    def _files_between(self, resolution: str, start: float, end: float) -> list[RollupFile]:
+        files = []
+        timestamp = file_period(start, resolution)[0]
+        while timestamp < end:
+            files.append(self._file(resolution, timestamp))
+            timestamp = files[-1].end
+        return files
+
+    def _flush_locked(self) -> None:
+        for key, rollup_file in list(self._files.items()):
+            if rollup_file.dirty:
+                rollup_file.save()
+            if rollup_file.end + self.keep_sec < self._latest_ts:
+                del self._files[key]
+        # written after the bucket files it vouches for: a crash in between leaves it behind them, never ahead
+        if self.records_added:
+            flushed_until = self._latest_ts - FLUSH_LATENESS_SEC
+            if self.meta.get("flushed_until") is None or flushed_until > self.meta["flushed_until"]:
+                self.meta["flushed_until"] = flushed_until
+                self._save_meta()
+        self._last_flush = time.monotonic()
+
+    def _load_meta(self) -> dict:
+        try:
+            with open(os.path.join(self.directory, META_NAME), "r") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {"since": None}
+
+    def _save_meta(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, META_NAME)
+        with open(path + ".tmp", "w") as file:
+            json.dump(self.meta, file)
+        os.replace(path + ".tmp", path)
+
+
+def bucket_stats(bucket: Bucket, stats) -> dict:
+    return {stat: bucket.stat(stat) for stat in validate_range_stats(stats)}
+
+
+def validate_range_stats(stats) -> tuple[str, ...]:
+    stats = tuple(stats)
+    validate_stats(stat for stat in stats if stat not in ("first", "last"))
+    return stats
+
+
+def rebuild(jsonl_path: str, directory: str) -> int:
+    # recomputes the rollups for a whole history, replacing whatever the directory held
+    if os.path.isdir(directory):
+        shutil.rmtree(directory)
+    store = RollupStore(directory)
+    with open(jsonl_path, "rb") as file:
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                store.add(json_codec.loads(line))
+            except json_codec.DecodeError:
+                continue
+    store.close()
+    return store.records_added
+
+
+def main():
+    if len(sys.argv) != 4 or sys.argv[1] != "rebuild":
+        print("Usage: python rollups.py rebuild <file.jsonl> <rollup directory>")
+        return
+    count = rebuild(sys.argv[2], sys.argv[3])
+    print(f"Rolled up {count} records into {sys.argv[3]}")
+
+
+if __name__ == "__main__":
+    main()
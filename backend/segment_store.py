@@ -0,0 +1,502 @@
+import bz2
+import gzip
+import io
+import json
+import lzma
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import UTC, datetime
+from typing import Callable
+
+import json_codec
+from jsonl_writer import BufferedJsonlWriter
+
+PARTITION_SECONDS = {"hour": 3600, "day": 86400}
+PARTITION_FORMATS = {"hour": "%Y-%m-%dT%H", "day": "%Y-%m-%d"}
+MANIFEST_NAME = "manifest.json"
+SEGMENT_SUFFIX = ".jsonl"
+CLOSING_SUFFIX = ".closing"
+
+
+class Codec:
+    # open_reader wraps an open binary file in a decompressing reader
+    def __init__(self, name: str, extension: str, compress: Callable[[bytes], bytes],
+                 open_reader: Callable[[io.IOBase], io.IOBase]):
+        self.name = name
+        self.extension = extension
+        self.compress = compress
+        self.open_reader = open_reader
+
+
+CODECS: dict[str, Codec] = {}
+
+
+def register_codec(codec: Codec) -> None:
+    CODECS[codec.name] = codec
+
+
+# every codec must accept concatenated streams: a segment reopened by late records is compressed again and
+# appended to the existing archive
+register_codec(Codec("none", "", lambda data: data, lambda file: file))
+register_codec(Codec("gzip", ".gz", lambda data: gzip.compress(data, compresslevel=6),
+                     lambda file: gzip.GzipFile(fileobj=file, mode="rb")))
+register_codec(Codec("bz2", ".bz2", bz2.compress, lambda file: bz2.BZ2File(file, "rb")))
+register_codec(Codec("lzma", ".xz", lzma.compress, lambda file: lzma.LZMAFile(file, "rb")))
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+if zstandard is not None:
+    register_codec(Codec(
+        "zstd", ".zst",
+        lambda data: zstandard.ZstdCompressor().compress(data),
+        lambda file: zstandard.ZstdDecompressor().stream_reader(file, read_across_frames=True),
+    ))
+
+
+def codec_for_path(path: str) -> Codec:
+    for codec in CODECS.values():
+        if codec.extension and path.endswith(SEGMENT_SUFFIX + codec.extension):
+            return codec
+    return CODECS["none"]
+
+
+def open_segment_reader(path: str, file, size: int | None = None):
+    # with size, only the archive's committed prefix is read: bytes past it come from an archive step that never
+    # reached the manifest
+    if size is not None:
+        file = io.BytesIO(file.read(size))
+    return codec_for_path(path).open_reader(file)
+
+
+def period_start(timestamp: float, partition: str) -> float:
+    seconds = PARTITION_SECONDS[partition]
+    return float(int(timestamp // seconds) * seconds)
+
+
+def segment_name(start: float, partition: str) -> str:
+    return datetime.fromtimestamp(start, tz=UTC).strftime(PARTITION_FORMATS[partition]) + SEGMENT_SUFFIX
+
+
+def parse_segment_window(filename: str) -> tuple[float, float] | None:
+    base = os.path.basename(filename)
+    if SEGMENT_SUFFIX not in base:
+        return None
+    stem = base[:base.index(SEGMENT_SUFFIX)]
+    for partition, fmt in PARTITION_FORMATS.items():
+        try:
+            start = datetime.strptime(stem, fmt).replace(tzinfo=UTC).timestamp()
+        except ValueError:
+            continue
+        return start, start + PARTITION_SECONDS[partition]
+    return None
+
+
+class SegmentManifest:
+    # relative segment path -> {"start", "end", "min_ts", "max_ts", "count", "sensor_id", "codec"}, plus for compressed
+    # archives "size" (committed bytes) and "absorbed" (.closing files whose records the committed bytes hold)
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.path = os.path.join(directory, MANIFEST_NAME)
+        self._lock = threading.Lock()
+        self.segments: dict[str, dict] = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r") as file:
+                self.segments = json.load(file)
+
+    def merge(self, relative_path: str, info: dict) -> None:
+        with self._lock:
+            current = self.segments.get(relative_path)
+            if current is not None:
+                info = dict(info)
+                info["min_ts"] = min(current["min_ts"], info["min_ts"])
+                info["max_ts"] = max(current["max_ts"], info["max_ts"])
+                info["count"] = current["count"] + info["count"]
+                if "absorbed" in info:
+                    # closing files already removed need no hiding any more
+                    still_there = [name for name in current.get("absorbed", [])
+                                   if os.path.exists(os.path.join(self.directory, name))]
+                    info["absorbed"] = still_there + info["absorbed"]
+            self.segments[relative_path] = info
+            self._save()
+
+    def remove(self, relative_path: str) -> None:
+        with self._lock:
+            if self.segments.pop(relative_path, None) is not None:
+                self._save()
+
+    def items(self) -> list[tuple[str, dict]]:
+        with self._lock:
+            return list(self.segments.items())
+
+    def get(self, relative_path: str) -> dict | None:
+        with self._lock:
+            return self.segments.get(relative_path)
+
+    def _save(self) -> None:
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(self.segments, file, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+class OpenSegment:
+    def __init__(self, path: str, relative_path: str, start: float, end: float, sensor_id: str | None,
+                 writer: BufferedJsonlWriter | None):
+        self.path = path
+        self.relative_path = relative_path
+        self.start = start
+        self.end = end
+        self.sensor_id = sensor_id
+        self.writer = writer
+        self.min_ts = float("inf")
+        self.max_ts = float("-inf")
+        self.count = 0
+        # set once the writer is closed and the segment queued for archiving
+        self.closed = threading.Event()
+
+
+class SegmentWriter:
+    def __init__(self, directory: str, partition: str = "hour", per_sensor: bool = False, codec: str = "gzip",
+                 retention_sec: float | None = None, max_segments: int | None = None, close_grace_sec: float = 60.0,
+                 writer_options: dict | None = None):
+        if partition not in PARTITION_SECONDS:
+            raise ValueError(f"Unknown partition: {partition}")
+        if codec not in CODECS:
+            raise ValueError(f"Unknown codec: {codec} (available: {', '.join(CODECS)})")
+        self.directory = directory
+        self.partition = partition
+        self.per_sensor = per_sensor
+        self.codec = CODECS[codec]
+        self.retention_sec = retention_sec
+        self.max_segments = max_segments
+        self.close_grace_sec = close_grace_sec
+        self.writer_options = writer_options or {}
+
+        os.makedirs(directory, exist_ok=True)
+        self.manifest = SegmentManifest(directory)
+        self._lock = threading.Lock()
+        self._open: dict[tuple[float, str | None], OpenSegment] = {}
+        # taken out of _open, writer still being closed (outside the lock) by the thread that closed it
+        self._closing: list[OpenSegment] = []
+        self._latest_ts = 0.0
+        self._closed_stats = {"records_written": 0, "records_dropped": 0, "records_delayed": 0}
+        self._compress_queue: queue.Queue = queue.Queue()
+        self._compressor = threading.Thread(target=self._compress_loop, name="segment-compressor", daemon=True)
+        self.segments_closed = 0
+        self.segments_deleted = 0
+        self._recover()
+        self._compressor.start()
+
+    def write(self, data: dict) -> bool:
+        received_at = data.get("received_at")
+        if received_at is None:
+            received_at = time.time()
+        sensor_id = data.get("sensor_id") if self.per_sensor else None
+        start = period_start(received_at, self.partition)
+
+        with self._lock:
+            segment = self._open.get((start, sensor_id))
+            if segment is None:
+                segment = self._open_segment(start, sensor_id)
+            segment.min_ts = min(segment.min_ts, received_at)
+            segment.max_ts = max(segment.max_ts, received_at)
+            segment.count += 1
+            if received_at > self._latest_ts:
+                self._latest_ts = received_at
+                to_close = [s for s in self._open.values() if s.end + self.close_grace_sec <= received_at]
+            else:
+                to_close = []
+            for old in to_close:
+                self._detach_segment(old)
+            written = segment.writer.write(data)
+        # joining the flusher and the fsync happen here, so other writers are not held up behind them
+        for old in to_close:
+            self._close_segment(old)
+        return written
+
+    def close(self) -> None:
+        with self._lock:
+            segments = list(self._open.values())
+            for segment in segments:
+                self._detach_segment(segment)
+            closing = list(self._closing)
+        for segment in segments:
+            self._close_segment(segment)
+        # segments other threads are still closing go into the compress queue before the end marker
+        for segment in closing:
+            segment.closed.wait()
+        self._compress_queue.put(None)
+        self._compressor.join()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._closed_stats)
+            for segment in list(self._open.values()) + self._closing:
+                writer_stats = segment.writer.stats()
+                for key in stats:
+                    stats[key] += writer_stats[key]
+            stats["open_segments"] = len(self._open)
+        stats["filename"] = self.directory
+        stats["segments_closed"] = self.segments_closed
+        stats["segments_deleted"] = self.segments_deleted
+        return stats
+
+    def _open_segment(self, start: float, sensor_id: str | None) -> OpenSegment:
+        # caller holds self._lock
+        if not self.codec.extension:
+            # a late record reopens the closed file in place (nothing moved it aside): let the old writer finish
+            # first. Rare, and the thread closing it does not need the lock to get there
+            for closing in self._closing:
+                if (closing.start, closing.sensor_id) == (start, sensor_id):
+                    closing.closed.wait()
+        relative_dir = sensor_id if sensor_id else ""
+        os.makedirs(os.path.join(self.directory, relative_dir), exist_ok=True)
+        relative_path = os.path.join(relative_dir, segment_name(start, self.partition))
+        path = os.path.join(self.directory, relative_path)
+        writer = BufferedJsonlWriter(path, **self.writer_options)
+        segment = OpenSegment(path, relative_path, start, start + PARTITION_SECONDS[self.partition], sensor_id, writer)
+        self._open[(start, sensor_id)] = segment
+        return segment
+
+    def _detach_segment(self, segment: OpenSegment) -> None:
+        # caller holds self._lock; _close_segment(segment) must follow, without the lock
+        del self._open[(segment.start, segment.sensor_id)]
+        self._closing.append(segment)
+        if self.codec.extension:
+            # move it aside so late records for the same period start a fresh file instead of racing the compressor;
+            # the writer keeps appending to the renamed file until it is closed
+            self._move_aside(segment)
+
+    def _close_segment(self, segment: OpenSegment) -> None:
+        segment.writer.close()
+        self._compress_queue.put(segment)
+        segment.closed.set()
+        writer_stats = segment.writer.stats()
+        with self._lock:
+            for key in self._closed_stats:
+                self._closed_stats[key] += writer_stats[key]
+            self._closing.remove(segment)
+
+    def _compress_loop(self) -> None:
+        while True:
+            segment = self._compress_queue.get()
+            if segment is None:
+                return
+            try:
+                self._archive(segment)
+            except OSError as e:
+                print(f"Could not archive segment {segment.path}: {e}")
+
+    def _recover(self) -> None:
+        # a crashed run leaves segments that were never closed and .closing files whose archive step did not finish;
+        # they are archived now (retention then covers them), and .closing files the manifest already absorbed removed
+        absorbed = {name for _, info in self.manifest.items() for name in info.get("absorbed", ())}
+        leftovers = []
+        for root, _, files in os.walk(self.directory):
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                relative = os.path.relpath(path, self.directory)
+                if name.endswith(".tmp"):
+                    os.remove(path)
+                elif CLOSING_SUFFIX in name:
+                    if relative in absorbed:
+                        os.remove(path)
+                    else:
+                        leftovers.append((path, relative[:relative.index(CLOSING_SUFFIX)]))
+                elif name.endswith(SEGMENT_SUFFIX) and self.manifest.get(relative) is None:
+                    leftovers.append((path, relative))
+        for path, relative_path in leftovers:
+            segment = self._scan_segment(path, relative_path)
+            if segment is None:
+                continue
+            if self.codec.extension and CLOSING_SUFFIX not in os.path.basename(path):
+                self._move_aside(segment)
+            self._compress_queue.put(segment)
+
+    def _move_aside(self, segment: OpenSegment) -> None:
+        # unique across runs: the manifest lists absorbed .closing names, and a reused name would hide new records
+        closing_path = f"{segment.path}{CLOSING_SUFFIX}{uuid.uuid4().hex[:12]}"
+        os.replace(segment.path, closing_path)
+        segment.path = closing_path
+
+    def _scan_segment(self, path: str, relative_path: str) -> OpenSegment | None:
+        window = parse_segment_window(relative_path)
+        if window is None:
+            return None
+        segment = OpenSegment(path, relative_path, window[0], window[1], os.path.dirname(relative_path) or None, None)
+        with open(path, "rb") as file:
+            for line in file:
+                try:
+                    entry = json_codec.loads(line)
+                except json_codec.DecodeError:
+                    continue
+                if not isinstance(entry, dict):
+                    continue
+                segment.count += 1
+                received_at = entry.get("received_at")
+                if isinstance(received_at, (int, float)):
+                    segment.min_ts = min(segment.min_ts, received_at)
+                    segment.max_ts = max(segment.max_ts, received_at)
+        if segment.count and segment.min_ts > segment.max_ts:
+            segment.min_ts, segment.max_ts = window
+        return segment
+
+    def _archive(self, segment: OpenSegment) -> None:
+        relative_path = segment.relative_path + self.codec.extension
+        info = {
+            "start": segment.start,
+            "end": segment.end,
+            "min_ts": segment.min_ts,
+            "max_ts": segment.max_ts,
+            "count": segment.count,
+            "sensor_id": segment.sensor_id,
+            "codec": self.codec.name,
+        }
+        if not self.codec.extension:
+            if segment.count:
+                self.manifest.merge(relative_path, info)
+        else:
+            if segment.count:
+                with open(segment.path, "rb") as file:
+                    data = file.read()
+                if not data.endswith(b"\n"):
+                    # torn last line of a crashed run: keep it from swallowing the next archived line
+                    data += b"\n"
+                compressed = self.codec.compress(data)
+                # the archive is rebuilt from its committed prefix next to it and swapped in, then the manifest save
+                # commits it: readers see the new bytes and stop reading the .closing file at the same moment
+                archive_path = os.path.join(self.directory, relative_path)
+                committed = self._committed_size(relative_path, archive_path)
+                tmp_path = archive_path + ".tmp"
+                with open(tmp_path, "wb") as out:
+                    if committed:
+                        with open(archive_path, "rb") as file:
+                            out.write(file.read(committed))
+                    out.write(compressed)
+                    out.flush()
+                    os.fsync(out.fileno())
+                os.replace(tmp_path, archive_path)
+                info["size"] = committed + len(compressed)
+                info["absorbed"] = [os.path.relpath(segment.path, self.directory)]
+                self.manifest.merge(relative_path, info)
+            os.remove(segment.path)
+        self.segments_closed += 1
+        self._apply_retention()
+
+    def _committed_size(self, relative_path: str, archive_path: str) -> int:
+        info = self.manifest.get(relative_path)
+        if info is None:
+            # an archive file the manifest never recorded holds nothing committed
+            return 0
+        if "size" in info:
+            return info["size"]
+        return os.path.getsize(archive_path) if os.path.exists(archive_path) else 0
+
+    def _apply_retention(self) -> None:
+        segments = sorted(self.manifest.items(), key=lambda item: item[1]["end"])
+        expired = []
+        if self.retention_sec is not None:
+            cutoff = self._latest_ts - self.retention_sec
+            expired.extend(path for path, info in segments if info["end"] <= cutoff)
+        if self.max_segments is not None and len(segments) > self.max_segments:
+            expired.extend(path for path, _ in segments[:len(segments) - self.max_segments])
+        for relative_path in dict.fromkeys(expired):
+            try:
+                os.remove(os.path.join(self.directory, relative_path))
+            except FileNotFoundError:
+                pass
+            self.manifest.remove(relative_path)
+            self.segments_deleted += 1
+
+
+def list_segments(directory: str) -> list[tuple[str, dict]]:
+    # archived segments come from the manifest; segments still being written are found on disk. The disk is scanned
+    # first: a segment archived in between is then already marked absorbed in the manifest that is read after
+    on_disk = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if name.endswith(SEGMENT_SUFFIX) or CLOSING_SUFFIX in name:
+                on_disk.append((os.path.join(root, name), name))
+    manifest = SegmentManifest(directory)
+    segments = {os.path.join(directory, path): info for path, info in manifest.items()}
+    absorbed = {os.path.join(directory, name) for info in segments.values() for name in info.get("absorbed", ())}
+    for path, name in on_disk:
+        if path not in segments and path not in absorbed:
+            window = parse_segment_window(name)
+            if window is None:
+                continue
+            segments[path] = {"start": window[0], "end": window[1], "min_ts": window[0], "max_ts": window[1],
+                              "sensor_id": None, "codec": "none"}
+    return sorted(segments.items(), key=lambda item: (item[1]["start"], item[0]))
+
+
+def open_segments(directory: str, selected: Callable[[dict], bool] = lambda info: True,
+                  attempts: int = 3) -> list[tuple[str, dict, io.IOBase]]:
+    # every listed file is opened before any is read, so archiving or retention running meanwhile cannot take a file
+    # away halfway; a file that is gone already means the listing is stale (archived or expired), so it is taken again
+    for attempt in range(attempts):
+        opened = []
+        try:
+            for path, info in list_segments(directory):
+                if selected(info):
+                    opened.append((path, info, open(path, "rb")))
+            return opened
+        except FileNotFoundError:
+            for _, _, file in opened:
+                file.close()
+            if attempt == attempts - 1:
+                raise
+    return []
+
+
+def iter_segment_entries(directory: str, start: float | None = None, end: float | None = None,
+                         sensor_ids: list[str] | None = None):
+    wanted = set(sensor_ids) if sensor_ids is not None else None
+
+    def selected(info: dict) -> bool:
+        if start is not None and info["max_ts"] < start:
+            return False
+        if end is not None and info["min_ts"] > end:
+            return False
+        return wanted is None or info.get("sensor_id") is None or info["sensor_id"] in wanted
+
+    opened = open_segments(directory, selected)
+    try:
+        for path, info, file in opened:
+            yield from _segment_entries(open_segment_reader(path, file, info.get("size")), start, end, wanted)
+    finally:
+        for _, _, file in opened:
+            file.close()
+
+
+def _segment_entries(reader, start: float | None, end: float | None, wanted: set | None):
+    with reader:
+        for line in io.TextIOWrapper(reader):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json_codec.loads(line)
+            except json_codec.DecodeError as e:
+                print("JSON error:", e)
+                print("Bad line (preview):", line[:120])
+                continue
+            received_at = entry.get("received_at", 0)
+            if start is not None and received_at < start:
+                continue
+            if end is not None and received_at > end:
+                continue
+            if wanted is not None and entry.get("sensor_id") not in wanted:
+                continue
+            yield entry
+
+
+def read_segment_entries(directory: str, start: float | None = None, end: float | None = None,
+                         sensor_ids: list[str] | None = None) -> list[dict]:
+    return list(iter_segment_entries(directory, start, end, sensor_ids))
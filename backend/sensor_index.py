@@ -0,0 +1,256 @@
+import bisect
+import os
+import struct
+import sys
+import threading
+import zlib
+from array import array
+
+import json_codec
+
+MAGIC = b"TLMIDX01"
+# magic, number of jsonl bytes covered by the index, crc32 of the first HEAD_BYTES of the jsonl file
+HEADER = struct.Struct("<8sQI")
+# sensor_id, received_at, byte offset, line length (newline included), previous record of the same sensor (-1: none)
+RECORD = struct.Struct("<32sdQIq")
+HEAD_BYTES = 256
+
+
+def index_path_for(jsonl_path: str) -> str:
+    return jsonl_path + ".idx"
+
+
+class SensorIndex:
+    def __init__(self, jsonl_path: str, index_path: str | None = None, writable: bool = True):
+        self.jsonl_path = jsonl_path
+        self.index_path = index_path or index_path_for(jsonl_path)
+        # read-only indexes (analyzers) catch up and rebuild in memory but never touch the sidecar file
+        self.writable = writable
+        self.covered = 0
+        self.head_crc = 0
+        self._head_len = 0
+        self.count = 0
+        self.tails: dict[str, int] = {}
+        self._times: dict[str, array] = {}
+        self._offsets: dict[str, array] = {}
+        self._lengths: dict[str, array] = {}
+        self._sorted: dict[str, bool] = {}
+        self._lock = threading.Lock()
+        self._file = None
+
+    @classmethod
+    def open(cls, jsonl_path: str, index_path: str | None = None, writable: bool = True) -> "SensorIndex":
+        # loads the sidecar, catching up on lines appended since it was written and rebuilding it when stale
+        index = cls(jsonl_path, index_path, writable)
+        if not index._load():
+            index.rebuild()
+        elif index.covered < index._jsonl_size():
+            index.catch_up()
+        return index
+
+    def is_stale(self) -> bool:
+        size = self._jsonl_size()
+        return size < self.covered or self._compute_head_crc() != self.head_crc
+
+    def rebuild(self) -> None:
+        with self._lock:
+            self._reset()
+            if self.writable:
+                if self._file is not None:
+                    self._file.close()
+                self._file = open(self.index_path, "w+b")
+                self._write_header()
+        self.catch_up()
+
+    def catch_up(self) -> int:
+        if not os.path.exists(self.jsonl_path):
+            return 0
+        with open(self.jsonl_path, "rb") as file:
+            file.seek(self.covered)
+            data = file.read()
+        end = data.rfind(b"\n")
+        if end < 0:
+            return 0
+
+        records = []
+        offset = self.covered
+        for line in data[:end + 1].splitlines(keepends=True):
+            stripped = line.strip()
+            if stripped:
+                try:
+                    entry = json_codec.loads(stripped)
+                except json_codec.DecodeError:
+                    entry = None
+                if isinstance(entry, dict) and entry.get("sensor_id"):
+                    records.append((entry["sensor_id"], float(entry.get("received_at", 0.0)), offset, len(line)))
+            offset += len(line)
+        self.append(records, offset)
+        return len(records)
+
+    def append(self, records: list[tuple[str, float, int, int]], covered: int) -> None:
+        with self._lock:
+            first = self.count
+            chunks = []
+            for sensor_id, received_at, offset, length in records:
+                previous = self.tails.get(sensor_id, -1)
+                chunks.append(RECORD.pack(sensor_id.encode(), received_at, offset, length, previous))
+                self._add(sensor_id, received_at, offset, length)
+            self.covered = max(self.covered, covered)
+            if not self.writable:
+                return
+            if self._file is None:
+                self._file = open(self.index_path, "r+b" if os.path.exists(self.index_path) else "w+b")
+            self._file.seek(HEADER.size + first * RECORD.size)
+            self._file.write(b"".join(chunks))
+            self._write_header()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def sensor_ids(self) -> list[str]:
+        with self._lock:
+            return list(self._times)
+
+    def lookup(self, sensor_id: str, start: float | None = None, end: float | None = None,
+               last_n: int | None = None) -> list[tuple[int, int]]:
+        with self._lock:
+            if sensor_id not in self._times:
+                return []
+            if not self._sorted[sensor_id]:
+                self._sort(sensor_id)
+            times = self._times[sensor_id]
+            lo = 0 if start is None else bisect.bisect_left(times, start)
+            hi = len(times) if end is None else bisect.bisect_right(times, end)
+            if last_n is not None:
+                lo = max(lo, hi - last_n)
+            offsets = self._offsets[sensor_id]
+            lengths = self._lengths[sensor_id]
+            return [(offsets[i], lengths[i]) for i in range(lo, hi)]
+
+    def read_entries(self, sensor_ids: list[str] | None = None, start: float | None = None, end: float | None = None,
+                     last_n: int | None = None) -> list[dict]:
+        locations = []
+        for sensor_id in sensor_ids if sensor_ids is not None else self.sensor_ids():
+            locations.extend(self.lookup(sensor_id, start, end, last_n))
+        locations.sort()
+        entries = []
+        with open(self.jsonl_path, "rb") as file:
+            for offset, length in locations:
+                file.seek(offset)
+                line = file.read(length).strip()
+                try:
+                    entries.append(json_codec.loads(line))
+                except json_codec.DecodeError as e:
+                    print("JSON error:", e)
+                    print("Bad line (preview):", line[:120])
+        return entries
+
+    def _load(self) -> bool:
+        if not os.path.exists(self.index_path):
+            return False
+        with open(self.index_path, "rb") as file:
+            header = file.read(HEADER.size)
+            if len(header) < HEADER.size:
+                return False
+            magic, covered, head_crc = HEADER.unpack(header)
+            if magic != MAGIC:
+                return False
+            body = file.read()
+        self.covered = covered
+        self.head_crc = head_crc
+        self._head_len = min(HEAD_BYTES, covered)
+        if self.is_stale():
+            return False
+
+        whole = len(body) - len(body) % RECORD.size
+        for sensor_id, received_at, offset, length, _ in RECORD.iter_unpack(body[:whole]):
+            self._add(sensor_id.rstrip(b"\0").decode(), received_at, offset, length)
+        if whole != len(body) or (self.count and self._last_record_end(body) != self.covered):
+            # a torn write: keep the complete records and re-index from the last one
+            self.covered = self._last_record_end(body[:whole]) if self.count else 0
+        if self.writable:
+            self._file = open(self.index_path, "r+b")
+            self._file.truncate(HEADER.size + self.count * RECORD.size)
+        return True
+
+    def _last_record_end(self, body: bytes) -> int:
+        _, _, offset, length, _ = RECORD.unpack_from(body, (self.count - 1) * RECORD.size)
+        return offset + length
+
+    def _reset(self) -> None:
+        self.covered = 0
+        self.head_crc = 0
+        self._head_len = 0
+        self.count = 0
+        self.tails = {}
+        self._times = {}
+        self._offsets = {}
+        self._lengths = {}
+        self._sorted = {}
+
+    def _add(self, sensor_id: str, received_at: float, offset: int, length: int) -> None:
+        times = self._times.get(sensor_id)
+        if times is None:
+            times = self._times[sensor_id] = array("d")
+            self._offsets[sensor_id] = array("Q")
+            self._lengths[sensor_id] = array("I")
+            self._sorted[sensor_id] = True
+        elif times and received_at < times[-1]:
+            self._sorted[sensor_id] = False
+        times.append(received_at)
+        self._offsets[sensor_id].append(offset)
+        self._lengths[sensor_id].append(length)
+        self.tails[sensor_id] = self.count
+        self.count += 1
+
+    def _sort(self, sensor_id: str) -> None:
+        times = self._times[sensor_id]
+        order = sorted(range(len(times)), key=times.__getitem__)
+        self._times[sensor_id] = array("d", (times[i] for i in order))
+        self._offsets[sensor_id] = array("Q", (self._offsets[sensor_id][i] for i in order))
+        self._lengths[sensor_id] = array("I", (self._lengths[sensor_id][i] for i in order))
+        self._sorted[sensor_id] = True
+
+    def _write_header(self) -> None:
+        if self._head_len < HEAD_BYTES:
+            self.head_crc = self._compute_head_crc()
+            self._head_len = min(HEAD_BYTES, self.covered)
+        self._file.seek(0)
+        self._file.write(HEADER.pack(MAGIC, self.covered, self.head_crc))
+        self._file.flush()
+
+    def _compute_head_crc(self) -> int:
+        try:
+            with open(self.jsonl_path, "rb") as file:
+                return zlib.crc32(file.read(min(HEAD_BYTES, self.covered)))
+        except FileNotFoundError:
+            return zlib.crc32(b"")
+
+    def _jsonl_size(self) -> int:
+        try:
+            return os.path.getsize(self.jsonl_path)
+        except FileNotFoundError:
+            return 0
+
+
+def main():
+    if len(sys.argv) != 3 or sys.argv[1] not in ("rebuild", "check"):
+        print("Usage: python sensor_index.py rebuild|check <file.jsonl>")
+        return
+    command, filename = sys.argv[1], sys.argv[2]
+    if command == "rebuild":
+        index = SensorIndex(filename)
+        index.rebuild()
+    else:
+        index = SensorIndex.open(filename, writable=False)
+    for sensor_id in index.sensor_ids():
+        print(f"{sensor_id}: {len(index.lookup(sensor_id))} records")
+    print(f"{index.count} records indexed, {index.covered} bytes covered")
+    index.close()
+
+
+if __name__ == "__main__":
+    main()
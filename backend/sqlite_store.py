@@ -0,0 +1,329 @@
+import argparse
+import glob
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+
+import json_codec
+from aggregation import OVERALL, AggregateTable, exact_mean, validate_stats
+
+INT_FIELDS = ("sampledAt", "publishedAt", "ageReadings")
+FLOAT_FIELDS = ("temperatureCelcius", "temperatureFahrenheit", "humidityPercent", "heatIndexCelcius", "heatIndexFahrenheit")
+BOOL_FIELDS = ("isReadingValid", "hasNewReading")
+TEXT_FIELDS = ("error", "topic")
+# column order is the firmware payload's, so loaded entries look like the JSONL ones
+COLUMNS = ("sensor_id", *BOOL_FIELDS, *INT_FIELDS, *FLOAT_FIELDS, *TEXT_FIELDS, "received_at")
+# statistic -> SQL aggregate; anything else is computed from the loaded entries. SQLite's AVG / TOTAL are plain float
+# sums, so sum and mean use exact aggregates registered on the connection (same results as aggregate_entries)
+SQL_STATS = {"count": "COUNT", "min": "MIN", "max": "MAX", "mean": "EXACT_MEAN", "sum": "EXACT_SUM"}
+
+# rows not flagged "repeated" (a republished reading, kept in extra)
+NOT_REPEATED = "(extra IS NULL OR json_extract(extra, '$.repeated') IS NOT 1)"
+QUOTED_COLUMNS = ", ".join(f'"{column}"' for column in COLUMNS)
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS readings (
+    sensor_id TEXT,
+    %s,
+    %s,
+    %s,
+    received_at REAL,
+    -- any other keys, as a JSON object
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS readings_sensor_time ON readings (sensor_id, received_at);
+""" % (", ".join(f'"{field}" INTEGER' for field in BOOL_FIELDS + INT_FIELDS),
+       ", ".join(f'"{field}" REAL' for field in FLOAT_FIELDS),
+       ", ".join(f'"{field}" TEXT' for field in TEXT_FIELDS))
+INSERT = f"INSERT INTO readings ({QUOTED_COLUMNS}, extra) VALUES ({', '.join('?' * (len(COLUMNS) + 1))})"
+
+
+def _typed(field: str, value):
+    # the value for the typed column, or None when it has to go to `extra` to stay lossless
+    if value is None:
+        return None
+    if field in BOOL_FIELDS:
+        return int(value) if isinstance(value, bool) else None
+    if field in INT_FIELDS:
+        return value if isinstance(value, int) and not isinstance(value, bool) else None
+    if field in FLOAT_FIELDS or field == "received_at":
+        return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+    return value if isinstance(value, str) else None
+
+
+def encode_row(entry: dict) -> tuple:
+    row = []
+    extra = {}
+    for column in COLUMNS:
+        value = entry.get(column)
+        typed = _typed(column, value)
+        if typed is None and value is not None:
+            extra[column] = value
+        row.append(typed)
+    for key, value in entry.items():
+        if key not in extra and key not in COLUMNS:
+            extra[key] = value
+    row.append(json.dumps(extra) if extra else None)
+    return tuple(row)
+
+
+def decode_row(row: tuple) -> dict:
+    entry = {}
+    for column, value in zip(COLUMNS, row):
+        if value is not None:
+            entry[column] = bool(value) if column in BOOL_FIELDS else value
+    extra = row[len(COLUMNS)]
+    if extra:
+        entry.update(json_codec.loads(extra))
+    return entry
+
+
+class ExactSum:
+    # values are summed once at the end: math.fsum is the correctly rounded sum, the same as Accumulator's
+    def __init__(self):
+        self.values = []
+
+    def step(self, value) -> None:
+        if value is not None:
+            self.values.append(value)
+
+    def finalize(self):
+        return math.fsum(self.values)
+
+
+class ExactMean(ExactSum):
+    def finalize(self):
+        return exact_mean(self.values)
+
+
+def connect(filename: str, readonly: bool = False) -> sqlite3.Connection:
+    if readonly:
+        connection = sqlite3.connect(f"file:{filename}?mode=ro", uri=True, check_same_thread=False)
+        connection.create_aggregate("EXACT_SUM", 1, ExactSum)
+        connection.create_aggregate("EXACT_MEAN", 1, ExactMean)
+        return connection
+    directory = os.path.dirname(filename)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    connection = sqlite3.connect(filename, check_same_thread=False)
+    # WAL: readers (the analyzer, the query server) never block the subscriber's writes and vice versa
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+class SqliteRecordWriter:
+    # same write/flush/close/stats interface as BufferedJsonlWriter; records are batched in memory and inserted in
+    # one transaction on size or age
+    def __init__(self, filename: str, max_batch_records: int = 500, max_latency_sec: float = 1.0):
+        self.filename = filename
+        self.max_batch_records = max_batch_records
+        self.max_latency_sec = max_latency_sec
+        self._connection: sqlite3.Connection | None = connect(filename)
+        self._lock = threading.Lock()
+        self._buffer: list[tuple] = []
+        self._oldest = 0.0
+        self.records_written = 0
+        self.records_dropped = 0
+        self.batches = 0
+
+    def write(self, data: dict) -> bool:
+        with self._lock:
+            if self._connection is None:
+                self.records_dropped += 1
+                return False
+            if not self._buffer:
+                self._oldest = time.monotonic()
+            self._buffer.append(encode_row(data))
+            if len(self._buffer) >= self.max_batch_records or time.monotonic() - self._oldest >= self.max_latency_sec:
+                self._flush_locked()
+            return True
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is None:
+                return
+            self._flush_locked()
+            self._connection.close()
+            self._connection = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "filename": self.filename,
+                "records_written": self.records_written,
+                "records_buffered": len(self._buffer),
+                "records_dropped": self.records_dropped,
+                "records_delayed": 0,
+                "batches": self.batches,
+            }
+
+    def __enter__(self) -> "SqliteRecordWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _flush_locked(self) -> None:
+        if not self._buffer or self._connection is None:
+            return
+        with self._connection:
+            self._connection.executemany(INSERT, self._buffer)
+        self.records_written += len(self._buffer)
+        self.batches += 1
+        self._buffer = []
+
+
+class SqliteRecordStore:
+    # read side. A selection pins the rows a query saw (max rowid), so aggregates pushed down later cover exactly
+    # the entries that were loaded even while the subscriber keeps inserting
+    def __init__(self, filename: str):
+        if not os.path.exists(filename):
+            raise FileNotFoundError(filename)
+        self.filename = filename
+        self._connection = connect(filename, readonly=True)
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def __enter__(self) -> "SqliteRecordStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self._connection.execute("SELECT COUNT(*) FROM readings").fetchone()[0]
+
+    def sensor_ids(self) -> list[str]:
+        # DISTINCT over the leading index column, no table scan
+        rows = self._connection.execute("SELECT DISTINCT sensor_id FROM readings WHERE sensor_id != ''")
+        return [row[0] for row in rows]
+
+    def selection(self, sensor_ids: list[str] | None = None, start: float | None = None,
+                  end: float | None = None) -> dict:
+        max_rowid = self._connection.execute("SELECT MAX(rowid) FROM readings").fetchone()[0] or 0
+        return {"sensor_ids": list(sensor_ids) if sensor_ids is not None else None, "start": start, "end": end,
+                "max_rowid": max_rowid}
+
+    def read_entries(self, selection: dict) -> list[dict]:
+        # in insertion (log) order, like read_jsonl_file
+        where, params = self._where(selection)
+        rows = self._connection.execute(f"SELECT {QUOTED_COLUMNS}, extra FROM readings WHERE {where} ORDER BY rowid", params)
+        return [decode_row(row) for row in rows]
+
+    def aggregate(self, selection: dict, keys, stats, include_overall: bool = False, groups=None) -> AggregateTable:
+        # count/min/max/mean/sum of typed columns computed by SQLite; same table as aggregate_entries
+        keys = tuple(keys)
+        stats = validate_stats(stats)
+        if not can_push_down(keys, stats):
+            raise ValueError(f"Only {', '.join(SQL_STATS)} of {', '.join(INT_FIELDS + FLOAT_FIELDS)} run in SQL")
+        select = ", ".join(f'{SQL_STATS[stat]}("{key}")' for key in keys for stat in stats)
+        where, params = self._where(selection)
+        # like TelemetryAnalyzer, the values of repeated readings (ingest_ordering) are counted once
+        where += f" AND {NOT_REPEATED}"
+
+        def to_row(values) -> dict:
+            values = iter(values)
+            return {key: tuple(_result(stat, next(values)) for stat in stats) for key in keys}
+
+        rows = {group: to_row((None,) * len(keys) * len(stats)) for group in groups or ()}
+        for sensor_id, *values in self._connection.execute(
+                f"SELECT sensor_id, {select} FROM readings WHERE {where} AND sensor_id != '' GROUP BY sensor_id",
+                params):
+            rows[sensor_id] = to_row(values)
+        if include_overall:
+            rows[OVERALL] = to_row(self._connection.execute(f"SELECT {select} FROM readings WHERE {where}",
+                                                            params).fetchone())
+        return AggregateTable(keys, stats, rows)
+
+    def _where(self, selection: dict) -> tuple[str, list]:
+        clauses, params = ["rowid <= ?"], [selection["max_rowid"]]
+        sensor_ids = selection["sensor_ids"]
+        if sensor_ids is not None:
+            clauses.append(f"sensor_id IN ({', '.join('?' * len(sensor_ids))})" if sensor_ids else "0")
+            params.extend(sensor_ids)
+        elif selection["start"] is not None or selection["end"] is not None:
+            # a time range alone still goes through the (sensor_id, received_at) index, one range per sensor
+            sensor_ids = self.sensor_ids()
+            clauses.append(f"sensor_id IN ({', '.join('?' * len(sensor_ids))})" if sensor_ids else "0")
+            params.extend(sensor_ids)
+        if selection["start"] is not None:
+            clauses.append("received_at >= ?")
+            params.append(selection["start"])
+        if selection["end"] is not None:
+            clauses.append("received_at < ?")
+            params.append(selection["end"])
+        return " AND ".join(clauses), params
+
+
+def can_push_down(keys, stats) -> bool:
+    return all(key in INT_FIELDS + FLOAT_FIELDS for key in keys) and all(stat in SQL_STATS for stat in stats)
+
+
+def _result(stat: str, value):
+    if stat == "count":
+        return value or 0
+    return value
+
+
+def import_jsonl(paths: list[str], database: str, batch_records: int = 10_000) -> dict:
+    # one-shot import of existing logs; each batch is one transaction
+    bad_lines = 0
+    with SqliteRecordWriter(database, max_batch_records=batch_records, max_latency_sec=float("inf")) as writer:
+        for path in paths:
+            with open(path, "rb") as file:
+                for line in file:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json_codec.loads(line)
+                    except json_codec.DecodeError:
+                        bad_lines += 1
+                        continue
+                    if isinstance(entry, dict):
+                        writer.write(entry)
+                    else:
+                        bad_lines += 1
+    stats = writer.stats()
+    stats["bad_lines"] = bad_lines
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite storage for telemetry records")
+    commands = parser.add_subparsers(dest="command", required=True)
+    import_command = commands.add_parser("import", help="import JSONL logs (default: data/*.jsonl)")
+    import_command.add_argument("database")
+    import_command.add_argument("paths", nargs="*")
+    info_command = commands.add_parser("info", help="record and sensor counts")
+    info_command.add_argument("database")
+    args = parser.parse_args()
+
+    if args.command == "import":
+        paths = [path for pattern in (args.paths or ["data/*.jsonl"]) for path in sorted(glob.glob(pattern))]
+        if not paths:
+            print("No JSONL files to import")
+            return
+        started = time.perf_counter()
+        stats = import_jsonl(paths, args.database)
+        print(f"{stats['records_written']} records from {len(paths)} file(s) -> {args.database} "
+              f"in {time.perf_counter() - started:.1f}s")
+        if stats["bad_lines"]:
+            print(f"Skipped {stats['bad_lines']} bad lines")
+        return
+    with SqliteRecordStore(args.database) as store:
+        sensor_ids = store.sensor_ids()
+        print(f"{len(store)} records, {len(sensor_ids)} sensors: {', '.join(sensor_ids)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,68 +1,240 @@
-import paho.mqtt.client as mqtt
-import config
-import json
 import time
-import datetime
+import threading
 
-last_seen = {}
-status = {}
-OFFLINE_TIMEOUT_SEC = 30  
+import json_codec
+import metrics
 
-def on_connect(client, userdata, flags, rc):
-    if rc == 0:
-        print("Connected successfully")
-    else:
-        print("Connection failed with code " + str(rc))
+from jsonl_writer import BufferedJsonlWriter
+from sensor_index import SensorIndex
+from segment_store import SegmentWriter
+from binary_records import BinaryRecordWriter
+from sqlite_store import SqliteRecordWriter
+from ingest_pipeline import IngestPipeline
+from ingest_ordering import IngestOrderer
+from online_detector import OnlineAnomalyDetector, format_alert
+from offline_tracker import OFFLINE, OfflineTracker
+from aggregation import to_number
+from rollups import RollupStore
+from subscriber_service import SubscriberService, brokers_from_config
+
+Writer = BufferedJsonlWriter | SegmentWriter | BinaryRecordWriter | SqliteRecordWriter
+
+OFFLINE_TIMEOUT_SEC = 30
+DATA_FILENAME = "data/data.jsonl"
+# printing every payload on the paho network thread slows down ingest, keep it for debugging only
+VERBOSE = False
+# maintain data.jsonl.idx (per-sensor byte offsets) alongside the log
+WRITE_INDEX = True
+INGEST_WORKERS = 2
+INGEST_QUEUE_SIZE = 10_000
+INGEST_BACKPRESSURE = "drop_oldest"
+# "jsonl": one append-only data.jsonl, "segments": hourly/daily files under SEGMENT_DIRECTORY, compressed once closed,
+# "binary": fixed-width records in BINARY_FILENAME (see binary_records.py),
+# "sqlite": a WAL-mode SQLite database in SQLITE_FILENAME (see sqlite_store.py)
+STORAGE_BACKEND = "jsonl"
+BINARY_FILENAME = "data/data.bin"
+SQLITE_FILENAME = "data/telemetry.db"
+SEGMENT_DIRECTORY = "data/segments"
+SEGMENT_PARTITION = "hour"
+SEGMENT_PER_SENSOR = False
+SEGMENT_CODEC = "gzip"
+SEGMENT_RETENTION_DAYS = 30
+# per-sensor 1 min / 1 h / 1 day rollups used by TelemetryAnalyzer.range_stats
+WRITE_ROLLUPS = True
+ROLLUP_DIRECTORY = "data/rollups"
+# records are held this long and emitted per sensor in device-clock (publishedAt) order; QoS redeliveries are always
+# dropped. Republished readings (same sampledAt, hasNewReading false) are stored with "repeated": true: they count
+# as delivered messages for gaps and delivery quality and are left out of rollups, alerts and value statistics.
+# DROP_REPEATED_READINGS = True drops them instead, and the readers then report each one as a missed message
+ORDERING_WINDOW_SEC = 2.0
+DROP_REPEATED_READINGS = False
+# Prometheus text metrics on http://127.0.0.1:METRICS_PORT/metrics (None to disable), and a stats line on the console
+# every STATS_LINE_INTERVAL_SEC (None to disable)
+METRICS_PORT: int | None = 9108
+STATS_LINE_INTERVAL_SEC: float | None = 60
+
+writers: dict[str, Writer] = {}
+writers_lock = threading.Lock()
+pipeline: IngestPipeline | None = None
+rollups: RollupStore | None = None
+detector = OnlineAnomalyDetector()
 
+def on_sensor_offline(sensor_id: str) -> None:
+    print(f"Sensor {sensor_id} is OFFLINE")
 
-def on_subscribe(client, userdata, mid, granted_qos):
-    print("Subscribed successfully, QoS: ", granted_qos)
+def on_sensor_online(sensor_id: str) -> None:
+    print(f"Sensor {sensor_id} is back ONLINE")
+
+offline_tracker = OfflineTracker(OFFLINE_TIMEOUT_SEC, on_offline=on_sensor_offline, on_online=on_sensor_online)
+
+def on_sensor_reboot(sensor_id: str, record: dict) -> None:
+    print(f"Sensor {sensor_id} REBOOTED (device clock back to {record.get('publishedAt', record.get('sampledAt'))} ms)")
 
 def on_message(client, userdata, msg):
+    # runs on the paho network thread: only timestamp and enqueue, the workers do the rest
+    recv_ts = time.time()
+    if VERBOSE:
+        print("Message topic: "+ msg.topic + ", QoS: " + str(msg.qos) + ", Message content: " + msg.payload.decode())
+    metrics.inc("messages_received_total")
+    pipeline.submit(msg.topic, msg.payload, recv_ts)
+
+def process_message(topic: str, payload: bytes, recv_ts: float) -> None:
     data_dict = {}
-    sensor_id = msg.topic.split("/")[2] 
-    print("Sensor id: " + sensor_id + ", Message topic: "+ msg.topic + ", QoS: " + str(msg.qos) + ", Message content: " + msg.payload.decode())
+    sensor_id = topic.split("/")[2]
     data_dict["sensor_id"] = sensor_id
-    data_dict.update(convert_jsonstrin_to_dict(msg.payload))
-    data_dict["received_at"] =  time.time()
-    #data_dict["received_at"] =  datetime.datetime.now().isoformat()
-    data_dict["topic"] =  msg.topic
-    if data_dict:
-        save_data_to_jsonfile(data_dict, "data/data.jsonl")
-    
-    now = time.time()
-    last_seen[sensor_id] = now
-    if status.get(sensor_id) == "OFFLINE":
-        print(f"Sensor {sensor_id} is back ONLINE")
-    status[sensor_id] = "ONLINE"
+    started = time.perf_counter()
+    try:
+        data_dict.update(convert_jsonstrin_to_dict(payload))
+    except json_codec.DecodeError:
+        metrics.inc("decode_errors_total")
+        raise
+    metrics.observe("decode_seconds", time.perf_counter() - started)
+    data_dict["received_at"] =  recv_ts
+    data_dict["topic"] =  topic
+    # duplicates are dropped here; the rest reaches handle_record in device-clock order
+    ordering.push(data_dict)
+
+    metrics.inc("messages_total", sensor_id=sensor_id)
+    metrics.observe_lag(sensor_id, recv_ts, data_dict.get("publishedAt"))
+    age_ms = to_number(data_dict.get("ageReadings"))
+    if age_ms is not None:
+        metrics.observe("reading_age_seconds", age_ms / 1000, sensor_id)
+
+    offline_tracker.seen(sensor_id, recv_ts)
+
+def handle_record(data_dict: dict) -> None:
+    started = time.perf_counter()
+    persist_record(data_dict)
+    persisted = time.perf_counter()
+    metrics.observe("persist_seconds", persisted - started)
+    if rollups is not None:
+        rollups.add(data_dict)
+        metrics.observe("rollup_seconds", time.perf_counter() - persisted)
+    started = time.perf_counter()
+    for alert in detector.process(data_dict):
+        print(format_alert(alert))
+    metrics.observe("detect_seconds", time.perf_counter() - started)
+
+def open_ordering() -> IngestOrderer:
+    return IngestOrderer(handle_record, window_sec=ORDERING_WINDOW_SEC, drop_repeated_readings=DROP_REPEATED_READINGS,
+                         on_reboot=on_sensor_reboot)
+
+ordering = open_ordering()
 
 def convert_jsonstrin_to_dict(payload : bytes) -> dict:
-    payload_str = payload.decode()
-    payload_dict = json.loads(payload_str)
+    # decoded straight from the bytes, with orjson/ujson when installed (see json_codec)
+    payload_dict = json_codec.loads(payload)
     return payload_dict
 
+def open_jsonl_writer(filename: str) -> BufferedJsonlWriter:
+    index = SensorIndex.open(filename) if WRITE_INDEX else None
+    return BufferedJsonlWriter(filename, index=index)
+
+def open_segment_writer(directory: str) -> SegmentWriter:
+    retention_sec = SEGMENT_RETENTION_DAYS * 86400 if SEGMENT_RETENTION_DAYS else None
+    return SegmentWriter(directory, partition=SEGMENT_PARTITION, per_sensor=SEGMENT_PER_SENSOR, codec=SEGMENT_CODEC,
+                         retention_sec=retention_sec)
+
+def get_writer(filename: str, opener=open_jsonl_writer) -> Writer:
+    writer = writers.get(filename)
+    if writer is None:
+        with writers_lock:
+            writer = writers.get(filename)
+            if writer is None:
+                writer = opener(filename)
+                writers[filename] = writer
+    return writer
+
 def save_data_to_jsonfile(data: dict, filename: str) -> None:
-    with open(filename, "a") as f:
-        f.write(json.dumps(data) + "\n")
-
-def check_offline_sensors():
-    now = time.time()
-    for sensor_id, last_time in last_seen.items():
-        if now - last_time > OFFLINE_TIMEOUT_SEC:
-            if status.get(sensor_id) != "OFFLINE":
-                print(f"Sensor {sensor_id} is OFFLINE")
-            status[sensor_id] = "OFFLINE"
-
-client = mqtt.Client()
-client.on_connect = on_connect
-client.tls_set()
-client.username_pw_set(config.MQTT_USERNAME, config.MQTT_PASSWORD)
-client.connect(config.MQTT_BROKER, config.MQTT_PORT)
-client.on_subscribe = on_subscribe
-client.on_message = on_message
-client.subscribe("iot/home/+/telemetry",qos=0)
-client.loop_start()
-while True:
-    check_offline_sensors()
-    time.sleep(2)
-    
\ No newline at end of file
+    get_writer(filename).write(data)
+
+def persist_record(data: dict) -> None:
+    if STORAGE_BACKEND == "segments":
+        get_writer(SEGMENT_DIRECTORY, open_segment_writer).write(data)
+    elif STORAGE_BACKEND == "binary":
+        get_writer(BINARY_FILENAME, BinaryRecordWriter).write(data)
+    elif STORAGE_BACKEND == "sqlite":
+        get_writer(SQLITE_FILENAME, SqliteRecordWriter).write(data)
+    else:
+        save_data_to_jsonfile(data, DATA_FILENAME)
+
+def close_writers() -> None:
+    for writer in writers.values():
+        writer.close()
+        stats = writer.stats()
+        print(
+            f"{stats['filename']}: {stats['records_written']} records written, "
+            f"{stats['records_dropped']} dropped, {stats['records_delayed']} delayed")
+    writers.clear()
+
+def start_pipeline() -> IngestPipeline:
+    global pipeline, rollups, ordering
+    if WRITE_ROLLUPS:
+        rollups = RollupStore(ROLLUP_DIRECTORY)
+    ordering = open_ordering()
+    pipeline = IngestPipeline(process_message, workers=INGEST_WORKERS, max_queue_size=INGEST_QUEUE_SIZE,
+                              backpressure=INGEST_BACKPRESSURE)
+    pipeline.start()
+    return pipeline
+
+def stop_pipeline() -> None:
+    pipeline.close(drain=True)
+    ordering.flush()
+    if rollups is not None:
+        rollups.close()
+    stats = pipeline.stats()
+    print(
+        f"Ingest: {stats['processed']} processed, {stats['errors']} errors, "
+        f"{stats['dropped_oldest'] + stats['dropped_newest']} dropped, max queue depth {stats['max_queue_depth']}")
+    stats = ordering.stats()
+    print(
+        f"Ordering: {stats['duplicates']} duplicates, {stats['repeated_readings']} repeated readings, "
+        f"{stats['late']} late, {stats['reboots']} reboots")
+
+def get_sensor_status(sensor_id: str) -> str | None:
+    return offline_tracker.status(sensor_id)
+
+def flush_idle_writers() -> None:
+    # the binary and SQLite writers and the rollups flush only on writes: push out what arrived since the last one
+    with writers_lock:
+        idle_writers = [w for w in writers.values() if isinstance(w, (BinaryRecordWriter, SqliteRecordWriter))]
+    for writer in idle_writers:
+        writer.flush()
+    if rollups is not None:
+        rollups.flush()
+
+def release_held_records() -> None:
+    # records of sensors that went quiet are not released by newer messages
+    ordering.release(time.time())
+
+def register_metrics() -> None:
+    metrics.gauge("ingest_queue_depth", lambda: pipeline.stats()["queue_depth"])
+    metrics.gauge("ingest_dropped", lambda: pipeline.stats()["dropped_oldest"] + pipeline.stats()["dropped_newest"])
+    metrics.gauge("ingest_errors", lambda: pipeline.stats()["errors"])
+    metrics.gauge("ordering_pending", lambda: ordering.stats()["pending"])
+    metrics.gauge("sensors_offline", lambda: sum(1 for sensor in offline_tracker.snapshot().values() if sensor["status"] == OFFLINE))
+
+def main():
+    # imported here so the ingest functions can be used (benchmarks, other services) without broker credentials
+    import config
+
+    service = SubscriberService(brokers_from_config(config), start_pipeline())
+    service.every(2, flush_idle_writers)
+    service.every(0.5, release_held_records)
+    register_metrics()
+    if METRICS_PORT is not None:
+        metrics.serve_metrics(METRICS_PORT)
+    if STATS_LINE_INTERVAL_SEC:
+        service.every(STATS_LINE_INTERVAL_SEC, lambda: print(metrics.REGISTRY.stats_line()))
+    offline_tracker.start()
+    try:
+        service.run_forever()
+        print("Shutting down...")
+    finally:
+        offline_tracker.stop()
+        stop_pipeline()
+        close_writers()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+import asyncio
+import select
+import signal
+import threading
+import time
+from typing import Callable
+
+import paho.mqtt.client as mqtt
+
+import metrics
+from ingest_pipeline import IngestPipeline
+
+TELEMETRY_TOPIC = "iot/home/+/telemetry"
+# topic filters sent per SUBSCRIBE packet when a connection has thousands of them
+SUBSCRIBE_BATCH = 200
+RECONNECT_MIN_SEC = 1.0
+RECONNECT_MAX_SEC = 60.0
+# packets read per readable event before yielding to the other connections
+READ_BATCH = 256
+# paho's keepalive / retry housekeeping, normally done by its network thread
+MISC_INTERVAL_SEC = 1.0
+DISCONNECT_TIMEOUT_SEC = 5.0
+
+
+class BrokerConfig:
+    # one broker connection and the topic filters it subscribes to
+    def __init__(self, host: str, port: int = 8883, username: str | None = None, password: str | None = None,
+                 tls: bool = True, topics=(TELEMETRY_TOPIC,), qos: int = 0, client_id: str = "", keepalive: int = 60,
+                 name: str | None = None):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.tls = tls
+        self.topics = tuple(topics)
+        self.qos = qos
+        self.client_id = client_id
+        self.keepalive = keepalive
+        self.name = name or f"{host}:{port}"
+
+
+def brokers_from_config(config) -> list[BrokerConfig]:
+    # config.MQTT_BROKER/PORT/USERNAME/PASSWORD as before, plus optional config.MQTT_BROKERS: a list of BrokerConfig
+    # keyword dicts for extra connections (other brokers or other subscription sets)
+    brokers = [BrokerConfig(config.MQTT_BROKER, config.MQTT_PORT, config.MQTT_USERNAME, config.MQTT_PASSWORD)]
+    for options in getattr(config, "MQTT_BROKERS", None) or []:
+        brokers.append(BrokerConfig(**options))
+    return brokers
+
+
+class BrokerConnection:
+    # a paho client driven by the service's event loop through paho's socket callbacks instead of loop_start()'s
+    # network thread, so any number of connections share one thread
+    def __init__(self, config: BrokerConfig, service: "SubscriberService"):
+        self.config = config
+        self.service = service
+        self.loop = service.loop
+        self.connected = False
+        self.messages = 0
+        self.connects = 0
+        self.disconnects = 0
+        self.connect_failures = 0
+        self.last_message_at: float | None = None
+        self._disconnected = asyncio.Event()
+
+        client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=config.client_id)
+        if config.tls:
+            client.tls_set()
+        if config.username is not None:
+            client.username_pw_set(config.username, config.password)
+        client.on_connect = self._on_connect
+        client.on_disconnect = self._on_disconnect
+        client.on_message = self._on_message
+        client.on_socket_open = self._on_socket_open
+        client.on_socket_close = self._on_socket_close
+        client.on_socket_register_write = lambda client, userdata, sock: self._call(self.loop.add_writer, self._fd,
+                                                                                    client.loop_write)
+        client.on_socket_unregister_write = lambda client, userdata, sock: self._call(self.loop.remove_writer, self._fd)
+        self.client = client
+        self._fd = -1
+
+    async def run(self) -> None:
+        # connects, then reconnects with exponential backoff until the service stops
+        delay = RECONNECT_MIN_SEC
+        config = self.config
+        connect = lambda: self.client.connect(config.host, config.port, config.keepalive)
+        while not self.service.stopping:
+            try:
+                await self.loop.run_in_executor(None, connect)
+            except (OSError, ValueError) as e:
+                self.connect_failures += 1
+                print(f"[{config.name}] connection failed: {e}, retrying in {delay:.0f}s")
+                await self._sleep(delay)
+                delay = min(delay * 2, RECONNECT_MAX_SEC)
+                continue
+            connect = self.client.reconnect
+            connects = self.connects
+            self._disconnected.clear()
+            misc = asyncio.create_task(self._misc_loop())
+            await self._disconnected.wait()
+            misc.cancel()
+            # refused connections (bad credentials...) back off too
+            delay = RECONNECT_MIN_SEC if self.connects > connects else min(delay * 2, RECONNECT_MAX_SEC)
+            if not self.service.stopping:
+                await self._sleep(delay)
+
+    async def disconnect(self) -> None:
+        if self.client.socket() is None:
+            return
+        self.client.disconnect()
+        try:
+            await asyncio.wait_for(self._disconnected.wait(), DISCONNECT_TIMEOUT_SEC)
+        except asyncio.TimeoutError:
+            print(f"[{self.config.name}] no clean disconnect after {DISCONNECT_TIMEOUT_SEC:.0f}s")
+
+    def stats(self) -> dict:
+        return {
+            "name": self.config.name,
+            "connected": self.connected,
+            "topics": len(self.config.topics),
+            "messages": self.messages,
+            "connects": self.connects,
+            "disconnects": self.disconnects,
+            "connect_failures": self.connect_failures,
+            "last_message_at": self.last_message_at,
+        }
+
+    def _call(self, fn, *args) -> None:
+        # connect() runs in an executor thread: socket callbacks from there are handed to the loop thread-safely
+        if threading.get_ident() == self.service.loop_thread_id:
+            fn(*args)
+        else:
+            self.loop.call_soon_threadsafe(fn, *args)
+
+    def _on_socket_open(self, client, userdata, sock) -> None:
+        # the fd is kept because the socket is already closed when on_socket_close runs
+        self._fd = sock.fileno()
+        self._call(self.loop.add_reader, self._fd, self._on_readable, sock)
+
+    def _on_socket_close(self, client, userdata, sock) -> None:
+        fd = self._fd
+        self._call(self.loop.remove_reader, fd)
+        self._call(self.loop.remove_writer, fd)
+
+    def _on_readable(self, sock) -> None:
+        # loop_read() handles a single packet per call: keep reading while the socket (or TLS's buffer) has data
+        for _ in range(READ_BATCH):
+            if self.client.loop_read() != mqtt.MQTT_ERR_SUCCESS or self.client.socket() is not sock:
+                return
+            if not (getattr(sock, "pending", None) and sock.pending()) and not select.select([sock], [], [], 0)[0]:
+                return
+
+    async def _misc_loop(self) -> None:
+        while True:
+            await asyncio.sleep(MISC_INTERVAL_SEC)
+            if self.client.loop_misc() != mqtt.MQTT_ERR_SUCCESS:
+                self._call(self._disconnected.set)
+                return
+
+    async def _sleep(self, seconds: float) -> None:
+        try:
+            await asyncio.wait_for(self.service.stopped.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    def _on_connect(self, client, userdata, flags, reason_code, properties):
+        if reason_code.is_failure:
+            print(f"[{self.config.name}] connection refused: {reason_code}")
+            return
+        self.connected = True
+        self.connects += 1
+        print(f"[{self.config.name}] connected, subscribing to {len(self.config.topics)} topic filters")
+        topics = [(topic, self.config.qos) for topic in self.config.topics]
+        for i in range(0, len(topics), SUBSCRIBE_BATCH):
+            client.subscribe(topics[i:i + SUBSCRIBE_BATCH])
+
+    def _on_disconnect(self, client, userdata, disconnect_flags, reason_code, properties):
+        self.connected = False
+        self.disconnects += 1
+        if reason_code.is_failure and not self.service.stopping:
+            print(f"[{self.config.name}] connection lost: {reason_code}")
+        self._call(self._disconnected.set)
+
+    def _on_message(self, client, userdata, msg):
+        # same contract as subscriber_script.on_message: timestamp, enqueue, return
+        recv_ts = time.time()
+        self.messages += 1
+        self.last_message_at = recv_ts
+        metrics.inc("messages_received_total")
+        self.service.pipeline.submit(msg.topic, msg.payload, recv_ts)
+
+
+class SubscriberService:
+    # any number of broker connections feeding one IngestPipeline, all on a single asyncio loop. stop() disconnects
+    # every broker first and then drains the pipeline, so nothing already received is lost
+    def __init__(self, brokers: list[BrokerConfig], pipeline: IngestPipeline):
+        self.brokers = list(brokers)
+        self.pipeline = pipeline
+        self.connections: list[BrokerConnection] = []
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.loop_thread_id: int | None = None
+        self.stopped: asyncio.Event | None = None
+        self.stopping = False
+        self._periodic: list[tuple[float, Callable[[], None]]] = []
+
+    def every(self, interval_sec: float, fn: Callable[[], None]) -> None:
+        # runs fn in an executor every interval_sec while the service runs, and once more after the drain
+        self._periodic.append((interval_sec, fn))
+
+    def stop(self) -> None:
+        # safe to call from any thread or a signal handler
+        if self.loop is not None and self.stopped is not None:
+            self.loop.call_soon_threadsafe(self.stopped.set)
+
+    async def run(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread_id = threading.get_ident()
+        self.stopped = asyncio.Event()
+        self.stopping = False
+        self.pipeline.start()
+        self.connections = [BrokerConnection(config, self) for config in self.brokers]
+        tasks = [asyncio.create_task(connection.run()) for connection in self.connections]
+        tasks.extend(asyncio.create_task(self._run_periodic(interval, fn)) for interval, fn in self._periodic)
+        try:
+            await self.stopped.wait()
+        finally:
+            await self._shutdown(tasks)
+
+    def run_forever(self) -> None:
+        # blocking entry point for scripts: Ctrl-C / SIGTERM trigger the graceful stop
+        async def main():
+            loop = asyncio.get_running_loop()
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                try:
+                    loop.add_signal_handler(sig, self.stop)
+                except (NotImplementedError, RuntimeError):
+                    pass
+            await self.run()
+
+        asyncio.run(main())
+
+    def stats(self) -> dict:
+        return {"connections": [connection.stats() for connection in self.connections],
+                "pipeline": self.pipeline.stats()}
+
+    async def _shutdown(self, tasks: list[asyncio.Task]) -> None:
+        self.stopping = True
+        await asyncio.gather(*(connection.disconnect() for connection in self.connections))
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.loop.run_in_executor(None, self.pipeline.close, True)
+        for _, fn in self._periodic:
+            await self.loop.run_in_executor(None, fn)
+
+    async def _run_periodic(self, interval_sec: float, fn: Callable[[], None]) -> None:
+        while True:
+            await asyncio.sleep(interval_sec)
+            try:
+                await self.loop.run_in_executor(None, fn)
+            except Exception as e:
+                print(f"Periodic task {getattr(fn, '__name__', fn)} failed: {e}")
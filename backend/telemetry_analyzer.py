@@ -1,52 +1,262 @@
-import statistics
 import datetime
-import json
 import time
+import os
+import bisect
+import heapq
+from operator import itemgetter
+
+import json_codec
+import metrics
+from aggregation import AggregateTable, OVERALL, aggregate_entries, to_number, validate_stats
+from columnar_store import ColumnarStore, aggregate_columns, column_stats, timestamp_deltas
+from binary_records import BinaryRecordFile
+from json_codec import FieldDecoder
+from sensor_index import SensorIndex
+from segment_store import read_segment_entries
+from sqlite_store import SqliteRecordStore, can_push_down
+from rollups import RollupStore, bucket_stats, validate_range_stats
+from delivery_quality import arrival_times, delivery_report
+from ingest_ordering import DeviceOrder
+from anomaly_engine import IssueTable, RULE_OUT_OF_RANGE, RULE_SUDDEN_CHANGE, detect_anomalies
 
 OFFLINE_TIMEOUT_SEC = 30  
+HEAD_FINGERPRINT_BYTES = 256
+DEFAULT_AGGREGATE_KEYS = ("temperatureCelcius", "temperatureFahrenheit", "humidityPercent", "heatIndexCelcius", "heatIndexFahrenheit")
+DEFAULT_AGGREGATE_STATS = ("count", "mean", "min", "max", "median")
+DEFAULT_ROLLUP_DIRECTORY = "data/rollups"
+# how far (in records) device-clock order may move a record from its received_at position, for the raw range edges;
+# a reconnect burst is a few records, this is ~10 minutes of one sensor's messages
+RANGE_SLACK_ENTRIES = 64
+EXPECTED_MESSAGE_INTERVAL_SECONDS = 10
+TOLERANCE_MESSAGE_INTERVAL = 1.5
+VALID_RANGES = {
+    "temperatureCelcius": (0, 50),
+    "temperatureFahrenheit": (32, 122),
+    "humidityPercent": (0, 100)
+}
+VALID_CHANGES_JUMPS = {
+    "temperatureCelcius": 1.5,
+    "temperatureFahrenheit": 3.0,
+    "humidityPercent": 5.0
+}
 
 class TelemetryAnalyzer:
-    def __init__(self, filename: str, expected_msg_interval_sec: int = 10, tolerance_sec: float = 1.5):
-        self.entries = self.read_jsonl_file(filename)
-        self.entries_by_sensor = self.read_jsonl_file_by_sensor(filename)
-        self.mean = self.calculate_mean()
-        self.mean_by_sensor = self.calculate_mean_by_sensor()
-        self.min = self.calculate_min()
-        self.min_by_sensor = self.calculate_min_by_sensor()
-        self.max = self.calculate_max()
-        self.max_by_sensor = self.calculate_max_by_sensor()
-        self.median = self.calculate_median()
-        self.median_by_sensor = self.calculate_median_by_sensor()
+    def __init__(self, filename: str, expected_msg_interval_sec: int = EXPECTED_MESSAGE_INTERVAL_SECONDS,
+                 tolerance_sec: float = TOLERANCE_MESSAGE_INTERVAL,
+                 follow: bool = False, compute_stats: bool = True, columnar: bool = False,
+                 entries: list[dict] | None = None, fields: tuple[str, ...] | None = None):
+        self.filename = filename
+        # with fields, lines are decoded into just these keys (plus sensor_id and received_at)
+        self.field_decoder = FieldDecoder(("sensor_id", *fields, "received_at")) if fields else None
+        self.follow = follow
+        self.compute_stats = compute_stats
+        self._offset = 0
+        self._file_id = None
+        self._head = b""
 
         self.EXPECTED_MESSAGE_INTERVAL_SECONDS = expected_msg_interval_sec
         self.TOLERANCE_MESSAGE_INTERVAL = tolerance_sec
-        self.VALID_RANGES = {
-            "temperatureCelcius": (0, 50),
-            "temperatureFahrenheit": (32, 122),
-            "humidityPercent": (0, 100)
-        }
-        self.VALID_CHANGES_JUMPS = {
-            "temperatureCelcius": 1.5,
-            "temperatureFahrenheit": 3.0,
-            "humidityPercent": 5.0
-        }
-        
+        self.VALID_RANGES = dict(VALID_RANGES)
+        self.VALID_CHANGES_JUMPS = dict(VALID_CHANGES_JUMPS)
+
+        # optional per-sensor numpy columns, kept in the same order as entries_by_sensor
+        self.columns = ColumnarStore() if columnar else None
+        # bumped on every add_entries; sensor_versions tells which sensors changed since a given version
+        self.version = 0
+        self.sensor_versions: dict[str, int] = {}
+        # each sensor's entries are kept in device-clock order (ingest_ordering.DeviceOrder), the order the subscriber
+        # stores them in; order_keys holds their keys, aligned with entries_by_sensor
+        self.order_keys: dict[str, list[tuple]] = {}
+        self._device_orders: dict[str, DeviceOrder] = {}
+        # records flagged "repeated" (a republished reading, see ingest_ordering) are kept out of entries and
+        # entries_by_sensor: (key, entry) per sensor in key order, merged back in only where deliveries count
+        self.repeats_by_sensor: dict[str, list[tuple]] = {}
+        # set by from_sqlite: the rows the entries came from, so aggregate() can run count/min/max/mean/sum in SQL
+        self.sql_selection: dict | None = None
+        if follow:
+            self.entries = []
+            self.entries_by_sensor = {}
+            self.refresh()
+        else:
+            self.entries = self.read_jsonl_file(filename) if entries is None else list(entries)
+            self.entries_by_sensor = self.read_jsonl_file_by_sensor(filename)
+            if self.columns is not None:
+                self.columns = ColumnarStore.from_entries_by_sensor(self.entries_by_sensor)
+            if compute_stats:
+                self.calculate_global_stats()
+
+    @classmethod
+    def from_index(cls, filename: str, sensor_ids: list[str] | None = None, start: float | None = None,
+                   end: float | None = None, last_n: int | None = None, **kwargs) -> "TelemetryAnalyzer":
+        # decodes only the lines the sidecar index points at for these sensors / this time range
+        index = SensorIndex.open(filename, writable=False)
+        return cls(filename, entries=index.read_entries(sensor_ids, start, end, last_n), **kwargs)
+
+    @classmethod
+    def from_segments(cls, directory: str, start: float | None = None, end: float | None = None,
+                      sensor_ids: list[str] | None = None, **kwargs) -> "TelemetryAnalyzer":
+        # reads a time range across (compressed) segments, skipping those outside the window
+        return cls(directory, entries=read_segment_entries(directory, start, end, sensor_ids), **kwargs)
+
+    @classmethod
+    def from_binary(cls, filename: str, sensor_ids: list[str] | None = None, start: float | None = None,
+                    end: float | None = None, **kwargs) -> "TelemetryAnalyzer":
+        # the columnar store is filled straight from the mmap'd records instead of from the decoded dicts
+        columnar = kwargs.pop("columnar", False)
+        compute_stats = kwargs.pop("compute_stats", True)
+        with BinaryRecordFile(filename) as records:
+            telemetry = cls(filename, entries=records.read_entries(sensor_ids, start, end), compute_stats=False, **kwargs)
+            if columnar:
+                telemetry.columns = records.to_columnar_store(sensor_ids, start, end)
+        if compute_stats:
+            telemetry.calculate_global_stats()
+        return telemetry
+
+    @classmethod
+    def from_sqlite(cls, filename: str, sensor_ids: list[str] | None = None, start: float | None = None,
+                    end: float | None = None, **kwargs) -> "TelemetryAnalyzer":
+        # the sensor / time range filter runs in SQL on the (sensor_id, received_at) index
+        compute_stats = kwargs.pop("compute_stats", True)
+        with SqliteRecordStore(filename) as store:
+            selection = store.selection(sensor_ids, start, end)
+            telemetry = cls(filename, entries=store.read_entries(selection), compute_stats=False, **kwargs)
+        telemetry.sql_selection = selection
+        if compute_stats:
+            telemetry.calculate_global_stats()
+        return telemetry
+
+    @classmethod
+    def for_range(cls, filename: str, start: float, end: float, sensor_ids: list[str] | None = None,
+                  rollup_directory: str = DEFAULT_ROLLUP_DIRECTORY, **kwargs) -> "TelemetryAnalyzer":
+        # loads (through the index) only the raw entries range_stats(start, end) cannot answer from the rollups
+        _, raw_ranges = RollupStore(rollup_directory).plan(start, end)
+        index = SensorIndex.open(filename, writable=False)
+        entries = []
+        for lo, hi in raw_ranges:
+            entries.extend(entry for entry in index.read_entries(sensor_ids, lo, hi) if entry.get("received_at", 0) < hi)
+        kwargs.setdefault("compute_stats", False)
+        return cls(filename, entries=entries, **kwargs)
+
+    def calculate_global_stats(self, key: str = "temperatureCelcius") -> None:
+        table = self.aggregate([key], ("mean", "min", "max", "median"), include_overall=True)
+        self.mean = table.get(OVERALL, key, "mean")
+        self.mean_by_sensor = table.column(key, "mean")
+        self.min = table.get(OVERALL, key, "min")
+        self.min_by_sensor = table.column(key, "min")
+        self.max = table.get(OVERALL, key, "max")
+        self.max_by_sensor = table.column(key, "max")
+        self.median = table.get(OVERALL, key, "median")
+        self.median_by_sensor = table.column(key, "median")
 
     def read_jsonl_file(self, filename: str) -> list[dict]:
+        with open(filename, "rb") as file:
+            return self.parse_jsonl_lines(file)
+
+    def parse_jsonl_lines(self, lines) -> list[dict]:
+        decode = self.field_decoder.decode if self.field_decoder is not None else json_codec.loads
+        started = time.perf_counter()
         entries = []
-        with open(filename, "r") as file:
-            for line in file:
-                line = line.strip()
-                if not line :
-                    continue
-                try:
-                    entries.append(json.loads(line))
-                except json.JSONDecodeError as e:
-                    print("JSON error:", e)
-                    print("Bad line (preview):", line[:120])
-                    continue
+        for line in lines:
+            line = line.strip()
+            if not line :
+                continue
+            try:
+                entries.append(decode(line))
+            except json_codec.DecodeError as e:
+                print("JSON error:", e)
+                print("Bad line (preview):", line[:120].decode(errors="replace") if isinstance(line, bytes) else line[:120])
+                continue
+        metrics.inc("analyzer_lines_total", len(entries))
+        metrics.observe("analyzer_parse_seconds", time.perf_counter() - started)
         return entries
 
+    def refresh(self) -> list[dict]:
+        # parses only the lines appended since the last call, starting over if the file was truncated or rotated
+        try:
+            file_stat = os.stat(self.filename)
+        except FileNotFoundError:
+            return []
+        file_id = (file_stat.st_dev, file_stat.st_ino)
+
+        with open(self.filename, "rb") as file:
+            if self._offset and (file_id != self._file_id or file_stat.st_size < self._offset or not self._is_same_file(file)):
+                self.entries = []
+                self.entries_by_sensor = {}
+                self.sensor_versions = {}
+                self.order_keys = {}
+                self._device_orders = {}
+                self.repeats_by_sensor = {}
+                if self.columns is not None:
+                    self.columns = ColumnarStore(self.columns.columns)
+                self._offset = 0
+            self._file_id = file_id
+            if not self._offset:
+                file.seek(0)
+                self._head = file.read(HEAD_FINGERPRINT_BYTES)
+            file.seek(self._offset)
+            data = file.read()
+
+        end = data.rfind(b"\n")
+        if end < 0:
+            # nothing but a partially written line so far
+            return []
+        self._offset += end + 1
+        new_entries = self.parse_jsonl_lines(data[:end + 1].splitlines())
+        self.add_entries(new_entries)
+        if self.compute_stats:
+            self.calculate_global_stats()
+        return new_entries
+
+    def _is_same_file(self, file) -> bool:
+        if file.read(len(self._head)) != self._head:
+            return False
+        file.seek(self._offset - 1)
+        return file.read(1) == b"\n"
+
+    def add_entries(self, new_entries: list[dict]) -> None:
+        if any(entry.get("repeated") for entry in new_entries):
+            self.entries.extend(entry for entry in new_entries if not entry.get("repeated"))
+        else:
+            self.entries.extend(new_entries)
+        if new_entries:
+            # the database no longer holds exactly these entries
+            self.sql_selection = None
+        appended: dict[str, list[dict]] = {}
+        reordered: set[str] = set()
+        repeated: set[str] = set()
+        for entry in new_entries:
+            sensor_id = entry.get("sensor_id")
+            if not sensor_id:
+                continue
+            key = self._device_order(sensor_id).key(entry)
+            if entry.get("repeated"):
+                bisect.insort_right(self.repeats_by_sensor.setdefault(sensor_id, []), (key, entry), key=itemgetter(0))
+                repeated.add(sensor_id)
+                continue
+            sensor_entries = self.entries_by_sensor.setdefault(sensor_id, [])
+            keys = self.order_keys.setdefault(sensor_id, [])
+            if not keys or key >= keys[-1]:
+                sensor_entries.append(entry)
+                keys.append(key)
+                appended.setdefault(sensor_id, []).append(entry)
+            else:
+                # a log written by the subscriber is in this order already: only older logs land here
+                position = bisect.bisect_right(keys, key)
+                sensor_entries.insert(position, entry)
+                keys.insert(position, key)
+                reordered.add(sensor_id)
+        if new_entries:
+            self.version += 1
+            for sensor_id in appended.keys() | reordered | repeated:
+                self.sensor_versions[sensor_id] = self.version
+
+        if self.columns is not None:
+            for sensor_id, entries in appended.items():
+                if sensor_id not in reordered:
+                    self.columns.append(sensor_id, entries)
+            for sensor_id in reordered:
+                self.columns.rebuild(sensor_id, self.entries_by_sensor[sensor_id])
+
     def read_jsonl_file_by_sensor(self, filename: str) -> dict[str, list[dict]]:
         entries_by_sensor = {}
         for entry in self.entries:
@@ -56,9 +266,46 @@ class TelemetryAnalyzer:
                     entries_by_sensor[sensor_id] = []
                 entries_by_sensor[sensor_id].append(entry)
         for sensor_id, entries in entries_by_sensor.items():
-            entries.sort(key=get_detected_time)
+            key = self._device_order(sensor_id).key
+            keys = [key(entry) for entry in entries]
+            if any(entry.get("repeated") for entry in entries):
+                entries[:], keys = self._split_repeats(sensor_id, entries, keys)
+            if any(map(tuple.__gt__, keys, keys[1:])):
+                order = sorted(range(len(entries)), key=keys.__getitem__)
+                entries[:] = [entries[i] for i in order]
+                keys = [keys[i] for i in order]
+            self.order_keys[sensor_id] = keys
+        if self.repeats_by_sensor:
+            self.entries = [entry for entry in self.entries if not entry.get("repeated")]
         return entries_by_sensor
 
+    def _split_repeats(self, sensor_id: str, entries: list[dict], keys: list[tuple]) -> tuple[list[dict], list[tuple]]:
+        repeats = self.repeats_by_sensor.setdefault(sensor_id, [])
+        readings, reading_keys = [], []
+        for key, entry in zip(keys, entries):
+            if entry.get("repeated"):
+                repeats.append((key, entry))
+            else:
+                readings.append(entry)
+                reading_keys.append(key)
+        repeats.sort(key=itemgetter(0))
+        return readings, reading_keys
+
+    def delivered_entries(self, sensor_id: str) -> list[dict]:
+        # the sensor's readings and repeated readings together in device-clock order: every message that arrived
+        entries = self.entries_by_sensor.get(sensor_id, [])
+        repeats = self.repeats_by_sensor.get(sensor_id)
+        if not repeats:
+            return entries
+        keyed = heapq.merge(zip(self.order_keys.get(sensor_id, []), entries), repeats, key=itemgetter(0))
+        return [entry for _, entry in keyed]
+
+    def _device_order(self, sensor_id: str) -> DeviceOrder:
+        order = self._device_orders.get(sensor_id)
+        if order is None:
+            order = self._device_orders[sensor_id] = DeviceOrder()
+        return order
+
     def extrat_value_list(self, key: str = "temperatureCelcius", sensor_id : str| None = None) -> list[float|int]:       
         value_list = []
         entries = self.entries if sensor_id is None else self.entries_by_sensor.get(sensor_id, [])
@@ -71,71 +318,107 @@ class TelemetryAnalyzer:
         return value_list
 
 
-    def calculate_mean(self, key: str = "temperatureCelcius", sensor_id : str| None = None) -> float|None:
-            value_list = self.extrat_value_list(key, sensor_id)
-            if value_list:
-                return statistics.mean(value_list)
-            else:
+    def aggregate(self, keys=DEFAULT_AGGREGATE_KEYS, stats=DEFAULT_AGGREGATE_STATS, include_overall: bool = False) -> AggregateTable:
+        # every key and statistic for every sensor in a single pass over the entries
+        if self.sql_selection is not None and can_push_down(keys, validate_stats(stats)):
+            with SqliteRecordStore(self.filename) as store:
+                return store.aggregate(self.sql_selection, keys, stats, include_overall=include_overall,
+                                       groups=self.entries_by_sensor.keys())
+        if self._use_columns(keys, include_overall):
+            return aggregate_columns(self.columns, keys, stats, include_overall=include_overall)
+        return aggregate_entries(self.entries, keys, stats, include_overall=include_overall, groups=self.entries_by_sensor.keys())
+
+    def _use_columns(self, keys, include_overall: bool = False) -> bool:
+        if self.columns is None:
+            return False
+        if include_overall and len(self.entries) != sum(len(entries) for entries in self.entries_by_sensor.values()):
+            # entries without a sensor_id only live in self.entries, not in the per-sensor columns
+            return False
+        self.columns.ensure_columns(keys, self.entries_by_sensor)
+        return True
+
+    def calculate_stat(self, stat: str, key: str = "temperatureCelcius", sensor_id: str | None = None) -> float|None:
+        if sensor_id is not None and self._use_columns([key]):
+            sensor_columns = self.columns.sensor(sensor_id)
+            if sensor_columns is None:
                 return None
+            return column_stats(sensor_columns.valid_values(key), (stat,))[0]
+        if sensor_id is None and self._use_columns([key], include_overall=True):
+            return aggregate_columns(self.columns, [key], [stat], include_overall=True).get(OVERALL, key, stat)
+        entries = self.entries if sensor_id is None else self.entries_by_sensor.get(sensor_id, [])
+        table = aggregate_entries(entries, [key], [stat], group_key=None, include_overall=True)
+        return table.get(OVERALL, key, stat)
+
+    def calculate_stat_by_sensor(self, stat: str, key: str = "temperatureCelcius") -> dict[str, float|None]:
+        return self.aggregate([key], [stat]).column(key, stat)
+
+    def range_stats(self, start: float, end: float, keys=DEFAULT_AGGREGATE_KEYS, stats=DEFAULT_AGGREGATE_STATS,
+                    sensor_ids: list[str] | None = None,
+                    rollup_directory: str = DEFAULT_ROLLUP_DIRECTORY) -> dict[str, dict[str, dict]]:
+        # stats over [start, end) per sensor and key: whole 1d/1h/1m buckets come from the rollups and only the edges
+        # are read from this analyzer's entries. Quantiles are sketch estimates (1% relative error)
+        stats = validate_range_stats(stats)
+        store = RollupStore(rollup_directory)
+        if sensor_ids is None:
+            sensor_ids = list(dict.fromkeys(list(self.entries_by_sensor) + store.sensor_ids(start, end)))
+        return {
+            sensor_id: {key: bucket_stats(store.query(sensor_id, key, start, end, self._raw_values), stats) for key in keys}
+            for sensor_id in sensor_ids
+        }
+
+    def _raw_values(self, sensor_id: str, key: str, start: float, end: float) -> list[tuple[float, float]]:
+        # entries are in device-clock order, in which received_at is only nearly sorted: the bisection finds the
+        # region and the filter keeps [start, end), catching records up to RANGE_SLACK_ENTRIES away from their place
+        entries = self.entries_by_sensor.get(sensor_id, [])
+        lo = max(0, bisect.bisect_left(entries, start, key=get_detected_time) - RANGE_SLACK_ENTRIES)
+        hi = bisect.bisect_left(entries, end, key=get_detected_time) + RANGE_SLACK_ENTRIES
+        values = []
+        for entry in entries[lo:hi]:
+            if not start <= entry.get("received_at", 0) < end:
+                continue
+            value = to_number(entry.get(key))
+            if value is not None and value == value:
+                values.append((entry.get("received_at", 0), float(value)))
+        return values
+
+    def calculate_mean(self, key: str = "temperatureCelcius", sensor_id : str| None = None) -> float|None:
+        return self.calculate_stat("mean", key, sensor_id)
 
     def calculate_mean_by_sensor(self, key: str = "temperatureCelcius") -> dict[str, float|None]:
-        value_list_by_sensor = {}
-        for sensor_id in self.entries_by_sensor.keys():
-            value_list_by_sensor[sensor_id] = self.calculate_mean(key=key, sensor_id=sensor_id)
-        return value_list_by_sensor
-    
+        return self.calculate_stat_by_sensor("mean", key)
+
     def calculate_min(self, key: str = "temperatureCelcius", sensor_id : str| None = None) -> float|None:
-        value_list = self.extrat_value_list(key, sensor_id)
-        if value_list:
-            return min(value_list)
-        else:
-            return None
-    
+        return self.calculate_stat("min", key, sensor_id)
+
     def calculate_min_by_sensor(self, key: str = "temperatureCelcius") -> dict[str, float|None]:
-        value_list_by_sensor = {}
-        for sensor_id in self.entries_by_sensor.keys():
-            value_list_by_sensor[sensor_id] = self.calculate_min(key=key, sensor_id=sensor_id)
-        return value_list_by_sensor
-    
+        return self.calculate_stat_by_sensor("min", key)
+
     def calculate_max(self, key: str = "temperatureCelcius", sensor_id : str| None = None) -> float|None:
-        value_list = self.extrat_value_list(key, sensor_id)
-        if value_list:
-            return max(value_list)
-        else:
-            return None
-    
+        return self.calculate_stat("max", key, sensor_id)
+
     def calculate_max_by_sensor(self, key: str = "temperatureCelcius") -> dict[str, float|None]:
-        value_list_by_sensor = {}
-        for sensor_id in self.entries_by_sensor.keys():
-            value_list_by_sensor[sensor_id] = self.calculate_max(key=key, sensor_id=sensor_id)
-        return value_list_by_sensor
-    
+        return self.calculate_stat_by_sensor("max", key)
+
     def calculate_median(self, key: str = "temperatureCelcius", sensor_id : str| None = None) -> float|None:
-        value_list = self.extrat_value_list(key, sensor_id)
-        if value_list:
-            return statistics.median(value_list)
-        else:
-            return None  
+        return self.calculate_stat("median", key, sensor_id)
 
     def calculate_median_by_sensor(self, key: str = "temperatureCelcius") -> dict[str, float|None]:
-        value_list_by_sensor = {}
-        for sensor_id in self.entries_by_sensor.keys():
-            value_list_by_sensor[sensor_id] = self.calculate_median(key=key, sensor_id=sensor_id)
-        return value_list_by_sensor
-             
+        return self.calculate_stat_by_sensor("median", key)
+
     def calculate_timestamp_delta(self, sensor_id: str) -> list[float]:
-        timestamp_list = self.extrat_value_list("received_at", sensor_id)
-        #print(timestamp_list[0:5])
-        timestamp_list.sort()
-        #print(timestamp_list[0:5])
+        if sensor_id not in self.repeats_by_sensor and self._use_columns(["received_at"]):
+            sensor_columns = self.columns.sensor(sensor_id)
+            return timestamp_deltas(sensor_columns).tolist() if sensor_columns is not None else []
+        # between neighbours in device-clock order, like the columns; a repeated reading was still a delivered message
+        timestamp_list = [entry["received_at"] for entry in self.delivered_entries(sensor_id) if "received_at" in entry]
         delta_timestamp_list = []
         for i in range(1, len(timestamp_list)):
             delta_timestamp_list.append(timestamp_list[i] - timestamp_list[i-1])
         return delta_timestamp_list
 
 
-    def detect_missing_messages(self, sensor_id: str) -> tuple[int, int]:
-        entries = self.entries_by_sensor.get(sensor_id, [])
+    def detect_missing_messages(self, sensor_id: str, verbose: bool = False) -> tuple[int, int]:
+        entries = self.delivered_entries(sensor_id)
         delta_timestamp_list = self.calculate_timestamp_delta(sensor_id)
         total_gaps = 0;
         total_missing_msgs = 0;
@@ -144,21 +427,35 @@ class TelemetryAnalyzer:
                 total_gaps += 1
                 number_of_missing_msg = round(delta/self.EXPECTED_MESSAGE_INTERVAL_SECONDS) - 1
                 total_missing_msgs += number_of_missing_msg
-                print(
-                f"Expected interval (in seconds): {self.EXPECTED_MESSAGE_INTERVAL_SECONDS/1000} \n"
-                f"Delta observed (in seconds): {delta} \n"
-                f"Estimated number of missing messages: {number_of_missing_msg} \n")
-                
-        print(
-            f"Sensor ID: {sensor_id}\n"
-            f"Total of recorded messages: {len(entries)}\n"
-            f"Total of missing messages: {total_missing_msgs}\n"
-            f"Total of expected messages: {len(entries) + total_missing_msgs}\n"
-            f"Number of gaps (meaning how many interruption occured) {total_gaps}\n")
-        
+                if verbose:
+                    print(
+                    f"Expected interval (in seconds): {self.EXPECTED_MESSAGE_INTERVAL_SECONDS} \n"
+                    f"Delta observed (in seconds): {delta} \n"
+                    f"Estimated number of missing messages: {number_of_missing_msg} \n")
+
+        if verbose:
+            print(
+                f"Sensor ID: {sensor_id}\n"
+                f"Total of recorded messages: {len(entries)}\n"
+                f"Total of missing messages: {total_missing_msgs}\n"
+                f"Total of expected messages: {len(entries) + total_missing_msgs}\n"
+                f"Number of gaps (meaning how many interruption occured) {total_gaps}\n")
+
         return total_missing_msgs, total_gaps
+
+    def delivery_report(self, expected_interval_sec: float | None = None, tolerance: float | None = None,
+                        bucket_sec: float | None = None) -> dict:
+        # gaps, missed messages, jitter and outages of every sensor in one vectorized pass (see delivery_quality)
+        times = arrival_times(self.entries_by_sensor, self.columns)
+        if self.repeats_by_sensor:
+            delivered = {sensor_id: self.delivered_entries(sensor_id) for sensor_id in self.repeats_by_sensor}
+            times.update(arrival_times(delivered))
+        return delivery_report(times, expected_interval_sec or self.EXPECTED_MESSAGE_INTERVAL_SECONDS,
+                               tolerance or self.TOLERANCE_MESSAGE_INTERVAL, bucket_sec)
     
     def out_of_range_detection(self, sensor_id: str):
+        if self._use_columns(self.VALID_RANGES):
+            return self.anomaly_issues([sensor_id], rules=(RULE_OUT_OF_RANGE,))
         out_of_range_entries = []
         entries = self.entries_by_sensor.get(sensor_id, [])
         for entry in entries:
@@ -174,7 +471,24 @@ class TelemetryAnalyzer:
      
         return out_of_range_entries 
 
+    def detect_anomalies(self, sensor_ids: list[str] | None = None,
+                         rules=(RULE_OUT_OF_RANGE, RULE_SUDDEN_CHANGE)) -> IssueTable:
+        # all range and jump rules for the given sensors (default: all) as one vectorized pass, see anomaly_engine
+        keys = list(self.VALID_RANGES) + list(self.VALID_CHANGES_JUMPS)
+        if self._use_columns(keys):
+            store = self.columns
+        else:
+            store = ColumnarStore.from_entries_by_sensor(self.entries_by_sensor, columns=tuple(dict.fromkeys(keys)))
+        return detect_anomalies(store, self.VALID_RANGES, self.VALID_CHANGES_JUMPS, sensor_ids, rules)
+
+    def anomaly_issues(self, sensor_ids: list[str] | None = None,
+                       rules=(RULE_OUT_OF_RANGE, RULE_SUDDEN_CHANGE)) -> list[dict]:
+        table = self.detect_anomalies(sensor_ids, rules)
+        return table.to_issue_dicts(self.entries_by_sensor, self.VALID_RANGES, self.VALID_CHANGES_JUMPS)
+
     def sudden_change_detection(self, sensor_id: str):
+        if self._use_columns(self.VALID_CHANGES_JUMPS):
+            return self.anomaly_issues([sensor_id], rules=(RULE_SUDDEN_CHANGE,))
         sudden_change_entries = []
         entries = self.entries_by_sensor.get(sensor_id, [])
 
@@ -274,6 +588,8 @@ class TelemetryAnalyzer:
 
 
 def get_detected_time(entry: dict) -> float:
+    # the time axis of range queries. It is not the per-sensor order: entries_by_sensor follows the device clock, and a
+    # record the broker delayed has a later received_at than the ones after it
     return entry.get("received_at", 0)
 
 
@@ -285,7 +601,7 @@ def main():
     print(f"Max: {telemetry_analyzer.max_by_sensor}")
     print(f"Median: {telemetry_analyzer.median_by_sensor}")
     #print("\nDetecting missing messages...")
-    telemetry_analyzer.detect_missing_messages("A01");
+    telemetry_analyzer.detect_missing_messages("A01", verbose=True);
     print("\nDetecting out-of-range values...")
     out_of_range_entries = telemetry_analyzer.out_of_range_detection("A01")
     for issue in out_of_range_entries:
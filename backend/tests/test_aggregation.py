@@ -0,0 +1,28 @@
+import math
+import statistics
+
+import numpy as np
+
+from aggregation import Accumulator, exact_mean
+from columnar_store import column_stats
+from sqlite_store import ExactMean
+
+
+def means(values: list) -> list:
+    accumulator = Accumulator()
+    aggregate = ExactMean()
+    for value in values:
+        accumulator.add(value)
+        aggregate.step(value)
+    return [exact_mean(values), accumulator.exact_mean(), aggregate.finalize(),
+            column_stats(np.array(values), ("mean",))[0]]
+
+
+def test_every_path_computes_the_same_exact_mean():
+    for values in ([0.1] * 10, [1e16, 1.0, -1e16, 3.0], [20.1, 20.2, 20.3], [1, 2, 4]):
+        expected = statistics.mean(values)
+        assert means(values) == [expected] * 4
+        assert {type(mean) for mean in means(values)} == {type(expected)}
+    assert means([3, 4]) == [3.5] * 4
+    assert means([1.0, math.inf]) == [math.inf] * 4
+    assert all(math.isnan(mean) for mean in means([math.inf, -math.inf, 1.0]) + means([math.nan, 2.0]))
@@ -0,0 +1,33 @@
+import json
+import statistics
+
+from batch_analysis import default_options, run_batch
+from telemetry_analyzer import TelemetryAnalyzer
+
+
+def test_median_is_exact_across_shards(tmp_path):
+    path = tmp_path / "data.jsonl"
+    values = [20.0 + (i * 37 % 50) / 10 for i in range(400)]
+    with open(path, "w") as file:
+        for i, value in enumerate(values):
+            file.write(json.dumps({"sensor_id": "A01", "temperatureCelcius": value, "received_at": 1000.0 + 10 * i})
+                       + "\n")
+
+    report = run_batch([str(path)], 1, 2048, default_options())
+    assert report["shards"] > 1
+    assert report["sensors"]["A01"]["stats"]["temperatureCelcius"]["median"] == statistics.median(values)
+
+
+def test_mean_is_exact_whatever_the_chunk_size(tmp_path):
+    path = tmp_path / "data.jsonl"
+    # float sums of these depend on how the records are grouped
+    values = [round(20.0 + (i * 37 % 50) / 10 + i * 1e-4, 4) for i in range(400)]
+    with open(path, "w") as file:
+        for i, value in enumerate(values):
+            file.write(json.dumps({"sensor_id": "A01", "temperatureCelcius": value, "received_at": 1000.0 + 10 * i})
+                       + "\n")
+
+    means = {run_batch([str(path)], 1, chunk_bytes, default_options())["sensors"]["A01"]["stats"]
+             ["temperatureCelcius"]["mean"] for chunk_bytes in (512, 2048, 1 << 20)}
+    assert means == {statistics.mean(values)}
+    assert means == {TelemetryAnalyzer(str(path), compute_stats=False).calculate_mean("temperatureCelcius", "A01")}
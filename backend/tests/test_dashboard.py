@@ -0,0 +1,86 @@
+import json
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+
+from benchmarks.local_broker import LocalBroker
+from dashboard import RECENT_N, TELEMETRY_TOPIC, LiveSensorFeed, build_sensor_snapshots
+
+# the time dependent fields; everything else has to come out the same
+VOLATILE = ("age_sec", "version")
+
+
+def payloads() -> list[tuple[str, dict]]:
+    # more than RECENT_N per sensor. A01 has out of range values and sudden jumps; B01 is flat except one spike that
+    # leaves its window, so the jump back from it must not count either
+    messages = []
+    for i in range(RECENT_N + 15):
+        timing = {"sampledAt": 10_000 * i + 9_500, "publishedAt": 10_000 * i + 10_000}
+        temperature = 60.0 if i % 11 == 3 else 21.0 + (4.0 if i % 7 == 0 else i % 3 / 10)
+        messages.append(("iot/home/A01/telemetry", {**timing, "temperatureCelcius": temperature,
+                                                    "humidityPercent": 40.0 + i % 4, "isReadingValid": True}))
+        if i < RECENT_N + 5:
+            b01 = 30.0 if i == 4 else 19.6 if i == RECENT_N + 4 else 19.5
+            messages.append(("iot/home/B01/telemetry", {**timing, "temperatureCelcius": b01, "humidityPercent": 55.0}))
+    # a QoS redelivery of A01's message from 20 s back, and B01's last two messages swapped (its newest reading
+    # arrives first)
+    messages.append(messages[-3])
+    last_b01 = max(i for i, (topic, _) in enumerate(messages) if "B01" in topic)
+    previous_b01 = max(i for i, (topic, _) in enumerate(messages[:last_b01]) if "B01" in topic)
+    messages[previous_b01], messages[last_b01] = messages[last_b01], messages[previous_b01]
+    return messages
+
+
+def comparable(snapshots: dict[str, dict]) -> dict[str, dict]:
+    return {sensor_id: {name: value for name, value in snapshot.items() if name not in VOLATILE}
+            for sensor_id, snapshot in snapshots.items()}
+
+
+def test_live_feed_through_a_broker_matches_the_log_snapshots(tmp_path):
+    feed = LiveSensorFeed()
+    received = []
+    subscribed = threading.Event()
+    messages = payloads()
+
+    def on_message(client, userdata, msg):
+        received.append(feed.handle_message(msg.topic, msg.payload, time.time()))
+
+    with LocalBroker() as broker:
+        subscriber = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+        subscriber.on_connect = lambda client, userdata, flags, reason_code, properties: \
+            client.subscribe(TELEMETRY_TOPIC)
+        subscriber.on_subscribe = lambda client, userdata, mid, reason_codes, properties: subscribed.set()
+        subscriber.on_message = on_message
+        subscriber.connect(broker.host, broker.port)
+        subscriber.loop_start()
+        publisher = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+        try:
+            assert subscribed.wait(5)
+            publisher.connect(broker.host, broker.port)
+            publisher.loop_start()
+            for topic, payload in messages:
+                publisher.publish(topic, json.dumps(payload))
+            deadline = time.monotonic() + 5
+            while len(received) < len(messages) and time.monotonic() < deadline:
+                time.sleep(0.02)
+        finally:
+            publisher.loop_stop()
+            publisher.disconnect()
+            subscriber.loop_stop()
+            subscriber.disconnect()
+
+    assert feed.messages == len(messages) and feed.bad_messages == 0
+    assert received.count(None) == feed.ordering.stats()["duplicates"] == 1
+    # the log the subscriber would write: the duplicate dropped, records still in arrival order
+    path = tmp_path / "data.jsonl"
+    with open(path, "w") as file:
+        file.writelines(json.dumps(entry) + "\n" for entry in received if entry is not None)
+
+    # the last messages are still inside the ordering window
+    feed.ordering.flush()
+    live = feed.snapshots()
+    assert set(live) == {"A01", "B01"}
+    assert live["A01"]["anomaly_status"] == "ANOMALY" and live["B01"]["anomaly_status"] == "OK"
+    assert live["B01"]["last_entry"]["temperatureCelcius"] == 19.6
+    assert comparable(live) == comparable(build_sensor_snapshots(str(path)))
@@ -0,0 +1,15 @@
+import numpy as np
+
+from delivery_quality import delivery_report
+
+
+def test_outages_count_the_time_past_the_expected_interval():
+    # every 5s, then a 65s silence for A01 and a 35s one for B01
+    times = {"A01": np.array([0.0, 5.0, 10.0, 75.0, 80.0]), "B01": np.array([0.0, 5.0, 40.0, 45.0])}
+    report = delivery_report(times, expected_interval_sec=5.0, tolerance=1.5)
+
+    a01, b01 = report["sensors"]["A01"], report["sensors"]["B01"]
+    assert a01["outage_sec"] == a01["longest_outage_sec"] == 60.0
+    assert a01["longest_outage_start"] == 10.0
+    assert b01["outage_sec"] == b01["longest_outage_sec"] == 30.0
+    assert report["fleet"]["longest_outage_sec"] == 60.0
@@ -0,0 +1,104 @@
+import statistics
+
+from batch_analysis import default_options, run_batch
+from binary_records import BinaryRecordWriter
+from ingest_ordering import IngestOrderer
+from jsonl_writer import BufferedJsonlWriter
+from sqlite_store import SqliteRecordWriter
+from telemetry_analyzer import TelemetryAnalyzer
+
+START = 1_766_800_000.0
+
+
+def readings(count: int, published_ms: int = 60_000) -> list[dict]:
+    # a slow ramp, one step per message: only out of order neighbours differ by more than the 1.5 °C jump limit
+    return [{"sensor_id": "A01", "sampledAt": published_ms + 10_000 * i - 500, "publishedAt": published_ms + 10_000 * i,
+             "temperatureCelcius": 15.0 + i, "humidityPercent": 40.0} for i in range(count)]
+
+
+def arrivals(records: list[dict]) -> list[dict]:
+    # every 10 s, except messages 5..7: held by the firmware during a reconnect and delivered in one shuffled burst
+    # (spanning less than the 30 s the device clock may go back before it counts as a reboot)
+    burst = [records[7], records[5], records[6]]
+    arrived = []
+    for i, record in enumerate(records[:5]):
+        arrived.append(dict(record, received_at=START + 10 * i))
+    for i, record in enumerate(burst):
+        arrived.append(dict(record, received_at=START + 75 + 0.001 * i))
+    for i, record in enumerate(records[8:], 8):
+        arrived.append(dict(record, received_at=START + 10 * i))
+    return arrived
+
+
+def test_reordered_burst_gives_no_false_sudden_changes(tmp_path):
+    path = str(tmp_path / "data.jsonl")
+    records = readings(25)
+    with BufferedJsonlWriter(path) as writer:
+        orderer = IngestOrderer(writer.write)
+        for record in arrivals(records):
+            orderer.push(record)
+        orderer.flush()
+    assert orderer.stats()["reboots"] == 0
+
+    for telemetry in (TelemetryAnalyzer(path, compute_stats=False),
+                      TelemetryAnalyzer(path, compute_stats=False, follow=True),
+                      TelemetryAnalyzer(path, compute_stats=False, columnar=True)):
+        assert [entry["publishedAt"] for entry in telemetry.entries_by_sensor["A01"]] \
+            == [record["publishedAt"] for record in records]
+        assert telemetry.sudden_change_detection("A01") == []
+        assert telemetry.anomaly_issues(["A01"]) == []
+
+
+def test_log_without_the_ordering_stage_follows_the_device_clock_across_a_reboot(tmp_path):
+    # written in arrival order (an older subscriber): the analyzer still orders by the device clock, and the boot after
+    # the reboot (device clock back to a few seconds) sorts after the previous one
+    path = str(tmp_path / "data.jsonl")
+    before, after = readings(6, published_ms=900_000), readings(6, published_ms=5_000)
+    for record in after:
+        record["temperatureCelcius"] += 6
+    records = before + after
+    arrived = records[:2] + [records[3], records[2]] + records[4:8] + [records[9], records[8]] + records[10:]
+    with BufferedJsonlWriter(path) as writer:
+        for i, record in enumerate(arrived):
+            writer.write(dict(record, received_at=START + 10 * i))
+
+    for telemetry in (TelemetryAnalyzer(path, compute_stats=False),
+                      TelemetryAnalyzer(path, compute_stats=False, follow=True)):
+        assert [entry["publishedAt"] for entry in telemetry.entries_by_sensor["A01"]] \
+            == [record["publishedAt"] for record in records]
+        assert telemetry.sudden_change_detection("A01") == []
+
+
+def test_repeated_readings_count_as_deliveries_but_not_as_values(tmp_path):
+    # every 10 s; with no new reading at messages 4 and 9 the firmware republishes the previous one (same sampledAt)
+    records = [dict(record, temperatureCelcius=20.0 + 0.5 * i) for i, record in enumerate(readings(12))]
+    for i in (4, 9):
+        records[i] = dict(records[i - 1], publishedAt=records[i]["publishedAt"], hasNewReading=False)
+    paths = {"jsonl": str(tmp_path / "data.jsonl"), "binary": str(tmp_path / "data.bin"),
+             "sqlite": str(tmp_path / "data.db")}
+    writers = [BufferedJsonlWriter(paths["jsonl"]), BinaryRecordWriter(paths["binary"]),
+               SqliteRecordWriter(paths["sqlite"])]
+    orderer = IngestOrderer(lambda record: [writer.write(record) for writer in writers])
+    for i, record in enumerate(records):
+        orderer.push(dict(record, received_at=START + 10 * i))
+    orderer.flush()
+    for writer in writers:
+        writer.close()
+    assert orderer.stats()["repeated_readings"] == 2
+
+    values = [record["temperatureCelcius"] for i, record in enumerate(records) if i not in (4, 9)]
+    for telemetry in (TelemetryAnalyzer(paths["jsonl"], compute_stats=False),
+                      TelemetryAnalyzer(paths["jsonl"], compute_stats=False, follow=True),
+                      TelemetryAnalyzer(paths["jsonl"], compute_stats=False, columnar=True),
+                      TelemetryAnalyzer.from_binary(paths["binary"], compute_stats=False, columnar=True),
+                      TelemetryAnalyzer.from_sqlite(paths["sqlite"], compute_stats=False)):
+        assert telemetry.detect_missing_messages("A01") == (0, 0)
+        sensor = telemetry.delivery_report()["sensors"]["A01"]
+        assert (sensor["records"], sensor["missing_messages"]) == (12, 0)
+        row = telemetry.aggregate(["temperatureCelcius"], ["count", "mean"]).rows["A01"]["temperatureCelcius"]
+        assert row == (10, statistics.fmean(values))
+        assert telemetry.sudden_change_detection("A01") == []
+
+    report = run_batch([paths["jsonl"]], 1, options=default_options())["sensors"]["A01"]
+    assert (report["records"], report["missing_messages"], report["sudden_changes"]) == (12, 0, 0)
+    assert report["stats"]["temperatureCelcius"]["count"] == 10
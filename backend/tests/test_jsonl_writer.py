@@ -0,0 +1,39 @@
+import json
+import os
+import time
+
+from jsonl_writer import BufferedJsonlWriter
+
+
+def wait_for_size(path: str, timeout: float) -> int:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        size = os.path.getsize(path)
+        if size:
+            return size
+        time.sleep(0.02)
+    return os.path.getsize(path)
+
+
+def test_single_record_is_flushed_after_max_latency(tmp_path):
+    path = str(tmp_path / "data.jsonl")
+    record = {"sensor_id": "A01", "temperatureCelcius": 23.9, "received_at": 1766807441.159206}
+    with BufferedJsonlWriter(path, max_latency_sec=0.2) as writer:
+        writer.write(record)
+        assert wait_for_size(path, 1.5) > 0
+        with open(path) as file:
+            assert [json.loads(line) for line in file] == [record]
+
+
+def test_record_after_idle_period_is_flushed(tmp_path):
+    path = str(tmp_path / "data.jsonl")
+    with BufferedJsonlWriter(path, max_latency_sec=0.2) as writer:
+        writer.write({"sensor_id": "A01", "received_at": 1.0})
+        assert wait_for_size(path, 1.5) > 0
+        size = os.path.getsize(path)
+        time.sleep(0.3)
+        writer.write({"sensor_id": "B01", "received_at": 2.0})
+        deadline = time.monotonic() + 1.5
+        while os.path.getsize(path) == size and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert os.path.getsize(path) > size
@@ -0,0 +1,58 @@
+import json
+import threading
+
+from dashboard import QueryServerFeed
+from query_server import QueryClient, TelemetryQueryEngine, serve
+
+
+def write_records(path, sensor_ids, count: int, start: float = 1000.0) -> None:
+    with open(path, "a") as file:
+        for i in range(count):
+            for sensor_id in sensor_ids:
+                file.write(json.dumps({"sensor_id": sensor_id, "temperatureCelcius": 20 + i % 10,
+                                       "humidityPercent": 40, "received_at": start + 5 * i}) + "\n")
+
+
+def start_server(path):
+    engine = TelemetryQueryEngine(str(path))
+    server = serve(engine, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return engine, server, QueryClient(f"http://127.0.0.1:{server.server_address[1]}")
+
+
+def test_explicit_zero_parameters_are_not_replaced_by_defaults(tmp_path):
+    path = tmp_path / "data.jsonl"
+    write_records(path, ["A01", "B01"], 30)
+    _, server, client = start_server(path)
+    try:
+        assert all(sensor["entries"] == [] for sensor in client.recent(n=0)["sensors"].values())
+        version = client.recent()["version"]
+        assert set(client.recent(since=0)["sensors"]) == {"A01", "B01"}
+        assert client.recent(since=version)["sensors"] == {}
+        assert list(client.records(page_size=0)) == []
+    finally:
+        server.shutdown()
+
+
+def test_feed_resets_when_a_restarted_server_is_already_past_the_old_version(tmp_path):
+    old, new = tmp_path / "old.jsonl", tmp_path / "new.jsonl"
+    write_records(old, ["A01"], 5)
+    _, server, client = start_server(old)
+    feed = QueryServerFeed(client)
+    try:
+        assert feed.snapshots()["A01"]["last_entry"]["received_at"] == 1020.0
+    finally:
+        server.shutdown()
+
+    # the new server has other A01 data, and a later refresh takes its version past the old server's
+    write_records(new, ["A01"], 10, start=2000.0)
+    engine, server, feed.client = start_server(new)
+    write_records(new, ["B01"], 1, start=3000.0)
+    engine.refresh()
+    try:
+        assert engine.telemetry.version > 1
+        snapshots = feed.snapshots()
+        assert set(snapshots) == {"A01", "B01"}
+        assert snapshots["A01"]["last_entry"]["received_at"] == 2045.0
+    finally:
+        server.shutdown()
@@ -0,0 +1,28 @@
+from rollups import FLUSH_LATENESS_SEC, RollupStore
+
+START = 1_766_800_020.0
+
+
+def test_unflushed_buckets_are_read_raw(tmp_path):
+    directory = str(tmp_path / "rollups")
+    records = [{"sensor_id": "A01", "temperatureCelcius": 20.0 + i % 7, "received_at": START + 10 * i}
+               for i in range(1000)]
+
+    def raw_values(sensor_id, key, lo, hi):
+        return [(record["received_at"], record[key]) for record in records if lo <= record["received_at"] < hi]
+
+    store = RollupStore(directory, flush_interval_sec=float("inf"))
+    for record in records:
+        store.add(record)
+    # nothing saved yet: another reader (and this store) has to take everything from the raw entries
+    for reader in (RollupStore(directory), store):
+        covered, _ = reader.plan(START, START + 10_000)
+        assert covered == []
+        assert reader.query("A01", "temperatureCelcius", START, START + 10_000, raw_values).count == 1000
+
+    store.flush()
+    reader = RollupStore(directory)
+    covered, raw = reader.plan(START, START + 10_000)
+    assert covered
+    assert max(hi for _, _, hi in covered) <= START + 10 * 999 - FLUSH_LATENESS_SEC
+    assert reader.query("A01", "temperatureCelcius", START, START + 10_000, raw_values).count == 1000
@@ -0,0 +1,121 @@
+import os
+import threading
+import time
+
+import segment_store
+from segment_store import CLOSING_SUFFIX, SegmentWriter, list_segments, read_segment_entries
+
+HOUR = 3600.0
+START = 1_766_800_800.0  # on an hour boundary
+
+
+def records(start: float, count: int, sensor_id: str = "A01") -> list[dict]:
+    return [{"sensor_id": sensor_id, "temperatureCelcius": 20 + i % 10, "received_at": start + 5 * i}
+            for i in range(count)]
+
+
+def closing_files(directory: str) -> list[str]:
+    return [name for _, _, files in os.walk(directory) for name in files if CLOSING_SUFFIX in name]
+
+
+def received(directory: str) -> list[float]:
+    return sorted(entry["received_at"] for entry in read_segment_entries(directory))
+
+
+def test_late_records_are_archived_once(tmp_path):
+    directory = str(tmp_path)
+    first, late, second = records(START, 20), records(START + 200, 5), records(START + HOUR + 120, 10)
+    writer = SegmentWriter(directory, close_grace_sec=60)
+    for record in first + second + late + records(START + 2 * HOUR + 120, 1):
+        writer.write(record)
+    writer.close()
+    expected = sorted(record["received_at"] for record in first + second + late) + [START + 2 * HOUR + 120]
+    assert received(directory) == expected
+    assert closing_files(directory) == []
+
+
+def test_crash_before_manifest_commit_reads_once_and_recovers(tmp_path, monkeypatch):
+    directory = str(tmp_path)
+    writer = SegmentWriter(directory, close_grace_sec=60)
+    for record in records(START, 20):
+        writer.write(record)
+    writer.close()
+
+    # a late record reopens the hour; its archive step swaps in the new archive, then "crashes" before the commit
+    def crash(*args):
+        raise OSError("crash")
+
+    writer = SegmentWriter(directory, close_grace_sec=60)
+    writer.write(records(START + 300, 1)[0])
+    monkeypatch.setattr(writer.manifest, "merge", crash)
+    writer.close()
+    assert len(closing_files(directory)) == 1
+    expected = sorted([record["received_at"] for record in records(START, 20)] + [START + 300])
+    assert received(directory) == expected
+
+    monkeypatch.undo()
+    SegmentWriter(directory).close()
+    assert closing_files(directory) == []
+    assert received(directory) == expected
+
+
+def test_crash_before_closing_file_removed(tmp_path, monkeypatch):
+    directory = str(tmp_path)
+    writer = SegmentWriter(directory, close_grace_sec=60)
+    monkeypatch.setattr(segment_store.os, "remove", lambda path: None)
+    for record in records(START, 20):
+        writer.write(record)
+    writer.close()
+    monkeypatch.undo()
+    assert len(closing_files(directory)) == 1
+    assert len(received(directory)) == 20
+
+    SegmentWriter(directory).close()
+    assert closing_files(directory) == []
+    assert len(received(directory)) == 20
+
+
+def test_segments_left_open_by_a_crash_are_archived_and_expire(tmp_path):
+    directory = str(tmp_path)
+    # a grace period long enough that the crashed writer never closes (archives) anything itself
+    crashed = SegmentWriter(directory, close_grace_sec=10 * HOUR)
+    for record in records(START, 20) + records(START + HOUR, 20):
+        crashed.write(record)
+    for segment in list(crashed._open.values()):
+        segment.writer.flush()
+
+    writer = SegmentWriter(directory, retention_sec=HOUR, close_grace_sec=60)
+    writer.close()
+    assert all(path.endswith(".gz") for path, _ in list_segments(directory))
+    assert len(received(directory)) == 40
+
+    writer = SegmentWriter(directory, retention_sec=HOUR, close_grace_sec=60)
+    writer.write(records(START + 2 * HOUR + 100, 1)[0])
+    writer.close()
+    assert received(directory) == sorted(r["received_at"] for r in records(START + HOUR, 20)) + [START + 2 * HOUR + 100]
+
+
+def test_closing_a_segment_does_not_block_other_writers(tmp_path):
+    directory = str(tmp_path)
+    writer = SegmentWriter(directory, per_sensor=True, close_grace_sec=60)
+    for record in records(START, 20) + records(START, 20, "B01"):
+        writer.write(record)
+
+    # A01's next record closes both of the first hour's segments; B01's close is stuck in its fsync meanwhile
+    release = threading.Event()
+    segment = writer._open[(START, "B01")]
+    close = segment.writer.close
+    segment.writer.close = lambda: (release.wait(), close())
+    closer = threading.Thread(target=writer.write, args=(records(START + HOUR + 120, 1)[0],))
+    closer.start()
+    while segment not in writer._closing:
+        time.sleep(0.001)
+    other = threading.Thread(target=writer.write, args=(records(START + HOUR + 125, 1, "B01")[0],))
+    other.start()
+    other.join(timeout=5)
+    assert not other.is_alive()
+    release.set()
+    closer.join()
+    writer.close()
+    assert len(received(directory)) == 42
+    assert closing_files(directory) == []
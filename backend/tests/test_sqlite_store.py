@@ -0,0 +1,31 @@
+from sqlite_store import import_jsonl
+from telemetry_analyzer import TelemetryAnalyzer
+
+STATS = ("count", "min", "max", "mean", "sum")
+
+
+def test_pushed_down_aggregates_match_the_jsonl_analyzer(tmp_path):
+    path = tmp_path / "data.jsonl"
+    # 0.1 steps do not add up exactly in floating point: a naive SQL sum drifts in the last digits
+    with open(path, "w") as file:
+        for i in range(2000):
+            sensor_id = ("A01", "B01")[i % 2]
+            file.write(f'{{"sensor_id": "{sensor_id}", "temperatureCelcius": {20 + (i % 97) / 10}, '
+                       f'"humidityPercent": {40 + i % 7}, "sampledAt": {2000 * i}, "received_at": {1000.0 + 5 * i}}}\n')
+    database = str(tmp_path / "telemetry.db")
+    import_jsonl([str(path)], database)
+
+    keys = ("temperatureCelcius", "humidityPercent", "sampledAt")
+    from_jsonl = TelemetryAnalyzer(str(path), compute_stats=False)
+    from_sqlite = TelemetryAnalyzer.from_sqlite(database, compute_stats=False)
+    assert from_sqlite.entries == from_jsonl.entries
+    assert (from_sqlite.aggregate(keys, STATS, include_overall=True).to_dict()
+            == from_jsonl.aggregate(keys, STATS, include_overall=True).to_dict())
+
+    ranged = TelemetryAnalyzer.from_sqlite(database, sensor_ids=["A01"], start=2000.0, end=6000.0,
+                                           compute_stats=False)
+    expected = [entry for entry in from_jsonl.entries
+                if entry["sensor_id"] == "A01" and 2000.0 <= entry["received_at"] < 6000.0]
+    assert ranged.entries == expected
+    assert (ranged.aggregate(keys, STATS).to_dict()
+            == TelemetryAnalyzer("", entries=expected, compute_stats=False).aggregate(keys, STATS).to_dict())